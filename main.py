@@ -1,8 +1,9 @@
+import os
 import sys
 import logging
 import argparse
 import pandas as pd
-import reporting.export as exp
+import reporting.utils as utl
 import reporting.analyze as az
 import reporting.tbapi as tbapi
 import reporting.vmcolumns as vmc
@@ -62,6 +63,14 @@ def get_args(arguments=None):
     parser.add_argument('--tab', action='store_true')
     parser.add_argument('--basic', action='store_true')
     parser.add_argument('--nolog', action='store_true')
+    parser.add_argument(
+        '--parallel', action='store_true',
+        help='Pull API keys concurrently.  A key past the API timeout is '
+             'abandoned, but only APIs that check for cancellation (FB) '
+             'stop early; others keep running until they finish.')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--incremental', action='store_true')
+    parser.add_argument('--clearcache', action='store_true')
     if arguments:
         args, unknown = parser.parse_known_args(arguments.split())
     else:
@@ -80,15 +89,20 @@ def main(arguments=None):
         vm.vm_update()
     if args.update == 'all' or args.update == 'dct':
         dct.dict_update()
+    if args.clearcache:
+        utl.clear_cache()
+    processes = None
+    if args.parallel:
+        processes = args.workers if args.workers else os.cpu_count()
     df = pd.DataFrame()
     matrix = vm.VendorMatrix()
     if args.analyze:
         aly = az.Analyze(df=df, file_name=OUTPUT_FILE, matrix=matrix)
         aly.do_analysis_and_fix_processor(pre_run=True)
-        matrix = vm.VendorMatrix()
+        matrix = aly.matrix
     if args.api:
         api = ih.ImportHandler(args.api, matrix)
-        api.api_loop()
+        api.api_loop(concurrent=args.parallel)
     if args.ftp:
         ftp = ih.ImportHandler(args.ftp, matrix)
         ftp.ftp_loop()
@@ -105,17 +119,20 @@ def main(arguments=None):
         if args.analyze:
             aly = az.Analyze(df=df, file_name=OUTPUT_FILE, matrix=matrix)
             aly.do_analysis_and_fix_processor(new_files=True)
-            matrix = vm.VendorMatrix()
-        df = matrix.vm_loop_with_costs(OUTPUT_FILE)
+            matrix = aly.matrix
+        df = matrix.vm_loop_with_costs(OUTPUT_FILE, processes,
+                                       args.incremental)
         if args.analyze:
             logging.info('Post run - analyzing data.')
             aly = az.Analyze(df=df, file_name=OUTPUT_FILE, matrix=matrix)
             fixes_to_run = aly.do_analysis_and_fix_processor(first_run=True)
             if fixes_to_run:
                 logging.info('Fixes applied, rerunning processor.')
-                matrix = vm.VendorMatrix()
-                df = matrix.vm_loop_with_costs(OUTPUT_FILE)
+                matrix = aly.matrix
+                df = matrix.vm_loop_with_costs(
+                    OUTPUT_FILE, processes, args.incremental)
     if args.exp:
+        import reporting.export as exp
         exp_class = exp.ExportHandler()
         if exp_class.config_loaded:
             exp_class.export_loop(args.exp)
@@ -124,7 +141,7 @@ def main(arguments=None):
         tb.refresh_extract()
     if args.analyze:
         aly = az.Analyze(df=df, file_name=OUTPUT_FILE, matrix=matrix)
-        aly.do_all_analysis()
+        aly.do_all_analysis(workers=args.workers)
 
 
 if __name__ == '__main__':
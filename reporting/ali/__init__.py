@@ -1 +1,2 @@
 from reporting.ali.search import AliSearch
+from reporting.ali.word_index import WordIndexStore
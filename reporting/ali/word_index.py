@@ -0,0 +1,278 @@
+"""Persistent word index for ALI.
+
+Stores the posting lists AliChat.index_db_model_by_word builds from
+model names in a SQLite file, so every worker process and every cold
+start reuses one index instead of re-tokenizing whole tables.  Each
+index is keyed by model name and split-underscore flag and keeps:
+
+- the object ids indexed (to find creates and deletes by id)
+- the words of each object id (the posting lists)
+- the count and highest of those ids, so a sync can probe a model for
+  creates and deletes without reading every id
+- an updated-at watermark, so only rows changed since the last sync
+  are re-tokenized
+- a version bumped on every write that changes the postings, so a
+  process holding the index in memory knows when another process
+  changed it
+
+This module works only with data passed to it — the caller decides
+which rows changed and how names are tokenized.
+"""
+import os
+import time
+import sqlite3
+import datetime as dt
+from contextlib import contextmanager
+from collections import namedtuple
+
+WordIndexState = namedtuple(
+    'WordIndexState', ['watermark', 'built_at', 'version', 'count',
+                       'max_id'])
+
+# Bump when SCHEMA changes; the index is a cache, so a file written
+# with another version is dropped and rebuilt.
+SCHEMA_VERSION = 2
+
+DROP_SCHEMA = """
+DROP TABLE IF EXISTS word_index_state;
+DROP TABLE IF EXISTS word_index_docs;
+DROP TABLE IF EXISTS word_index_postings;
+"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS word_index_state (
+    model TEXT NOT NULL,
+    split INTEGER NOT NULL,
+    watermark TEXT,
+    built_at REAL NOT NULL,
+    version INTEGER NOT NULL,
+    doc_count INTEGER NOT NULL DEFAULT 0,
+    max_id INTEGER,
+    PRIMARY KEY (model, split)
+);
+CREATE TABLE IF NOT EXISTS word_index_docs (
+    model TEXT NOT NULL,
+    split INTEGER NOT NULL,
+    object_id INTEGER NOT NULL,
+    PRIMARY KEY (model, split, object_id)
+);
+CREATE TABLE IF NOT EXISTS word_index_postings (
+    model TEXT NOT NULL,
+    split INTEGER NOT NULL,
+    word TEXT NOT NULL,
+    object_id INTEGER NOT NULL,
+    PRIMARY KEY (model, split, word, object_id)
+);
+CREATE INDEX IF NOT EXISTS word_index_postings_object
+    ON word_index_postings (model, split, object_id);
+"""
+
+
+class WordIndexStore:
+    """On-disk posting lists per model, shared across processes."""
+    timeout = 30
+    chunk_size = 500
+
+    def __init__(self, path):
+        """
+        :param path: SQLite file to hold the index, created if missing.
+        """
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        with self.connection() as conn:
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            if version != SCHEMA_VERSION:
+                conn.executescript(DROP_SCHEMA)
+            conn.executescript(SCHEMA)
+            conn.execute('PRAGMA user_version = {}'.format(SCHEMA_VERSION))
+
+    def connect(self):
+        """Open a new connection; one per call keeps the store safe to
+        share between threads.
+
+        :returns: sqlite3 connection
+        """
+        conn = sqlite3.connect(self.path, timeout=self.timeout)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Yield a connection that commits on success and always closes.
+
+        :returns: Generator yielding a sqlite3 connection
+        """
+        conn = self.connect()
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def format_watermark(watermark):
+        if watermark is None:
+            return None
+        if isinstance(watermark, (dt.datetime, dt.date)):
+            return watermark.isoformat()
+        return str(watermark)
+
+    @staticmethod
+    def parse_watermark(watermark):
+        if watermark is None:
+            return None
+        try:
+            return dt.datetime.fromisoformat(watermark)
+        except ValueError:
+            return watermark
+
+    def get_state(self, model, split_underscore=False):
+        """Read the sync state of one index.
+
+        :param model: Model name the index is for.
+        :param split_underscore: Whether names were split on underscores.
+        :returns: WordIndexState, or None if never built.
+        """
+        with self.connection() as conn:
+            row = conn.execute(
+                'SELECT watermark, built_at, version, doc_count, max_id '
+                'FROM word_index_state WHERE model = ? AND split = ?',
+                (model, int(split_underscore))).fetchone()
+        if not row:
+            return None
+        return WordIndexState(self.parse_watermark(row[0]), *row[1:])
+
+    def get_ids(self, model, split_underscore=False):
+        """
+        :param model: Model name the index is for.
+        :param split_underscore: Whether names were split on underscores.
+        :returns: Set of object ids in the index.
+        """
+        with self.connection() as conn:
+            rows = conn.execute(
+                'SELECT object_id FROM word_index_docs '
+                'WHERE model = ? AND split = ?',
+                (model, int(split_underscore))).fetchall()
+        return {x[0] for x in rows}
+
+    def get_docs(self, model, split_underscore, object_ids):
+        """Read the stored words of some object ids.
+
+        :param model: Model name the index is for.
+        :param split_underscore: Whether names were split on underscores.
+        :param object_ids: Object ids to read.
+        :returns: Dict of object id to set of words, for ids in the index.
+        """
+        key = (model, int(split_underscore))
+        object_ids = list(object_ids)
+        docs = {}
+        with self.connection() as conn:
+            for i in range(0, len(object_ids), self.chunk_size):
+                chunk = tuple(object_ids[i:i + self.chunk_size])
+                where = ('WHERE model = ? AND split = ? AND object_id IN '
+                         '({})'.format(', '.join('?' * len(chunk))))
+                for (object_id,) in conn.execute(
+                        'SELECT object_id FROM word_index_docs ' + where,
+                        key + chunk):
+                    docs[object_id] = set()
+                for word, object_id in conn.execute(
+                        'SELECT word, object_id FROM word_index_postings ' +
+                        where, key + chunk):
+                    docs[object_id].add(word)
+        return docs
+
+    def load(self, model, split_underscore=False):
+        """Read an index as AliChat uses it in memory.
+
+        :param model: Model name the index is for.
+        :param split_underscore: Whether names were split on underscores.
+        :returns: Dict of word to list of object ids, ids ascending.
+        """
+        word_idx = {}
+        with self.connection() as conn:
+            rows = conn.execute(
+                'SELECT word, object_id FROM word_index_postings '
+                'WHERE model = ? AND split = ? ORDER BY object_id',
+                (model, int(split_underscore)))
+            for word, object_id in rows:
+                if word in word_idx:
+                    word_idx[word].append(object_id)
+                else:
+                    word_idx[word] = [object_id]
+        return word_idx
+
+    def update(self, model, split_underscore, docs, deleted_ids=(),
+               watermark=None, full=False):
+        """Write re-tokenized rows and drop deleted ones in one
+        transaction.  The index version is bumped when postings change,
+        so a write that only moves the watermark keeps loaded copies.
+
+        :param model: Model name the index is for.
+        :param split_underscore: Whether names were split on underscores.
+        :param docs: Dict of object id to list of unique words.
+        :param deleted_ids: Object ids no longer in the model.
+        :param watermark: Latest updated-at value seen, None if unknown.
+        :param full: When True docs replace the whole index.
+        :returns: The new version.
+        """
+        key = (model, int(split_underscore))
+        conn = self.connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            state = conn.execute(
+                'SELECT built_at, version FROM word_index_state '
+                'WHERE model = ? AND split = ?', key).fetchone()
+            version = state[1] if state else 0
+            if full or docs or deleted_ids or not state:
+                version += 1
+            built_at = time.time() if full or not state else state[0]
+            if full:
+                for table in ['word_index_docs', 'word_index_postings']:
+                    conn.execute('DELETE FROM {} WHERE model = ? '
+                                 'AND split = ?'.format(table), key)
+            else:
+                stale = [(x,) for x in set(docs) | set(deleted_ids)]
+                for table in ['word_index_docs', 'word_index_postings']:
+                    conn.executemany(
+                        'DELETE FROM {} WHERE model = ? AND split = ? '
+                        'AND object_id = ?'.format(table),
+                        [key + x for x in stale])
+            conn.executemany(
+                'INSERT INTO word_index_docs VALUES (?, ?, ?)',
+                [key + (x,) for x in docs])
+            conn.executemany(
+                'INSERT INTO word_index_postings VALUES (?, ?, ?, ?)',
+                [key + (word, object_id) for object_id, words in docs.items()
+                 for word in words])
+            count, max_id = conn.execute(
+                'SELECT COUNT(*), MAX(object_id) FROM word_index_docs '
+                'WHERE model = ? AND split = ?', key).fetchone()
+            conn.execute(
+                'INSERT OR REPLACE INTO word_index_state VALUES '
+                '(?, ?, ?, ?, ?, ?, ?)',
+                key + (self.format_watermark(watermark), built_at, version,
+                       count, max_id))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        return version
+
+    def expire(self, models=None):
+        """Force the next sync of these indexes to rebuild in full.
+
+        :param models: Model names to expire, None for every index.
+        :returns: None
+        """
+        with self.connection() as conn:
+            if models is None:
+                conn.execute('UPDATE word_index_state SET built_at = 0')
+            else:
+                conn.executemany(
+                    'UPDATE word_index_state SET built_at = 0 '
+                    'WHERE model = ?', [(x,) for x in models])
+        return None
@@ -3,11 +3,8 @@ import re
 import json
 import time
 import zipfile
-
-import yaml
-import nltk
+import threading
 import random
-import openai
 import shutil
 import logging
 import operator
@@ -15,17 +12,18 @@ import tarfile
 import requests
 import numpy as np
 import pandas as pd
-import seaborn as sns
 import datetime as dt
 import reporting.calc as cal
-import reporting.awapi as aw
 import reporting.utils as utl
 import reporting.vmcolumns as vmc
 import reporting.dictionary as dct
 import reporting.vendormatrix as vm
 import reporting.dictcolumns as dctc
 import xml.etree.ElementTree as et
+import sqlalchemy as sqa
+import concurrent.futures as cf
 from .ali.search import AliSearch
+from .ali.word_index import WordIndexStore
 from .ali import ticket_intent as ali_tic
 from .ali import codebase as ali_code
 
@@ -75,6 +73,11 @@ class Analyze(object):
     brandtracker_imports = 'brandtracker_imports'
     check_live = 'check_live'
     analysis_dict_file_name = 'analysis_dict.json'
+    analysis_timing_file_name = 'analysis_timing.json'
+    analysis_workers = 4
+    df_resource = 'output_df'
+    raw_resource = 'raw_files'
+    vm_resource = 'vendor_matrix'
     analysis_dict_key_col = 'key'
     analysis_dict_data_col = 'data'
     analysis_dict_msg_col = 'message'
@@ -104,6 +107,10 @@ class Analyze(object):
                  transformer=None, transformer_dict=None,
                  write_authority=None):
         self.analysis_dict = []
+        self.analysis_timing = []
+        self.check_local = threading.local()
+        self.raw_profiles = {}
+        self.raw_profile_lock = threading.Lock()
         self.df = df
         self.file_name = file_name
         self.matrix = matrix
@@ -163,7 +170,8 @@ class Analyze(object):
         base_dict[self.analysis_dict_filter_col] = str(filter_col)
         base_dict[self.analysis_dict_filter_val] = str(filter_val)
         base_dict[self.analysis_dict_data_col] = data
-        self.analysis_dict.append(base_dict)
+        buffer = getattr(self.check_local, 'buffer', self.analysis_dict)
+        buffer.append(base_dict)
 
     def check_delivery(self, df):
         plan_names = self.matrix.vendor_set(vm.plan_key)
@@ -207,7 +215,7 @@ class Analyze(object):
         return True
 
     @staticmethod
-    def get_start_end_dates(df, plan_names):
+    def get_start_end_dates(df, plan_names, matrix=None):
         """
         Gets start and end dates at the level of the planned net full placement
         name. Dates taken from mediaplan where available, else from
@@ -215,9 +223,12 @@ class Analyze(object):
 
         :param df: full output df
         :param plan_names: planned net full placement columns
+        :param matrix: vendormatrix to take dates from, read if None
         :returns: two dfs w/ start and end dates for each unique breakout
         """
-        matrix = vm.VendorMatrix().vm_df
+        if matrix is None:
+            matrix = vm.VendorMatrix()
+        matrix = matrix.vm_df
         matrix = matrix[[vmc.vendorkey, vmc.startdate, vmc.enddate]]
         matrix = matrix.rename(columns={vmc.startdate: dctc.SD,
                                         vmc.enddate: dctc.ED})
@@ -336,6 +347,7 @@ class Analyze(object):
     # noinspection PyUnresolvedReferences
     @staticmethod
     def make_heat_map(df, cost_cols=None):
+        import seaborn as sns
         fig, axs = sns.plt.subplots(ncols=len(df.columns),
                                     gridspec_kw={'hspace': 0, 'wspace': 0})
         for idx, col in enumerate(df.columns):
@@ -943,6 +955,50 @@ class Analyze(object):
                 missing_sheets.append(sheet_name)
         return missing_sheets
 
+    def get_raw_profile(self, source):
+        """
+        Returns the shared raw file profile for a data source, so checks
+        reading the same raw file read it once.  A profile is rebuilt when
+        its file changes on disk.
+
+        :param source: Data source object from the VM
+        :return: RawFileProfile for the source's raw file
+        """
+        file_name = source.p[vmc.filename]
+        path = file_name.split(utl.sheet_name_splitter)[0]
+        try:
+            stat = os.stat(path)
+            stamp = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            stamp = None
+        with self.raw_profile_lock:
+            old_stamp, profile = self.raw_profiles.get(file_name, (None, None))
+            if not profile or old_stamp != stamp:
+                head_rows = max(RawFileProfile.head_rows,
+                                int(source.p[vmc.firstrow]) +
+                                RawFileProfile.head_padding)
+                profile = RawFileProfile(file_name, head_rows)
+                self.raw_profiles[file_name] = (stamp, profile)
+        return profile
+
+    def clear_raw_profiles(self, file_names=None, wait_for=None):
+        """
+        Drops shared raw file profiles so the full reads they hold can be
+        freed once no check needs them.
+
+        :param file_names: Raw file names to drop, None drops all of them
+        :param wait_for: List of futures of checks to wait on first
+        :return: None
+        """
+        if wait_for:
+            cf.wait(wait_for)
+        with self.raw_profile_lock:
+            if file_names is None:
+                self.raw_profiles = {}
+            else:
+                for file_name in file_names:
+                    self.raw_profiles.pop(file_name, None)
+
     def compare_raw_files(self, vk, ds):
         """
         Compare key values for the old and new raw files for a given vendor key
@@ -965,7 +1021,7 @@ class Analyze(object):
         cd, clean_functions, c_cols = self.get_base_raw_file_dict(ds)
         for cds_name, cds in {'Old': ds, 'New': tds}.items():
             try:
-                find_blank = CheckFirstRow(Analyze())
+                find_blank = CheckFirstRow(self)
                 first_row = find_blank.find_first_row(cds)
                 if not first_row.empty:
                     first_row = first_row.iloc[0][find_blank.new_first_line]
@@ -974,14 +1030,14 @@ class Analyze(object):
                     first_row = cds.p[vmc.firstrow]
                 cd[find_blank.new_first_line][cds_name] = (
                     True, '{}'.format(first_row))
-                find_total = CheckLastRow(Analyze())
+                find_total = CheckLastRow(self)
                 last_row = find_total.find_last_row(cds)
                 if not last_row.empty:
                     last_row = last_row.iloc[0][find_total.new_last_line]
                     cds.p[vmc.lastrow] = last_row
                 else:
                     last_row = cds.p[vmc.lastrow]
-                df = cds.get_raw_df()
+                df = self.get_raw_profile(cds).get_raw_df(cds)
             except Exception as e:
                 logging.warning('Unknown exception: {}'.format(e))
                 if cds_name == 'New':
@@ -1002,6 +1058,8 @@ class Analyze(object):
                     False,
                     '{} file could not be loaded.  {}'.format(cds_name, msg))
                 continue
+            finally:
+                self.clear_raw_profiles([cds.p[vmc.filename]])
             cd['file_load'][cds_name] = (True, 'File was successfully read.')
             for col in [vmc.fullplacename, vmc.placement, vmc.date] + c_cols:
                 cols_to_check = ds.p[col]
@@ -1104,7 +1162,7 @@ class Analyze(object):
                               split_col=None, filter_col=None, filter_val=None,
                               analysis_dict=None):
         if not analysis_dict:
-            analysis_dict = self.analysis_dict
+            analysis_dict = self.get_visible_analysis_dict()
         item = [x for x in analysis_dict
                 if x[self.analysis_dict_key_col] == key]
         if param:
@@ -1123,11 +1181,132 @@ class Analyze(object):
                     x[self.analysis_dict_filter_val] == filter_val]
         return item
 
+    def get_visible_analysis_dict(self):
+        """
+        Returns the analysis dict seen by the current thread.  A check run
+        by run_analysis_classes sees the pre-run analysis, the results of
+        the checks it depends on and its own results so far.
+
+        :return: List of analysis dict entries
+        """
+        sources = getattr(self.check_local, 'sources', None)
+        if sources is None:
+            return self.analysis_dict
+        return [x for source in sources for x in source]
+
     def write_analysis_dict(self):
         with open(self.analysis_dict_file_name, 'w') as fp:
             json.dump(self.analysis_dict, fp, default=str)
 
-    def do_all_analysis(self):
+    def write_analysis_timing(self):
+        with open(self.analysis_timing_file_name, 'w') as fp:
+            json.dump(self.analysis_timing, fp, default=str)
+
+    @staticmethod
+    def get_check_dependencies(analysis_class, class_list):
+        """
+        Returns the checks in class_list that analysis_class depends on,
+        directly or through another dependency.
+
+        :param analysis_class: AnalyzeBase subclass to get dependencies of
+        :param class_list: List of AnalyzeBase subclasses being run
+        :return: List of AnalyzeBase subclasses in class_list order
+        """
+        deps = set()
+        pending = list(analysis_class.depends_on)
+        while pending:
+            dep = pending.pop()
+            if dep not in deps:
+                deps.add(dep)
+                pending.extend(dep.depends_on)
+        return [x for x in class_list if x in deps]
+
+    @staticmethod
+    def checks_conflict(first_class, second_class):
+        """
+        Two checks conflict when either writes something the other reads or
+        writes, so they must run in class_list order.
+
+        :param first_class: AnalyzeBase subclass
+        :param second_class: AnalyzeBase subclass
+        :return: Boolean true if the checks cannot run at the same time
+        """
+        first_uses = set(first_class.reads) | set(first_class.writes)
+        second_uses = set(second_class.reads) | set(second_class.writes)
+        return bool(set(first_class.writes) & second_uses or
+                    set(second_class.writes) & first_uses)
+
+    def run_analysis_class(self, analysis_class, buffers, wait_for):
+        """
+        Runs one check once the checks it waits on finish, with its results
+        going to its own buffer rather than the shared analysis dict.
+
+        :param analysis_class: AnalyzeBase subclass to run
+        :param buffers: Dictionary of AnalyzeBase subclass to result list
+        :param wait_for: List of futures of earlier checks to wait on
+        :return: Dictionary of timing for the check
+        """
+        cf.wait(wait_for)
+        deps = self.get_check_dependencies(analysis_class, list(buffers))
+        self.check_local.buffer = buffers[analysis_class]
+        self.check_local.sources = ([self.analysis_dict] +
+                                    [buffers[x] for x in deps] +
+                                    [buffers[analysis_class]])
+        start_time = time.time()
+        try:
+            analysis_class(self).do_analysis()
+        finally:
+            del self.check_local.buffer
+            del self.check_local.sources
+        return {'check': analysis_class.__name__,
+                self.analysis_dict_key_col: analysis_class.name,
+                'start': start_time,
+                'seconds': round(time.time() - start_time, 4),
+                'thread': threading.current_thread().name}
+
+    def run_analysis_classes(self, class_list=None, workers=None):
+        """
+        Runs checks in a thread pool.  A check waits for the checks in its
+        depends_on and for any earlier check it conflicts with, otherwise
+        checks run at the same time.  Results are merged into the analysis
+        dict in class_list order so output matches a sequential run, and
+        per check timing is kept in analysis_timing.  Raw file profiles are
+        dropped once every check reading raw files has finished.
+
+        :param class_list: List of AnalyzeBase subclasses, defaults to all
+        :param workers: Max checks run at once, defaults to analysis_workers
+        :return: None
+        """
+        class_list = class_list if class_list else self.class_list
+        workers = workers if workers else self.analysis_workers
+        buffers = {x: [] for x in class_list}
+        futures = {}
+        raw_futures = []
+        start_time = time.time()
+        with cf.ThreadPoolExecutor(max_workers=workers,
+                                   thread_name_prefix='analyze') as executor:
+            for analysis_class in class_list:
+                deps = self.get_check_dependencies(analysis_class, class_list)
+                wait_for = [
+                    future for earlier, future in futures.items()
+                    if earlier in deps or
+                    self.checks_conflict(earlier, analysis_class)]
+                futures[analysis_class] = executor.submit(
+                    self.run_analysis_class, analysis_class, buffers,
+                    wait_for)
+                if self.raw_resource in analysis_class.reads:
+                    raw_futures.append(futures[analysis_class])
+            if raw_futures:
+                executor.submit(self.clear_raw_profiles, wait_for=raw_futures)
+        for analysis_class in class_list:
+            timing = futures[analysis_class].result()
+            timing['start'] = round(timing['start'] - start_time, 4)
+            self.analysis_timing.append(timing)
+            self.analysis_dict.extend(buffers[analysis_class])
+        logging.info('Ran {} checks in {:.2f}s with {} workers.'.format(
+            len(class_list), time.time() - start_time, workers))
+
+    def do_all_analysis(self, workers=None):
         self.backup_files()
         self.check_delivery(self.df)
         self.check_plan_error(self.df)
@@ -1138,9 +1317,9 @@ class Analyze(object):
         self.flag_errant_metrics()
         self.find_missing_serving()
         self.find_missing_ad_rate()
-        for analysis_class in self.class_list:
-            analysis_class(self).do_analysis()
+        self.run_analysis_classes(workers=workers)
         self.write_analysis_dict()
+        self.write_analysis_timing()
 
     def load_old_raw_file_dict(self, new, cu):
         old = None
@@ -1185,17 +1364,21 @@ class Analyze(object):
             new_file_check = self.get_new_files()
         kwargs = {'only_new_files': new_files,
                   'new_file_list': new_file_check}
-        for analysis_class in self.class_list:
-            if analysis_class.fix:
-                is_pre_run = pre_run and analysis_class.pre_run
-                is_new_file = new_files and analysis_class.new_files
-                is_all_files = analysis_class.all_files
-                if new_files and is_all_files:
-                    kwargs['only_new_files'] = False
-                    kwargs['new_file_list'] = []
-                if is_pre_run or first_run or is_new_file:
-                    analysis_class(self).do_and_fix_analysis(**kwargs)
-                    self.matrix = vm.VendorMatrix(display_log=False)
+        if self.matrix is None:
+            self.matrix = vm.VendorMatrix(display_log=False)
+        with self.matrix.deferred_write():
+            for analysis_class in self.class_list:
+                if analysis_class.fix:
+                    is_pre_run = pre_run and analysis_class.pre_run
+                    is_new_file = new_files and analysis_class.new_files
+                    is_all_files = analysis_class.all_files
+                    if new_files and is_all_files:
+                        kwargs['only_new_files'] = False
+                        kwargs['new_file_list'] = []
+                    if is_pre_run or first_run or is_new_file:
+                        analysis_class(self).do_and_fix_analysis(**kwargs)
+                        self.matrix.refresh()
+        self.clear_raw_profiles()
         return self.fixes_to_run
 
 
@@ -1205,6 +1388,9 @@ class AnalyzeBase(object):
     pre_run = False
     new_files = False
     all_files = False
+    reads = (Analyze.df_resource, Analyze.raw_resource, Analyze.vm_resource)
+    writes = ()
+    depends_on = ()
 
     def __init__(self, analyze_class=None):
         self.aly = analyze_class
@@ -1243,6 +1429,7 @@ class CheckAutoDictOrder(AnalyzeBase):
     name = Analyze.change_auto_order
     fix = True
     new_files = True
+    reads = (Analyze.raw_resource, Analyze.vm_resource)
 
     @staticmethod
     def get_vendor_list(col=dctc.VEN):
@@ -1407,12 +1594,72 @@ class CheckAutoDictOrder(AnalyzeBase):
         return self.aly.matrix.vm_df
 
 
+class RawFileProfile(object):
+    """
+    Holds the reads of one raw file shared by the raw file checks.  The
+    head of the file is read once for the checks that only need the first
+    rows and the full file is read once for those that need all of it.
+    Once the full file is read the head is taken from it.
+    """
+    head_rows = 10
+    head_padding = 5
+
+    def __init__(self, file_name, head_rows=head_rows):
+        self.file_name = file_name
+        self.head_rows = head_rows
+        self.head_df = None
+        self.full_df = None
+        self.reads = 0
+        self.lock = threading.Lock()
+
+    def read(self, nrows=None):
+        df = utl.import_read_csv(self.file_name, nrows=nrows)
+        self.reads += 1
+        if df is None:
+            df = pd.DataFrame()
+        return df
+
+    def get_df(self, nrows=None):
+        """
+        Returns a copy of the raw file as read, before any VM adjustments.
+
+        :param nrows: Number of rows to return, all rows when None
+        :return: Dataframe of the raw file
+        """
+        with self.lock:
+            if self.full_df is not None:
+                df = self.full_df
+            elif nrows is not None and nrows <= self.head_rows:
+                if self.head_df is None:
+                    self.head_df = self.read(nrows=self.head_rows)
+                df = self.head_df
+            else:
+                self.full_df = self.read()
+                self.head_df = None
+                df = self.full_df
+        if nrows is not None:
+            df = df.head(nrows)
+        return df.copy()
+
+    def get_raw_df(self, source, nrows=None):
+        """
+        Returns the raw df of a data source as DataSource.get_raw_df would,
+        built from the shared read of the file.
+
+        :param source: Data source object from the VM
+        :param nrows: Number of rows to read, all rows when None
+        :return: Dataframe of the raw file with VM adjustments applied
+        """
+        return source.get_raw_df(raw_df=self.get_df(nrows=nrows))
+
+
 class CheckFirstRow(AnalyzeBase):
     name = Analyze.blank_lines
     fix = True
     new_files = True
     all_files = True
     new_first_line = 'new_first_line'
+    reads = (Analyze.raw_resource, Analyze.vm_resource)
 
     def find_first_row(self, source, l_df=pd.DataFrame()):
         """
@@ -1428,13 +1675,13 @@ class CheckFirstRow(AnalyzeBase):
         """
         if vmc.filename not in source.p or vm.plan_key in source.key:
             return l_df
-        raw_file = source.p[vmc.filename]
         place_cols = source.p[dctc.FPN]
         place_cols = [s.strip('::') if s.startswith('::')
                       else s for s in place_cols]
         old_first_row = int(source.p[vmc.firstrow])
-        df = utl.import_read_csv(raw_file, nrows=10)
-        if df is None or df.empty:
+        df = self.aly.get_raw_profile(source).get_df(
+            nrows=RawFileProfile.head_rows)
+        if df.empty:
             return l_df
         new_first_row = None
         for idx in range(len(df)):
@@ -1499,7 +1746,7 @@ class CheckFirstRow(AnalyzeBase):
             self.aly.matrix.vm_change_on_key(vk, vmc.firstrow, new_first_line)
         if write:
             self.aly.matrix.write()
-            self.matrix = vm.VendorMatrix(display_log=False)
+            self.aly.matrix.refresh()
 
     def fix_analysis_for_data_source(self, aly_source, write=True):
         """
@@ -1530,7 +1777,7 @@ class CheckFirstRow(AnalyzeBase):
             self.fix_analysis_for_data_source(x, write=write)
         if write:
             self.aly.matrix.write()
-            self.matrix = vm.VendorMatrix(display_log=False)
+            self.aly.matrix.refresh()
         return self.aly.matrix.vm_df
 
 
@@ -1540,6 +1787,7 @@ class CheckLastRow(AnalyzeBase):
     fix = True
     new_files = True
     all_files = True
+    reads = (Analyze.raw_resource, Analyze.vm_resource)
 
     def find_last_row(self, source, totals_df=pd.DataFrame()):
         """
@@ -1556,8 +1804,7 @@ class CheckLastRow(AnalyzeBase):
         old_last_row = source.p[vmc.lastrow]
         if vmc.filename not in source.p:
             return totals_df
-        raw_file = source.p[vmc.filename]
-        df = utl.import_read_csv(raw_file)
+        df = self.aly.get_raw_profile(source).get_df()
         if df.empty:
             return totals_df
         active_metrics = source.get_active_metrics()
@@ -1632,7 +1879,7 @@ class CheckLastRow(AnalyzeBase):
             self.aly.matrix.vm_change_on_key(vk, vmc.lastrow, new_last_line)
         if write:
             self.aly.matrix.write()
-            self.matrix = vm.VendorMatrix(display_log=False)
+            self.aly.matrix.refresh()
 
     def fix_analysis_for_data_source(self, aly_source, write=True):
         """
@@ -1675,6 +1922,7 @@ class CheckPackageCapping(AnalyzeBase):
     net_cost_capped = 'Net Cost (Capped)'
     pre_run = True
     fix = False
+    reads = (Analyze.df_resource, Analyze.raw_resource)
 
     def initialize_cap_file(self):
         """
@@ -1685,7 +1933,7 @@ class CheckPackageCapping(AnalyzeBase):
         pdf -> cap file data
         cap_file -> MetricCap() object
         """
-        df = self.aly.df
+        df = self.aly.df.copy()
         df = cal.net_cost_calculation(df).reset_index(drop=True)
         cap_file = cal.MetricCap()
         df = cap_file.apply_all_caps(df, final_calculation=False)
@@ -1870,12 +2118,13 @@ class CheckPackageCapping(AnalyzeBase):
 
 class CheckAdwordsSplit(AnalyzeBase):
     """Checks Adwords/Google Ads APIs for multiple campaigns and splits"""
-    camp_col = aw.campaign_col
+    camp_col = 'Campaign'
     sem_list = ['sem', 'googlesem', 'google sem', 'search']
     yt_list = ['video', 'youtube', 'yt']
     name = Analyze.api_split
     fix = True
     new_files = True
+    reads = (Analyze.raw_resource, Analyze.vm_resource)
 
     def find_matching_substring_in_column(self, string_list, target_column):
         return target_column.apply(
@@ -1917,6 +2166,7 @@ class CheckAdwordsSplit(AnalyzeBase):
         if vmc.filename not in source.p:
             return df
         api_file = source.p[vmc.apifile]
+        import yaml
         ic = vm.ImportConfig(matrix=self.matrix)
         api_config = ic.load_file(api_file, yaml)
         if not api_config or 'adwords' not in api_config:
@@ -1957,9 +2207,10 @@ class CheckAdwordsSplit(AnalyzeBase):
 
         :returns: new vendor matrix dataframe
         """
+        import yaml
         df = self.aly.matrix.vm_df
         aly_dict = aly_dict.to_dict(orient='records')
-        ic = vm.ImportConfig()
+        ic = vm.ImportConfig(matrix=self.aly.matrix)
         drop_idx = np.empty(0)
         for x in aly_dict:
             vk = x[vmc.vendorkey]
@@ -1999,6 +2250,7 @@ class FindPlacementNameCol(AnalyzeBase):
     fix = True
     new_files = True
     suggested_col = 'Suggested Col'
+    reads = (Analyze.raw_resource, Analyze.vm_resource)
 
     @staticmethod
     def find_placement_col_in_df(
@@ -2061,9 +2313,10 @@ class FindPlacementNameCol(AnalyzeBase):
                       in ['FilterCol', 'MergeReplaceExclude']]
         p_col = source.p[vmc.placement]
         if os.path.exists(file_name):
-            tdf = source.get_raw_df(nrows=first_row + 3)
+            profile = self.aly.get_raw_profile(source)
+            tdf = profile.get_raw_df(source, nrows=first_row + 3)
             if tdf.empty and transforms:
-                tdf = source.get_raw_df()
+                tdf = profile.get_raw_df(source)
             df = self.find_placement_col_in_df(
                 df=tdf, result_df=df, placement_col=p_col, vk_name=source.key)
         return df
@@ -2110,6 +2363,7 @@ class CheckApiDateLength(AnalyzeBase):
     fix = True
     pre_run = True
     highest_date = 'highest_date'
+    reads = (Analyze.raw_resource, Analyze.vm_resource)
 
     def do_analysis(self):
         """
@@ -2221,6 +2475,7 @@ class CheckColumnNames(AnalyzeBase):
     fix = True
     new_files = True
     all_files = True
+    reads = (Analyze.raw_resource, Analyze.vm_resource)
 
     def do_analysis(self):
         """
@@ -2238,9 +2493,10 @@ class CheckColumnNames(AnalyzeBase):
             transforms = [x for x in transforms if x.split('::')[0]
                           in ['FilterCol', 'MergeReplaceExclude']]
             missing_cols = []
-            tdf = source.get_raw_df(nrows=first_row + 5)
+            profile = self.aly.get_raw_profile(source)
+            tdf = profile.get_raw_df(source, nrows=first_row + 5)
             if tdf.empty and transforms:
-                tdf = source.get_raw_df()
+                tdf = profile.get_raw_df(source)
             cols = [str(x) for x in tdf.columns if str(x) != 'nan']
             active_metrics = source.get_active_metrics()
             active_metrics[vmc.placement] = [source.p[vmc.placement]]
@@ -2268,7 +2524,7 @@ class CheckColumnNames(AnalyzeBase):
         :returns: the vm as a df
         """
         aly_dicts = aly_dict.to_dict(orient='records')
-        self.matrix = vm.VendorMatrix(display_log=False)
+        self.matrix = self.aly.matrix
         df = self.aly.matrix.vm_df
         aly_dicts = [x for x in aly_dicts
                      if x['missing'] and x[Analyze.raw_columns]]
@@ -2286,7 +2542,7 @@ class CheckColumnNames(AnalyzeBase):
                     tdf = tdf[0]
                     for col in [vmc.placement, vmc.fullplacename]:
                         fnc.fix_analysis_for_data_source(tdf, True, col)
-                    self.matrix = vm.VendorMatrix(display_log=False)
+                    self.matrix.refresh()
                     source = self.matrix.get_data_source(vk)
                     cad = CheckAutoDictOrder(self.aly)
                     tdf = cad.do_analysis_on_data_source(source, [])
@@ -2294,7 +2550,7 @@ class CheckColumnNames(AnalyzeBase):
                     if not tdf.empty:
                         tdf = tdf.to_dict(orient='records')[0]
                         cad.fix_analysis_for_data_source(tdf, True)
-                        self.matrix = vm.VendorMatrix(display_log=False)
+                        self.matrix.refresh()
                         self.aly.fixes_to_run = True
             date_missing = [x for x in aly_dict['missing'] if
                             vmc.date in x.keys()]
@@ -2312,7 +2568,7 @@ class CheckColumnNames(AnalyzeBase):
                 logging.info('Changing {} date col to {} '.format(vk, date_col))
                 self.aly.matrix.vm_change_on_key(vk, vmc.date, date_col)
                 self.aly.matrix.write()
-                self.matrix = vm.VendorMatrix(display_log=False)
+                self.matrix.refresh()
         self.aly.matrix.vm_df = df
         if write:
             self.aly.matrix.write()
@@ -2329,6 +2585,7 @@ class CheckFlatSpends(AnalyzeBase):
     missing_rate_error = 'Missing Buy Rate'
     fix = True
     pre_run = True
+    reads = (Analyze.df_resource,)
 
     def merge_first_click_date(self, df, tdf, groups):
         df = df.merge(tdf.drop_duplicates(),
@@ -2475,6 +2732,7 @@ class CheckDoubleCounting(AnalyzeBase):
     num_duplicates = 'Num Duplicates'
     fix = True
     pre_run = True
+    reads = (Analyze.df_resource, Analyze.vm_resource)
 
     def count_unique_placements(self, df, col):
         df = df.groupby([dctc.VEN, vmc.vendorkey, dctc.PN]).size()
@@ -2658,6 +2916,7 @@ class GetPacingAnalysis(AnalyzeBase):
     delivery_col = 'Delivery'
     proj_completion_col = 'Projected Full Delivery'
     pacing_goal_col = '% Through Campaign'
+    reads = (Analyze.df_resource, Analyze.vm_resource)
 
     @staticmethod
     def get_rolling_mean_df(df, value_col, group_cols):
@@ -2767,7 +3026,7 @@ class GetPacingAnalysis(AnalyzeBase):
         average_df = average_df[average_df[vmc.date] == last_date]
         average_df = average_df.drop(columns=[vmc.cost])
         start_dates, end_dates = self.aly.get_start_end_dates(
-            df, plan_names)
+            df, plan_names, self.aly.matrix)
         if start_dates is None or end_dates is None:
             logging.warning('Start/end dates unavailable; skipping pacing.')
             return pd.DataFrame()
@@ -2844,6 +3103,7 @@ class GetDailyDelivery(AnalyzeBase):
     num_days = 'Num Days'
     daily_spend_goal = 'Daily Spend Goal'
     day_pacing = 'Day Pacing'
+    reads = (Analyze.df_resource, Analyze.raw_resource, Analyze.vm_resource)
 
     def get_daily_delivery(self, df):
         """
@@ -2856,7 +3116,8 @@ class GetDailyDelivery(AnalyzeBase):
             logging.warning('Dataframe empty cannot get daily delivery')
             return daily_dfs
         plan_names = self.matrix.vendor_set(vm.plan_key)[vmc.fullplacename]
-        start_dates, end_dates = self.aly.get_start_end_dates(df, plan_names)
+        start_dates, end_dates = self.aly.get_start_end_dates(
+            df, plan_names, self.aly.matrix)
         if start_dates is None or end_dates is None:
             logging.warning(
                 'Start/end dates unavailable (missing vendorkey); '
@@ -2927,6 +3188,8 @@ class GetServingAlerts(AnalyzeBase):
     pre_run = False
     adserving_ratio = 'Adserving %'
     prog_vendors = ['DV360', 'dv360', 'DV 360', 'Verizon', 'VERIZON']
+    reads = (Analyze.df_resource, Analyze.vm_resource)
+    depends_on = (GetPacingAnalysis,)
 
     def get_serving_alerts(self):
         """
@@ -2976,6 +3239,7 @@ class CheckRawFileUpdateTime(AnalyzeBase):
     update_time_col = 'update_time'
     update_tier_col = 'update_tier'
     last_update_does_not_exist = 'Does Not Exist'
+    reads = (Analyze.raw_resource, Analyze.vm_resource)
 
     def do_analysis(self):
         data_sources = self.matrix.get_all_data_sources()
@@ -3017,6 +3281,8 @@ class GetDailyPacingAlerts(AnalyzeBase):
     fix = False
     pre_run = False
     day_pacing = 'Day Pacing'
+    reads = (Analyze.df_resource,)
+    depends_on = (GetDailyDelivery,)
 
     def get_daily_pacing_alerts(self):
         """
@@ -3082,6 +3348,7 @@ class CheckPlacementsNotInMp(AnalyzeBase):
     merge_col = '_merge'
     merge_filter = 'left_only'
     cols = [vmc.vendorkey, dctc.VEN, dctc.PN]
+    reads = (Analyze.df_resource, Analyze.vm_resource)
 
     def find_placements_not_in_mp(self, df):
         """
@@ -3207,6 +3474,7 @@ class CheckPlanPartnersNotDelivered(AnalyzeBase):
     pre_run = True
     merge_col = '_merge'
     merge_filter = 'left_only'
+    reads = (Analyze.df_resource,)
 
     def find_plan_partners_not_delivered(self, df):
         """
@@ -3252,6 +3520,7 @@ class CheckLive(AnalyzeBase):
     missing_col = 'Column Name'
     missing_val = 'Not Live Values'
     sd_col = dctc.PD
+    reads = (Analyze.df_resource,)
 
     def check_col_live(self, df):
         """
@@ -3578,18 +3847,24 @@ class AliChat(object):
         "suggested_category, suggested_labels, can_resolve, "
         "resolution_plan, triage_reasoning.")
 
-    # index_db_model_by_word loads and word-indexes EVERY row of a
-    # model, and get_response runs it for each searched model — an
-    # O(sum of table sizes) cost per chat send that grows with the
-    # database. Entries are keyed per model class and reused across
-    # requests for ``word_index_ttl`` seconds. A cached entry is
-    # revalidated against the model's current row count, so creates
-    # and deletes take effect immediately; renames from outside this
-    # process converge within the TTL. In-process writes (heuristic
-    # proposes, tool-loop writes) call invalidate_word_index().
-    # {(model_name, split_underscore): (word_idx, built_at, count)}
+    # index_db_model_by_word word-indexes the names of a model's rows
+    # for each searched model. The posting lists persist in a SQLite
+    # WordIndexStore at ``word_index_path`` shared by every worker
+    # process, and each call syncs only what changed: a count and
+    # max(id) probe finds creates (ids past the stored max) and, when
+    # the counts disagree, an id diff finds deletes; rows at or past
+    # the stored ``word_index_updated_col`` watermark are re-tokenized
+    # and written only if their words changed. Every index rebuilds in
+    # full once ``word_index_ttl`` seconds pass, which also picks up
+    # renames in models without that column. In-process writes
+    # (heuristic proposes, tool-loop writes) call
+    # invalidate_word_index(), which expires the stored index.
+    # {(model_name, split_underscore): (word_idx, version)}
     _WORD_INDEX_CACHE = {}
+    _WORD_INDEX_STORES = {}
     word_index_ttl = 600
+    word_index_path = os.path.join(utl.cache_path, 'ali_word_index.db')
+    word_index_updated_col = 'updated_at'
 
     # Optional callable(dict) the app layer attaches per call-site
     # to persist LLM timing/usage (the AliRun/AliStep envelope).
@@ -3658,15 +3933,20 @@ class AliChat(object):
 
     @classmethod
     def invalidate_word_index(cls, model_names=None):
-        """Drop cached per-model word indexes.
+        """Drop cached per-model word indexes and expire the stored
+        ones so their next sync rebuilds in full.
 
         Called after any in-process write ALI makes so its own
         creates/edits are immediately findable; external writers
-        are covered by the row-count check + TTL. ``model_names``
-        limits the drop to those models' entries (both
-        split-underscore variants); ``None`` drops everything —
+        are covered by the count probe, the updated-at watermark and
+        the TTL. ``model_names`` limits the drop to those models' entries
+        (both split-underscore variants); ``None`` drops everything —
         most writes touch one known model, so targeted callers
         keep every other model's index warm."""
+        try:
+            cls.get_word_index_store().expire(model_names)
+        except Exception as e:
+            logging.warning('Could not expire word index: {}'.format(e))
         if model_names is None:
             cls._WORD_INDEX_CACHE = {}
             return
@@ -3675,6 +3955,16 @@ class AliChat(object):
             k: v for k, v in cls._WORD_INDEX_CACHE.items()
             if k[0] not in names}
 
+    @classmethod
+    def get_word_index_store(cls):
+        """The WordIndexStore at ``word_index_path``, opened once per
+        process."""
+        store = cls._WORD_INDEX_STORES.get(cls.word_index_path)
+        if store is None:
+            store = WordIndexStore(cls.word_index_path)
+            cls._WORD_INDEX_STORES[cls.word_index_path] = store
+        return store
+
     @staticmethod
     def load_config(config_name='openai.json', config_path='reporting'):
         config = None
@@ -3689,6 +3979,7 @@ class AliChat(object):
     def get_openai_response(self, message):
         response = 'OpenAI not configured could not get response.'
         if self.config:
+            import openai
             openai.api_key = self.config['SECRET_KEY']
             prompt = f"User: {message}\nAI:"
             response = openai.Completion.create(
@@ -3731,21 +4022,106 @@ class AliChat(object):
             return db_model.ali_index_query()
         return db_model.query
 
+    @staticmethod
+    def get_index_words(obj_name, split_underscore=False):
+        """Unique words of a name, in order, as the word index keys
+        it."""
+        if not obj_name:
+            return []
+        words = utl.lower_words_from_str(
+            obj_name, split_underscore=split_underscore)
+        return list(dict.fromkeys(words))
+
+    @classmethod
+    def sync_word_index(cls, db_model, split_underscore=False):
+        """Bring the stored word index of a model up to date and
+        return it.
+
+        Only rows that may have changed are tokenized: ids past the
+        stored max id, and rows whose ``word_index_updated_col`` is at
+        or past the stored watermark. Rows are re-read at the watermark
+        itself so a row committed later with the same timestamp is not
+        missed; they are written only when their words changed. Ids
+        are diffed against the index only when the row count does not
+        match the index plus the new ids. A missing, expired or TTL-old
+        index always rebuilds in full. The loaded index is kept in
+        memory until another sync, from any process, bumps its version.
+
+        :param db_model: Model class to index
+        :param split_underscore: Whether to split names on underscores
+        :return: Dict of word to list of object ids
+        """
+        store = cls.get_word_index_store()
+        model_name = db_model.__name__
+        query = cls.scoped_index_query(db_model)
+        updated_col = getattr(db_model, cls.word_index_updated_col, None)
+        state = store.get_state(model_name, split_underscore)
+        full = (not state or not state.built_at or
+                time.time() - state.built_at >= cls.word_index_ttl)
+        watermark = None
+        deleted_ids = set()
+        if full:
+            rows = query.all()
+        else:
+            watermark = state.watermark
+            count, max_id = query.with_entities(
+                sqa.func.count(db_model.id), sqa.func.max(db_model.id)).one()
+            rows = []
+            if state.max_id is None:
+                rows = query.all()
+            elif max_id is not None and max_id > state.max_id:
+                rows = query.filter(db_model.id > state.max_id).all()
+            new_count = len(rows)
+            if updated_col is not None:
+                if watermark is None:
+                    changed = updated_col.isnot(None)
+                else:
+                    changed = updated_col >= watermark
+                rows += query.filter(changed).all()
+            if count != state.count + new_count:
+                ids = {x[0] for x in query.with_entities(db_model.id)}
+                indexed_ids = store.get_ids(model_name, split_underscore)
+                deleted_ids = indexed_ids - ids
+                missing = ids - indexed_ids - {x.id for x in rows}
+                if missing:
+                    rows += query.filter(db_model.id.in_(missing)).all()
+        docs = {}
+        for obj in rows:
+            if obj.id in docs:
+                continue
+            # evaluate the (heavy) name property once
+            docs[obj.id] = cls.get_index_words(obj.name, split_underscore)
+            if updated_col is not None:
+                updated_at = getattr(obj, cls.word_index_updated_col)
+                if updated_at and (watermark is None or
+                                   updated_at > watermark):
+                    watermark = updated_at
+        if not full and docs:
+            stored = store.get_docs(model_name, split_underscore, docs)
+            docs = {k: v for k, v in docs.items() if set(v) != stored.get(k)}
+        version = state.version if state else None
+        if full or docs or deleted_ids or watermark != state.watermark:
+            version = store.update(model_name, split_underscore, docs,
+                                   deleted_ids, watermark, full)
+            logging.debug('Word index {} synced {} rows, dropped {}.'.format(
+                model_name, len(docs), len(deleted_ids)))
+        cache_key = (model_name, split_underscore)
+        cached = cls._WORD_INDEX_CACHE.get(cache_key)
+        if cached and cached[1] == version:
+            return cached[0]
+        word_idx = store.load(model_name, split_underscore)
+        cls._WORD_INDEX_CACHE[cache_key] = (word_idx, version)
+        return word_idx
+
     def index_db_model_by_word(self, db_model, model_is_list=False,
                                split_underscore=False):
-        cache_key = None
-        row_count = None
         if not model_is_list and hasattr(db_model, '__name__'):
-            cache_key = (db_model.__name__, split_underscore)
             try:
-                row_count = self.scoped_index_query(db_model).count()
-            except Exception:
-                cache_key = None
-            cached = (AliChat._WORD_INDEX_CACHE.get(cache_key)
-                      if cache_key else None)
-            if (cached and cached[2] == row_count
-                    and time.time() - cached[1] < self.word_index_ttl):
-                return cached[0]
+                return self.sync_word_index(db_model, split_underscore)
+            except Exception as e:
+                logging.warning('Could not sync word index for {}, '
+                                'building in memory: {}'.format(
+                                    db_model.__name__, e))
         word_idx = {}
         db_all = db_model
         if not model_is_list:
@@ -3754,21 +4130,11 @@ class AliChat(object):
             if model_is_list:
                 obj = FakeDbModel(name=obj, object_id=idx)
             obj_name = obj.name  # evaluate the (heavy) name property once
-            if obj_name:
-                used_words = set()
-                words = utl.lower_words_from_str(
-                    obj_name, split_underscore=split_underscore)
-                for word in words:
-                    if word in used_words:
-                        continue
-                    if word in word_idx:
-                        word_idx[word].append(obj.id)
-                    else:
-                        word_idx[word] = [obj.id]
-                    used_words.add(word)
-        if cache_key:
-            AliChat._WORD_INDEX_CACHE[cache_key] = (
-                word_idx, time.time(), row_count)
+            for word in self.get_index_words(obj_name, split_underscore):
+                if word in word_idx:
+                    word_idx[word].append(obj.id)
+                else:
+                    word_idx[word] = [obj.id]
         return word_idx
 
     def convert_model_ids_to_message(
@@ -3903,6 +4269,7 @@ class AliChat(object):
             message = re.sub(r'[^\w\s]', '', message)
         lemmatizer = None
         if not lemmatizer:
+            import nltk
             lemmatizer = nltk.stem.WordNetLemmatizer()
         stop_words = set(self.stop_words.copy())
         if db_model and not isinstance(db_model, list):
@@ -4574,6 +4941,7 @@ class AliChat(object):
         guard it with ``nltk.data.find``. This ran twice per ``AliChat``
         construction — i.e. once per ``/post_chat`` — and was a
         multi-second synchronous cost in the chat path."""
+        import nltk
         try:
             nltk.data.find(path)
         except LookupError:
@@ -4586,6 +4954,7 @@ class AliChat(object):
         if AliChat._STOP_WORDS_CACHE is None:
             AliChat._ensure_nltk_corpus('stopwords', 'corpora/stopwords')
             AliChat._ensure_nltk_corpus('wordnet', 'corpora/wordnet')
+            import nltk
             AliChat._STOP_WORDS_CACHE = list(
                 nltk.corpus.stopwords.words('english'))
         return AliChat._STOP_WORDS_CACHE
@@ -171,6 +171,154 @@ def net_cost(df, cost_col=vmc.cost, bm_col=dctc.BM, br_col=dctc.BR):
         return df[cost_col]
 
 
+def rate_cost(metric_col, divisor=1):
+    """
+    Builds a buy model calculation that multiplies the rate by a metric
+
+    :param metric_col: The metric column the rate is applied to
+    :param divisor: Value the metric is divided by, i.e. 1000 for CPM
+    :return: Function that calculates the cost of a df
+    """
+    def calculation(df, br_col=dctc.BR):
+        return df[br_col] * (df[metric_col] / divisor)
+    return calculation
+
+
+def date_tier_cost(metric_col, rate_cols, date_cols):
+    """
+    Builds a buy model calculation where the rate steps up on each date
+
+    :param metric_col: The metric column the rates are applied to
+    :param rate_cols: The rate columns in order of use
+    :param date_cols: The dates at which the next rate column is used
+    :return: Function that calculates the cost of a df
+    """
+    def calculation(df, br_col=dctc.BR):
+        date = df[vmc.date]
+        costs = [df[x] * df[metric_col] for x in rate_cols]
+        if len(date_cols) == 1:
+            return np.where(date < df[date_cols[0]], costs[0], costs[1])
+        conditions = [date >= df[date_cols[-1]], date < df[date_cols[0]]]
+        choices = [costs[-1], costs[0]]
+        for idx in reversed(range(1, len(date_cols))):
+            conditions.append((df[date_cols[idx]] > date) &
+                              (date >= df[date_cols[idx - 1]]))
+            choices.append(costs[idx])
+        return np.select(conditions, choices, default=np.nan)
+    return calculation
+
+
+def flat_cost(metric_col, on_placement_date=True):
+    def calculation(df, br_col=dctc.BR):
+        cost = df[br_col] * df[metric_col]
+        if on_placement_date:
+            cost = np.where(df[vmc.date] == df[dctc.PD], cost, np.nan)
+        return cost
+    return calculation
+
+
+def optional_metric_cost(metric_col, rate_col=None):
+    def calculation(df, br_col=dctc.BR):
+        if metric_col not in df.columns:
+            return np.nan
+        return df[rate_col if rate_col else br_col] * df[metric_col]
+    return calculation
+
+
+def programmaddict_cost(df, br_col=dctc.BR):
+    return df[vmc.cost] / .85
+
+
+def cpa_cpm_cost(df, br_col=dctc.BR):
+    return np.where(df[vmc.date] < df[dctc.PD],
+                    df[br_col] * df[vmc.conv1],
+                    df[dctc.BR2] * (df[vmc.impressions] / 1000))
+
+
+def cpnu_cpsu_cost(df, br_col=dctc.BR):
+    return ((df[br_col] * df[vmc.newuser]) +
+            (df[dctc.BR2] * df[vmc.signup]))
+
+
+BUY_MODEL_CALCULATIONS = {
+    BM_CPM: rate_cost(vmc.impressions, 1000),
+    BM_AV: rate_cost(vmc.impressions, 1000),
+    BM_CPC: rate_cost(vmc.clicks),
+    BM_CPV: rate_cost(vmc.views),
+    BM_CPCV: rate_cost(vmc.views100),
+    BM_CPLP: rate_cost(vmc.landingpage),
+    BM_CPVM: rate_cost(vmc.view_imps, 1000),
+    BM_PA: programmaddict_cost,
+    BM_CPE: optional_metric_cost(vmc.engagements),
+    BM_FLAT: flat_cost(CLI_PD),
+    BM_FLAT2: flat_cost(CLI_PD),
+    BM_FLATIMP: flat_cost(IMP_PD),
+    BM_FLATCOUNT: flat_cost(CLI_PD, on_placement_date=False),
+    BM_CPACPM: cpa_cpm_cost,
+    BM_CPNUCPSU: cpnu_cpsu_cost,
+    BM_CPA: optional_metric_cost(vmc.conv1, dctc.BR),
+    BM_CPA2: date_tier_cost(vmc.conv1, [dctc.BR, dctc.BR2], [dctc.PD]),
+    BM_CPLP2: date_tier_cost(vmc.landingpage, [dctc.BR, dctc.BR2],
+                             [dctc.PD]),
+    BM_CPA3: date_tier_cost(vmc.conv1, [dctc.BR, dctc.BR2, dctc.BR3],
+                            [dctc.PD, dctc.PD2]),
+    BM_CPLP3: date_tier_cost(vmc.landingpage, [dctc.BR, dctc.BR2, dctc.BR3],
+                             [dctc.PD, dctc.PD2]),
+    BM_CPA4: date_tier_cost(vmc.conv1,
+                            [dctc.BR, dctc.BR2, dctc.BR3, dctc.BR4],
+                            [dctc.PD, dctc.PD2, dctc.PD3]),
+    BM_CPA5: date_tier_cost(vmc.conv1,
+                            [dctc.BR, dctc.BR2, dctc.BR3, dctc.BR4,
+                             dctc.BR5],
+                            [dctc.PD, dctc.PD2, dctc.PD3, dctc.PD4]),
+}
+
+
+def register_buy_model(buy_model, calculation):
+    """
+    Adds a buy model so it is calculated by buy_model_cost
+
+    :param buy_model: The buy model name as it appears in the dictionary
+    :param calculation: Function taking the rows of a df with that buy model
+        and the rate column name, returning the cost of each row
+    :return: None
+    """
+    BUY_MODEL_CALCULATIONS[buy_model] = calculation
+    if buy_model not in BUY_MODELS:
+        BUY_MODELS.append(buy_model)
+
+
+def buy_model_cost(df, cost_col=vmc.cost, bm_col=dctc.BM, br_col=dctc.BR,
+                   mask=None):
+    """
+    Calculates cost of rows by their buy model, vectorized per buy model.
+    Equivalent to applying net_cost to each row.
+
+    :param df: The df with buy model, rate and metric columns
+    :param cost_col: The column returned for unregistered buy models
+    :param bm_col: The column with the buy model
+    :param br_col: The column with the rate
+    :param mask: Boolean array of rows to calculate, defaults to all rows
+    :return: Array of costs in the same order as df
+    """
+    cost = pd.to_numeric(df[cost_col], errors='coerce').to_numpy(
+        dtype=float, copy=True)
+    positions = np.arange(len(df))
+    buy_models = df[bm_col]
+    if mask is not None:
+        positions = positions[mask]
+        buy_models = buy_models[mask]
+    buy_model_idx = buy_models.groupby(buy_models, sort=False).indices
+    for buy_model, idx in buy_model_idx.items():
+        if buy_model not in BUY_MODEL_CALCULATIONS:
+            continue
+        idx = positions[idx]
+        calculation = BUY_MODEL_CALCULATIONS[buy_model]
+        values = calculation(df.iloc[idx], br_col=br_col)
+        cost[idx] = np.asarray(values, dtype=float)
+    return cost
+
+
 def net_cost_calculation(df):
     logging.info('Calculating Net Cost')
     df = clicks_by_place_date(df)
@@ -183,76 +331,77 @@ def net_cost_calculation(df):
             logging.warning('{} buy model specified '
                             'without conversion {}.'.format(col[0], col[1]))
             df[col[1]] = 0
-    calc_ser = df[df[dctc.BM].isin(BUY_MODELS)].apply(net_cost, axis=1)
-    if not calc_ser.empty:
-        df.loc[calc_ser.index, vmc.cost] = calc_ser
+    mask = df[dctc.BM].isin(BUY_MODELS).to_numpy()
+    if mask.any():
+        df.loc[mask, vmc.cost] = buy_model_cost(df, mask=mask)[mask]
     return df
 
 
 def net_plan_comp(df, p_col=dctc.PFPN, n_cost=vmc.cost, p_cost=dctc.PNC):
-    df = utl.data_to_type(df, float_col=[p_cost])
-    for col in [p_cost, vmc.cost]:
-        if col not in df.columns:
-            df[col] = 0
-    df[p_cost] = df[p_cost].fillna(0)
-    nc_pnc = df.copy()
+    """
+    Sums the planned and actual cost of each p_col, leaving out
+    unclickable rows, for the groups that have a plan
+
+    :param df: The dataframe with the columns to perform the calculation
+    :param p_col: The column to group by
+    :param n_cost: The column with the metric to be capped
+    :param p_cost: The column with the metric to cap at
+    :return: Series of the p_cost sum indexed by p_col
+    """
+    plan = df
     if dctc.UNC in df.columns:
-        nc_pnc = df[df[dctc.UNC] != True]
-    if p_col not in nc_pnc.columns:
-        logging.warning('{} not in df, continuing.'.format(p_col))
-        return df
-    nc_pnc = nc_pnc.groupby(p_col)[[p_cost, n_cost]].sum()
-    nc_pnc = nc_pnc[nc_pnc[p_cost] > 0]
-    if p_cost not in nc_pnc.columns:
-        nc_pnc[p_cost] = 0
-    nc_pnc[DIF_NC_PNC] = nc_pnc[n_cost] - nc_pnc[p_cost]
-    nc_pnc = nc_pnc.reset_index()
-    nc_pnc.columns = [p_col] + DIF_COL
-    df = df.merge(nc_pnc, on=p_col, how='left')
-    return df
+        plan = df[df[dctc.UNC] != True]
+    plan = plan.groupby(p_col)[[p_cost, n_cost]].sum()
+    return plan.loc[plan[p_cost] > 0, p_cost]
 
 
 def net_cum_sum(df, p_col=dctc.PFPN, n_cost=vmc.cost):
     """
-    Calculates the cumulative sum by date and p_col, summing n_cost
+    Calculates the sum by date and p_col of n_cost and its cumulative sum
+    over dates for each row, without merging the grouped sums back
 
     :param df: The dataframe with the columns to perform the calculation
-    :param p_col: The column to group by withe date as a string
+    :param p_col: The column to group by with date
     :param n_cost: The column to sum
-    :return: The df with the calculation made in the cumulative sum column
+    :return: Tuple of arrays of the date sum and cumulative sum of each row
     """
-    df = utl.data_to_type(df, float_col=[n_cost])
-    nc_cum_sum = (df.groupby([p_col, vmc.date])[n_cost].sum()
-                  .groupby(level=[0]).cumsum()).reset_index()
-    nc_cum_sum.columns = [p_col] + NC_CUM_SUM_COL
-    df = df.merge(nc_cum_sum, on=[p_col, vmc.date], how='left')
-    return df
-
-
-def net_sum_date(df, p_col=dctc.PFPN, n_cost=vmc.cost):
-    nc_sum_date = df.groupby([p_col, vmc.date])[n_cost].sum().reset_index()
-    nc_sum_date.columns = [p_col] + NC_SUM_DATE_COL
-    df = df.merge(nc_sum_date, on=[p_col, vmc.date], how='left')
-    return df
-
+    grouped = df.groupby([p_col, vmc.date])
+    sum_date = grouped[n_cost].sum()
+    cum_sum = sum_date.groupby(level=[0]).cumsum()
+    group = grouped.ngroup().to_numpy()
+    valid = ~np.isnan(group)
+    group = group[valid].astype(int)
+    row_sums = []
+    for sums in [sum_date, cum_sum]:
+        row_sum = np.full(len(df), np.nan)
+        row_sum[valid] = sums.to_numpy()[group]
+        row_sums.append(row_sum)
+    return tuple(row_sums)
+
+
+def net_cost_final(df, dif_pnc, nc_sum_date, nc_cum_sum, p_col=dctc.PFPN,
+                   n_cost=vmc.cost):
+    """
+    Caps n_cost on the first date each p_col goes over its plan and zeroes
+    it for the dates after
 
-def net_cost_final(df, p_col=dctc.PFPN, n_cost=vmc.cost):
-    dim_cols = [vmc.date, p_col]
-    tdf = df[df[NC_CUM_SUM] > df[DIF_PNC]][dim_cols]
-    tdf = tdf.groupby([p_col]).min().reset_index()
-    if not tdf.empty:
-        tdf = tdf[dim_cols]
-        tdf[NC_CUM_SUM_MIN_DATE] = True
-        df = df.merge(tdf, on=[p_col, vmc.date], how='left')
-        df[NCF] = np.where(df[NC_CUM_SUM] > df[DIF_PNC],
-                           (np.where(df[NC_CUM_SUM_MIN_DATE] == True,
-                                     (df[n_cost] -
-                                      (df[n_cost] / (df[NC_SUM_DATE])) *
-                                      (df[NC_CUM_SUM] - df[DIF_PNC])),
-                                     0)),
-                           df[vmc.cost])
+    :param df: The dataframe with all metrics/dimensions
+    :param dif_pnc: Series of the plan of each row's p_col
+    :param nc_sum_date: Series of the n_cost sum of each row's p_col/date
+    :param nc_cum_sum: Series of the n_cost cumulative sum by date
+    :param p_col: The column with the dimension to group by
+    :param n_cost: The column with the metric to be capped
+    :return: The df with the capped metric in Net Cost Final
+    """
+    over = nc_cum_sum > dif_pnc
+    if over.any():
+        min_date = df.loc[over, [vmc.date, p_col]].groupby(p_col).min()
+        min_date = df[p_col].map(min_date[vmc.date])
+        capped = (df[n_cost] - (df[n_cost] / nc_sum_date) *
+                  (nc_cum_sum - dif_pnc))
+        df[NCF] = np.where(over, np.where(df[vmc.date] == min_date,
+                                          capped, 0), df[vmc.cost])
     else:
-        df[NC_CUM_SUM_MIN_DATE] = 0
         df[NCF] = df[n_cost]
     df = utl.col_removal(df, 'Raw Data', DROP_COL, warn=False)
     return df
@@ -261,7 +410,9 @@ def net_cost_final(df, p_col=dctc.PFPN, n_cost=vmc.cost):
 def net_cost_final_calculation(df, p_col=dctc.PFPN, n_cost=vmc.cost,
                                p_cost=dctc.PNC):
     """
-    Caps a metric at another metric based on a grouped dimension column
+    Caps a metric at another metric based on a grouped dimension column.
+    Group sums are mapped back onto the rows rather than merged, so the
+    full frame is not copied for each step.
 
     :param df: The dataframe with all metrics/dimensions
     :param p_col: The column with the dimension to group by
@@ -273,10 +424,20 @@ def net_cost_final_calculation(df, p_col=dctc.PFPN, n_cost=vmc.cost,
     if p_col not in df.columns:
         logging.warning('{} not in df, could not calculate.'.format(p_col))
         return df
-    df = net_plan_comp(df, p_col=p_col, n_cost=n_cost, p_cost=p_cost)
-    df = net_cum_sum(df, p_col=p_col, n_cost=n_cost)
-    df = net_sum_date(df, p_col=p_col, n_cost=n_cost)
-    df = net_cost_final(df, p_col=p_col, n_cost=n_cost)
+    if df.columns.duplicated().any():
+        df = df.loc[:, ~df.columns.duplicated()]
+    df = df.reset_index(drop=True)
+    if p_cost in df.columns:
+        df[p_cost] = utl.numeric_to_float(df[p_cost])
+    for col in [p_cost, vmc.cost]:
+        if col not in df.columns:
+            df[col] = 0
+    df[p_cost] = df[p_cost].fillna(0)
+    dif_pnc = df[p_col].map(net_plan_comp(df, p_col, n_cost, p_cost))
+    df[n_cost] = utl.numeric_to_float(df[n_cost])
+    nc_sum_date, nc_cum_sum = net_cum_sum(df, p_col=p_col, n_cost=n_cost)
+    df = net_cost_final(df, dif_pnc, pd.Series(nc_sum_date),
+                        pd.Series(nc_cum_sum), p_col=p_col, n_cost=n_cost)
     return df
 
 
@@ -3,6 +3,7 @@ import os
 import logging
 import numpy as np
 import pandas as pd
+from filelock import FileLock
 import reporting.utils as utl
 import reporting.dictcolumns as dctc
 import reporting.vmcolumns as vmc
@@ -65,20 +66,39 @@ class Dict(object):
         error.columns = [dctc.FPN, dctc.PN]
         if include_full_name:
             error = utl.data_to_type(error, str_col=[placement])
-            max_placement_name_length = max(
-                map(len, error[placement].str.split('_')))
+        codes, parts = Dict.split_unique(error[placement], '_')
+        if include_full_name:
+            max_placement_name_length = len(parts.columns)
             if len(autodicord) < max_placement_name_length:
                 length_diff = max_placement_name_length - len(autodicord)
                 autodicord.extend([dctc.MIS] * length_diff)
             autodicord = list(utl.rename_duplicates(autodicord))
+        parts = parts.reindex(columns=range(len(autodicord)))
         for i, value in enumerate(autodicord):
             if include_index:
                 col_name = '{}-{}'.format(i, value)
             else:
                 col_name = value
-            error[col_name] = error[placement].str.split('_').str[i]
+            error[col_name] = parts[i].to_numpy(dtype=object)[codes]
         return error
 
+    @staticmethod
+    def split_unique(ser, delimiter, n=-1):
+        """
+        Splits each distinct value of a series once with a single expanded
+        split, rather than splitting every row for every component.
+
+        :param ser: Series of strings to split
+        :param delimiter: Delimiter passed to str.split
+        :param n: Maximum number of splits, -1 for all
+        :return: Tuple of the row codes into the unique values and a
+            dataframe of their components, missing components as NaN
+        """
+        codes, uniques = pd.factorize(ser, use_na_sentinel=False)
+        parts = pd.Series(uniques).str.split(delimiter, n=n, expand=True)
+        parts = parts.astype(object).where(parts.notna())
+        return codes, parts
+
     def auto(self, err, autodicord, placement, rc_auto):
         error = err.get()
         if not autodicord == ['nan'] and not error.empty:
@@ -96,7 +116,7 @@ class Dict(object):
             self.data_dict = pd.concat([self.data_dict, error], sort=True)
             self.data_dict = self.data_dict[dctc.COLS]
             err.dic = self
-            err.reset()
+            err.add_keys(error[dctc.FPN])
         return True
 
     def auto_combine(self, error, rc_auto):
@@ -414,14 +434,14 @@ class Dict(object):
             params = col.split(split_key)
             delimit_list = params[1::2]
             new_col_list = params[::2]
-            for idx, c in enumerate(delimit_list):
-                cur_del = delimit_list[idx]
-                cur_col = new_col_list[idx]
-                error[col] = error[col].astype('U')
-                error[cur_col] = error[col].str.split(cur_del).str[0]
-                error[col] = error[col].str.split(cur_del).str[1:]
-                error[col] = error[col].apply(lambda x: cur_del.join(x))
-            error[new_col_list[-1]] = error[col]
+            codes, uniques = pd.factorize(error[col], use_na_sentinel=False)
+            remainder = pd.Series(uniques, dtype=object).astype('U')
+            for cur_del, cur_col in zip(delimit_list, new_col_list):
+                parts = remainder.str.split(cur_del, n=1, expand=True)
+                parts = parts.reindex(columns=[0, 1]).fillna('')
+                error[cur_col] = parts[0].to_numpy(dtype=object)[codes]
+                remainder = parts[1]
+            error[new_col_list[-1]] = remainder.to_numpy(dtype=object)[codes]
             error.drop([col], axis=1, inplace=True)
         return error
 
@@ -435,18 +455,15 @@ class Dict(object):
         self.write()
 
     def apply_relation(self):
-        rc = RelationalConfig()
-        rc.read(dctc.filename_rel_config)
+        rc = ConfigRegistry.get_relational_config()
         self.data_dict = rc.loop(self.data_dict)
 
     def apply_constants(self):
-        dcc = DictConstantConfig(self.filename)
-        dcc.read(dctc.filename_con_config)
+        dcc = ConfigRegistry.get_constant_config(self.filename)
         self.data_dict = dcc.apply_constants_to_dict(self.data_dict)
 
     def apply_translation(self):
-        tc = DictTranslationConfig()
-        tc.read(dctc.filename_tran_config)
+        tc = ConfigRegistry.get_translation_config()
         self.data_dict = tc.apply_translation_to_dict(self.data_dict)
 
     def add_creative_urls(self):
@@ -551,7 +568,7 @@ class RelationalConfig(object):
     def loop(self, data_dict):
         for key in self.key_list:
             self.relational_params = self.get_relation_params(key)
-            dr = DictRelational(**self.relational_params)
+            dr = ConfigRegistry.get_relational_dict(**self.relational_params)
             data_dict = dr.apply_to_dict(data_dict)
         return data_dict
 
@@ -567,6 +584,8 @@ class DictRelational(object):
         self.key = self.params[dctc.KEY]
         self.dependents = self.params[dctc.DEP]
         self.columns = [self.key] + self.dependents
+        self.shared = False
+        self.new_keys = pd.DataFrame()
 
     def read(self):
         if not os.path.isfile(self.full_file_path):
@@ -579,7 +598,7 @@ class DictRelational(object):
             self.df = pd.DataFrame(columns=self.columns)
         self.df = utl.data_to_type(self.df, str_col=[self.key])
 
-    def add_key_values(self, data_dict):
+    def add_key_values(self, data_dict, write=True):
         keys_list = pd.DataFrame(data_dict[self.key]).drop_duplicates()
         keys_list.dropna(subset=[self.key], inplace=True)
         keys_list = self.get_new_values(keys_list)
@@ -589,7 +608,31 @@ class DictRelational(object):
         self.df = utl.data_to_type(self.df, str_col=keys_list.columns)
         self.df = pd.concat([self.df, keys_list], ignore_index=True)
         self.df.dropna(subset=[self.key], inplace=True)
-        self.write(self.df)
+        self.new_keys = pd.concat([self.new_keys, keys_list],
+                                  ignore_index=True)
+        if write:
+            self.write(self.df)
+        return True
+
+    def flush(self):
+        """
+        Writes key values added since the last flush, merging them into the
+        file as it is on disk in case another process added keys since.
+
+        :return: True if any values were written
+        """
+        if self.new_keys.empty:
+            return False
+        new_keys = self.new_keys
+        self.new_keys = pd.DataFrame()
+        with FileLock('{}.lock'.format(self.full_file_path)):
+            self.read()
+            new_keys = new_keys[~new_keys[self.key].isin(self.df[self.key])]
+            if new_keys.empty:
+                return False
+            self.df = utl.data_to_type(self.df, str_col=new_keys.columns)
+            self.df = pd.concat([self.df, new_keys], ignore_index=True)
+            self.write(self.df)
         return True
 
     def get_new_values(self, keys_list):
@@ -624,8 +667,12 @@ class DictRelational(object):
     def apply_to_dict(self, data_dict):
         if self.key not in data_dict.columns:
             return data_dict
-        self.read()
-        self.add_key_values(data_dict)
+        if self.shared:
+            self.add_key_values(data_dict, write=False)
+        else:
+            with FileLock('{}.lock'.format(self.full_file_path)):
+                self.read()
+                self.add_key_values(data_dict)
         data_dict = utl.data_to_type(data_dict, str_col=[self.key])
         cols = [x for x in data_dict.columns if x[-2:] != '_x']
         data_dict = data_dict[cols]
@@ -678,6 +725,9 @@ class DictConstantConfig(object):
 
     def read(self, configfile):
         self.read_raw_df(configfile)
+        self.set_constants()
+
+    def set_constants(self):
         self.filter_df()
         self.dict_col_names = self.df[dctc.DICT_COL_NAME].tolist()
         self.dict_constants = self.df.set_index(dctc.DICT_COL_NAME).to_dict()
@@ -715,10 +765,14 @@ class DictConstantConfig(object):
 
 
 class DictTranslationConfig(object):
+    fnc_types = ['Select', 'Set', 'Append']
+
     def __init__(self):
         self.csv_path = os.path.join(csv_path, dctc.filepath_tran_config)
         utl.dir_check(self.csv_path)
         self.df = pd.DataFrame()
+        self.compiled = None
+        self.compiled_df = None
 
     def read(self, configfile):
         try:
@@ -747,83 +801,243 @@ class DictTranslationConfig(object):
     def get(self):
         return self.df
 
+    def compile(self):
+        """
+        Groups the config by column into strip values, select rules and
+        replacement lookups so applying it does not rescan the config.
+
+        :return: Dictionary of column name to its compiled rules
+        """
+        compiled = {}
+        if self.df.empty:
+            return compiled
+        for col, tdf in self.df.groupby(dctc.DICT_COL_NAME, sort=False):
+            rules = {}
+            if dctc.DICT_COL_FNC in tdf.columns:
+                rules['Strip'] = self.compile_strip(tdf)
+                for fnc_type in self.fnc_types:
+                    rules[fnc_type] = self.compile_select(tdf, fnc_type)
+                tdf = tdf[tdf[dctc.DICT_COL_FNC].isnull()]
+            rules['Replace'] = tdf[[dctc.DICT_COL_VALUE,
+                                    dctc.DICT_COL_NVALUE]]
+            compiled[col] = rules
+        return compiled
+
+    def get_compiled(self):
+        if self.compiled_df is not self.df:
+            self.compiled = self.compile()
+            self.compiled_df = self.df
+        return self.compiled
+
     def apply_translation_to_dict(self, data_dict):
         if self.df.empty:
             return data_dict
-        for col in self.df[dctc.DICT_COL_NAME].unique():
+        for col, rules in self.get_compiled().items():
             if col not in data_dict.columns:
                 continue
-            tdf = self.df[self.df[dctc.DICT_COL_NAME] == col]
-            if dctc.DICT_COL_FNC in tdf.columns:
-                data_dict = self.strip_dict(tdf, col, data_dict)
-                data_dict = self.select_translation(tdf, col, data_dict)
-                data_dict = self.select_translation(tdf, col, data_dict, 'Set')
-                data_dict = self.select_translation(tdf, col, data_dict,
-                                                    'Append')
-                tdf = tdf[tdf[dctc.DICT_COL_FNC].isnull()]
-            data_dict = self.apply_translation(tdf, col, data_dict)
+            if 'Strip' in rules:
+                data_dict = self.apply_strip(rules['Strip'], col, data_dict)
+                for fnc_type in self.fnc_types:
+                    data_dict = self.apply_select(
+                        rules[fnc_type], col, data_dict, fnc_type)
+            data_dict = self.apply_translation(rules['Replace'], col,
+                                               data_dict)
         return data_dict
 
     @staticmethod
-    def select_translation(tdf, col, data_dict, fnc_type='Select'):
+    def compile_select(tdf, fnc_type='Select'):
         """
-        Does a special translation based on function type
+        Gets the rules of a function type as tuples in config order
 
         :param tdf: The translation dictionary as a df
-        :param col: The column that is being changed
-        :param data_dict: The dictionary (as df) that is being changed
         :param fnc_type: Select, Set or Append.
-        :return: The dictionary with the col changed if conditions match
+        :return: List of (column, selection, value, new value) tuples
         """
         if dctc.DICT_COL_SEL not in tdf.columns:
-            return data_dict
+            return []
         tdf = tdf.copy()
         tdf = utl.data_to_type(tdf, str_col=[dctc.DICT_COL_FNC])
         select_rows = tdf[dctc.DICT_COL_FNC].str.contains(fnc_type, na=False)
         tdf = tdf[select_rows].copy()
         tdf[dctc.DICT_COL_FNC] = tdf[dctc.DICT_COL_FNC].str.split('::').str[1]
-        sel = tdf[[dctc.DICT_COL_FNC, dctc.DICT_COL_SEL, dctc.DICT_COL_VALUE,
-                   dctc.DICT_COL_NVALUE]].to_dict(orient='index')
-        for s in sel:
-            col2 = sel[s][dctc.DICT_COL_FNC]
-            col2_q = sel[s][dctc.DICT_COL_SEL]
-            val = sel[s][dctc.DICT_COL_VALUE]
-            nval = sel[s][dctc.DICT_COL_NVALUE]
-            if col2 not in data_dict.columns and '||' not in col2:
-                continue
-            if fnc_type == 'Select':
-                data_dict.loc[(data_dict[col2].astype('U') == col2_q) &
-                              (data_dict[col] == val), col] = nval
-            if fnc_type == 'Set':
-                if '||' in col2:
-                    col2 = col2.split('||')
-                    col2_q = col2_q.split('||')
-                else:
-                    col2 = [col2]
-                    col2_q = [col2_q]
-                mask = pd.Series(True, index=data_dict.index)
-                for c, q in zip(col2, col2_q):
-                    if c not in data_dict.columns:
-                        mask &= False
-                    else:
-                        mask &= (data_dict[c].astype('U') == q)
-                data_dict.loc[mask, col] = nval
-            if fnc_type == 'Append':
+        tdf = tdf[[dctc.DICT_COL_FNC, dctc.DICT_COL_SEL, dctc.DICT_COL_VALUE,
+                   dctc.DICT_COL_NVALUE]]
+        return [x for x in tdf.itertuples(index=False, name=None)
+                if isinstance(x[0], str)]
+
+    @staticmethod
+    def select_translation(tdf, col, data_dict, fnc_type='Select'):
+        """
+        Does a special translation based on function type
+
+        :param tdf: The translation dictionary as a df
+        :param col: The column that is being changed
+        :param data_dict: The dictionary (as df) that is being changed
+        :param fnc_type: Select, Set or Append.
+        :return: The dictionary with the col changed if conditions match
+        """
+        rules = DictTranslationConfig.compile_select(tdf, fnc_type)
+        return DictTranslationConfig.apply_select(rules, col, data_dict,
+                                                  fnc_type)
+
+    @staticmethod
+    def apply_select(rules, col, data_dict, fnc_type='Select'):
+        """
+        Applies compiled rules of a function type in config order.  Select
+        and Set rules are grouped into batches that give the same result
+        as applying them one at a time, and each batch is matched with a
+        single index lookup per selection column.
+
+        :param rules: List of rules from compile_select
+        :param col: The column that is being changed
+        :param data_dict: The dictionary (as df) that is being changed
+        :param fnc_type: Select, Set or Append.
+        :return: The dictionary with the col changed if conditions match
+        """
+        if fnc_type == 'Select':
+            batches = DictTranslationConfig.batch_select(rules, col,
+                                                         data_dict)
+        elif fnc_type == 'Set':
+            batches = DictTranslationConfig.batch_set(rules, col, data_dict)
+        else:
+            for col2, col2_q, val, nval in rules:
+                if col2 not in data_dict.columns:
+                    continue
                 mask = ((data_dict[col2].astype('U') == col2_q) &
                         (data_dict[col].str[-len(nval):] != nval))
                 data_dict.loc[mask, col] = (data_dict.loc[mask, col] + nval)
+            return data_dict
+        for batch in batches:
+            data_dict = DictTranslationConfig.apply_batch(batch, col,
+                                                          data_dict, fnc_type)
         return data_dict
 
     @staticmethod
-    def strip_dict(tdf, col, data_dict):
+    def batch_select(rules, col, data_dict):
+        """
+        Batches select rules so no row can match two rules of a batch.  A
+        rule starts a new batch when its value is a new value of the batch
+        or is already selected on by another column.
+
+        :param rules: List of rules from compile_select
+        :param col: The column that is being changed
+        :param data_dict: The dictionary (as df) that is being changed
+        :return: List of batches, see apply_batch
+        """
+        batches = []
+        batch = {}
+        values = {}
+        new_values = set()
+        for idx, (col2, col2_q, val, nval) in enumerate(rules):
+            if (col2 not in data_dict.columns or pd.isna(col2_q) or
+                    pd.isna(val)):
+                continue
+            if val in new_values or values.get(val, col2) != col2:
+                batches.append(batch)
+                batch = {}
+                values = {}
+                new_values = set()
+            keys = batch.setdefault((col2, col), {})
+            if (col2_q, val) not in keys:
+                keys[(col2_q, val)] = (idx, nval)
+                values[val] = col2
+                new_values.add(nval)
+        batches.append(batch)
+        return batches
+
+    @staticmethod
+    def batch_set(rules, col, data_dict):
+        """
+        Batches set rules, the last matching rule winning within a batch.
+        Rules selecting on the column being set are applied on their own.
+
+        :param rules: List of rules from compile_select
+        :param col: The column that is being changed
+        :param data_dict: The dictionary (as df) that is being changed
+        :return: List of batches, see apply_batch
+        """
+        batches = []
+        batch = {}
+        for idx, (col2, col2_q, val, nval) in enumerate(rules):
+            if '||' in col2:
+                col2 = col2.split('||')
+                col2_q = str(col2_q).split('||')
+            else:
+                col2 = [col2]
+                col2_q = [col2_q]
+            col2, col2_q = zip(*zip(col2, col2_q))
+            if not all(x in data_dict.columns for x in col2):
+                continue
+            if col in col2:
+                batches.extend([batch, {col2: {col2_q: (idx, nval)}}])
+                batch = {}
+                continue
+            batch.setdefault(col2, {})[col2_q] = (idx, nval)
+        batches.append(batch)
+        return batches
+
+    @staticmethod
+    def apply_batch(batch, col, data_dict, fnc_type='Select'):
+        """
+        Matches every row against a batch of rules with one index lookup
+        per column group and sets the new value of the matching rule.  A
+        row matching rules in several groups takes the latest rule.
+
+        :param batch: Dict of column tuples to {values tuple: (rule
+            position, new value)}.  For Select the last column is col and
+            is compared without string conversion.
+        :param col: The column that is being changed
+        :param data_dict: The dictionary (as df) that is being changed
+        :param fnc_type: Select or Set.
+        :return: The dictionary with the col changed if conditions match
+        """
+        if not batch:
+            return data_dict
+        match = np.full(len(data_dict), -1)
+        size = max(x[0] for keys in batch.values() for x in keys.values())
+        new_values = np.empty(size + 1, dtype=object)
+        for cols, keys in batch.items():
+            index = pd.MultiIndex.from_tuples(list(keys))
+            order = np.array([x[0] for x in keys.values()])
+            new_values[order] = [x[1] for x in keys.values()]
+            rows = [data_dict[x].astype('U') for x in cols]
+            if fnc_type == 'Select':
+                rows[-1] = data_dict[col]
+            pos = index.get_indexer(pd.MultiIndex.from_arrays(rows))
+            match = np.maximum(match, np.where(pos >= 0, order[pos], -1))
+        mask = match >= 0
+        if mask.any():
+            data_dict.loc[mask, col] = new_values[match[mask]]
+        return data_dict
+
+    @staticmethod
+    def compile_strip(tdf):
+        """
+        Gets the strip values of a column in config order.  They are removed
+        one after another, so a removal can expose or break up a later
+        value as it did before the config was compiled.
+
+        :param tdf: The translation dictionary as a df
+        :return: List of literal strip values
+        """
         tdf = tdf.copy()
         tdf = utl.data_to_type(tdf, str_col=[dctc.DICT_COL_FNC])
         tdf = tdf[tdf[dctc.DICT_COL_FNC] == 'Strip']
+        values = [str(x) for x in tdf[dctc.DICT_COL_VALUE].unique()]
+        return [x for x in values if x]
+
+    @staticmethod
+    def apply_strip(values, col, data_dict):
         data_dict = utl.data_to_type(data_dict, str_col=[col])
-        for val in tdf[dctc.DICT_COL_VALUE].unique():
-            data_dict[col] = data_dict[col].str.replace(val, '')
+        for val in values:
+            data_dict[col] = data_dict[col].str.replace(val, '', regex=False)
         return data_dict
 
+    @staticmethod
+    def strip_dict(tdf, col, data_dict):
+        values = DictTranslationConfig.compile_strip(tdf)
+        return DictTranslationConfig.apply_strip(values, col, data_dict)
+
     @staticmethod
     def apply_translation(tdf, col, data_dict):
         tdf = tdf[[dctc.DICT_COL_VALUE, dctc.DICT_COL_NVALUE]]
@@ -846,6 +1060,96 @@ class DictTranslationConfig(object):
         self.write(self.df, configfile=dctc.filename_tran_config)
 
 
+class ConfigRegistry(object):
+    """
+    Loads the dictionary configs and relational dictionaries once for a run
+    so every data source shares them instead of reading them per source.
+    Relational dictionary key values added during the run are held in
+    memory and written by flush.  Outside a run, started with start, each
+    get reads the configs fresh as before.
+    """
+    current = None
+
+    def __init__(self):
+        self.relational_config = None
+        self.constant_df = None
+        self.constant_configs = {}
+        self.translation_config = None
+        self.relational_dicts = {}
+
+    @classmethod
+    def start(cls):
+        cls.current = cls()
+        return cls.current
+
+    @classmethod
+    def stop(cls):
+        if cls.current:
+            cls.current.flush()
+        cls.current = None
+
+    @classmethod
+    def get_relational_config(cls):
+        registry = cls.current
+        if registry and registry.relational_config:
+            return registry.relational_config
+        rc = RelationalConfig()
+        rc.read(dctc.filename_rel_config)
+        if registry:
+            registry.relational_config = rc
+        return rc
+
+    @classmethod
+    def get_constant_config(cls, parent_dict):
+        registry = cls.current
+        if not registry:
+            dcc = DictConstantConfig(parent_dict)
+            dcc.read(dctc.filename_con_config)
+            return dcc
+        if parent_dict not in registry.constant_configs:
+            dcc = DictConstantConfig(parent_dict)
+            if registry.constant_df is None:
+                dcc.read_raw_df(dctc.filename_con_config)
+                registry.constant_df = dcc.df
+            dcc.df = registry.constant_df.copy()
+            dcc.set_constants()
+            registry.constant_configs[parent_dict] = dcc
+        return registry.constant_configs[parent_dict]
+
+    @classmethod
+    def get_translation_config(cls):
+        registry = cls.current
+        if registry and registry.translation_config:
+            return registry.translation_config
+        tc = DictTranslationConfig()
+        tc.read(dctc.filename_tran_config)
+        if registry:
+            registry.translation_config = tc
+        return tc
+
+    @classmethod
+    def get_relational_dict(cls, **kwargs):
+        registry = cls.current
+        if not registry:
+            return DictRelational(**kwargs)
+        dr = registry.relational_dicts.get(kwargs[dctc.FN])
+        if not dr or dr.params != kwargs:
+            dr = DictRelational(**kwargs)
+            dr.shared = True
+            dr.read()
+            registry.relational_dicts[kwargs[dctc.FN]] = dr
+        return dr
+
+    def flush(self):
+        """
+        Writes the key values each relational dictionary gained this run.
+
+        :return: None
+        """
+        for dr in self.relational_dicts.values():
+            dr.flush()
+
+
 def dict_update():
     for filename in os.listdir(csv_path):
         logging.info('Attempting to update {}'.format(filename))
@@ -22,16 +22,37 @@ class ErrorReport(object):
         self.merge_df = None
         self.data_err = None
         self.dictionary = None
+        self.keys = None
         self.reset()
 
-    def reset(self):
+    def get_dictionary(self):
         if isinstance(self.dic, pd.DataFrame):
-            self.dictionary = self.dic
-        else:
-            self.dictionary = self.dic.get()
+            return self.dic
+        return self.dic.get()
+
+    def reset(self):
+        self.dictionary = self.get_dictionary()
         self.data_err = self.create()
         self.write(self.filename)
 
+    def add_keys(self, keys):
+        """
+        Adds newly defined keys to the dictionary index and drops them from
+        the error report, avoiding a rebuild after auto population.
+
+        :param keys: Merge column values that are now defined
+        :return: None
+        """
+        if self.keys is None:
+            self.reset()
+            return
+        self.dictionary = self.get_dictionary()
+        keys = set(keys)
+        self.keys.update(keys)
+        defined = self.data_err.iloc[:, 0].isin(keys)
+        self.data_err = self.data_err[~defined]
+        self.write(self.filename)
+
     def _dedupe_columns(self, df, label):
         """Drop duplicate column labels so pd.merge can resolve keys.
 
@@ -57,6 +78,7 @@ class ErrorReport(object):
                                      right_on=self.merge_col[1],
                                      how='left', indicator=True)
             self.merge_col = self.merge_col[0]
+            data_err = self.merge_df[self.merge_df['_merge'] == 'left_only']
         else:
             if self.merge_col not in self.df:
                 logging.warning('Full Placement Name not in {}. Delete that '
@@ -65,16 +87,12 @@ class ErrorReport(object):
             cols_to_merge = [x for x in [self.merge_col, self.pn]
                              if x in self.df.columns]
             cols_to_merge = list(dict.fromkeys(cols_to_merge))
-            self.df = utl.data_to_type(self.df, str_col=self.merge_col)
-            self.dictionary = utl.data_to_type(
-                self.dictionary, str_col=self.merge_col)
-            self.dictionary[self.merge_col] = self.dictionary[
-                self.merge_col].fillna('')
-            self.df[self.merge_col] = self.df[self.merge_col].fillna('')
-            self.merge_df = pd.merge(
-                self.df[cols_to_merge], self.dictionary,
-                on=self.merge_col, how='left', indicator=True)
-        data_err = self.merge_df[self.merge_df['_merge'] == 'left_only']
+            codes, keys = self.index_col(self.dictionary, self.merge_col)
+            self.keys = set(keys)
+            codes, keys = self.index_col(self.df, self.merge_col)
+            missing = ~keys.isin(self.keys).to_numpy()
+            data_err = self.df.loc[missing[codes], cols_to_merge].copy()
+            data_err[self.merge_col] = data_err[self.merge_col].fillna('')
         if self.pn is None:
             merge_col = [self.merge_col]
         else:
@@ -85,6 +103,20 @@ class ErrorReport(object):
         data_err = self.drop_error_df_duplicates(data_err, merge_col=merge_col)
         return data_err
 
+    @staticmethod
+    def index_col(df, col):
+        """
+        Factorizes a column so each unique value is hashed once, with empty
+        values keyed as an empty string.
+
+        :param df: Dataframe holding the column
+        :param col: Name of the column to index
+        :return: Tuple of the row codes and the unique values
+        """
+        codes, uniques = pd.factorize(df[col], use_na_sentinel=False)
+        uniques = pd.Series(uniques, dtype=object).fillna('')
+        return codes, uniques
+
     @staticmethod
     def drop_error_df_duplicates(data_err, merge_col):
         data_err = data_err[merge_col].drop_duplicates()
@@ -5,6 +5,7 @@ config_file = 'Config_File'
 translation_file = 'Translation_File'
 schema_file = 'Schema_File'
 default_format = 'Default_Format'
+stage_upload = 'Stage_Upload'
 test_file = 'Test_File'
 test_config = 'Test_Config'
 
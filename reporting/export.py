@@ -6,6 +6,8 @@ import json
 import math
 import time
 import logging
+import threading
+import contextlib
 import psycopg2
 import numpy as np
 import pandas as pd
@@ -63,7 +65,11 @@ class ExportHandler(object):
             self.export_s3(exp_key, azu.AzuApi)
 
     def export_db(self, exp_key, test=False):
-        dbu = DBUpload()
+        stage = False
+        if exc.stage_upload in self.config:
+            stage = str(self.config[exc.stage_upload][exp_key])
+            stage = stage.lower() == 'true'
+        dbu = DBUpload(stage=stage)
         output_file = exc.test_file if test else exc.output_file
         config_file = exc.test_config if test else exc.config_file
         upload_success = dbu.upload_to_db(
@@ -72,6 +78,7 @@ class ExportHandler(object):
             translation_file=self.config[exc.translation_file][exp_key],
             data_file=self.config[output_file][exp_key], test=test)
         if not upload_success:
+            dbu.db.release()
             return False
         if exp_key == exc.default_export_db_key:
             filter_val = dbu.dft.df[exc.product_name].drop_duplicates()[0]
@@ -79,6 +86,7 @@ class ExportHandler(object):
             self.create_view(dbu, filter_val, view_name)
             if not test:
                 self.update_tableau(dbu.db, view_name)
+        dbu.db.release()
         return True
 
     @staticmethod
@@ -137,8 +145,10 @@ class ExportHandler(object):
     def export_s3(self, exp_key, s3_base_class=None):
         s3_class = s3_base_class()
         db = DB(config='dbconfig.json')
-        dft_class = DFTranslation(self.config[exc.translation_file][exp_key],
-                                  self.config[exc.output_file][exp_key], db)
+        with db.connected():
+            dft_class = DFTranslation(
+                self.config[exc.translation_file][exp_key],
+                self.config[exc.output_file][exp_key], db)
         if dft_class.df.empty:
             logging.warning('Empty df stopping export.')
             return False
@@ -154,7 +164,8 @@ class ExportHandler(object):
 
 
 class DBUpload(object):
-    def __init__(self):
+    def __init__(self, stage=False):
+        self.stage = stage
         self.db = None
         self.dbs = None
         self.dft = None
@@ -175,9 +186,12 @@ class DBUpload(object):
             logging.warning('Dataframe empty stopping upload.')
             return False
         for table in self.dbs.table_list:
-            self.upload_table_to_db(table)
+            with self.db.transaction():
+                self.upload_table_to_db(table)
         logging.info(
             '{} successfully uploaded to {}'.format(data_file, self.db.db))
+        logging.info('DB connection pool: {}'.format(
+            self.db.get_pool_stats()))
         return True
 
     def upload_table_to_db(self, table):
@@ -188,6 +202,8 @@ class DBUpload(object):
         self.dbs.set_table(table)
         pk_config = {table: list(self.dbs.pk.items())[0]}
         self.set_id_info(table, pk_config, ul_df)
+        if self.stage:
+            return self.stage_table_to_db(table, ul_df)
         if exc.upload_id_col in ul_df.columns:
             where_col = exc.upload_id_col
             where_val = [int(self.dft.upload_id)]
@@ -202,6 +218,35 @@ class DBUpload(object):
         self.delete_rows(df, table)
         self.insert_rows(df, table)
 
+    def stage_table_to_db(self, table, ul_df):
+        """
+        Upserts the upload df on the server through a staging table rather
+        than reading the existing rows back to compare them in pandas.
+
+        :param table: Name of the table to upload to
+        :param ul_df: The df to upload to the table
+        :return: Dict of row counts updated, inserted and deleted
+        """
+        df = ul_df.drop_duplicates(self.name).copy()
+        if self.id_col in df.columns:
+            df = df.drop([self.id_col], axis=1)
+        nonzero_cols = []
+        for fk_table in self.dbs.fk:
+            col = self.dbs.fk[fk_table][0]
+            if col in df.columns:
+                df = self.dft.df_col_to_type(df, col, 'INT')
+                if fk_table != exc.upload_tbl:
+                    nonzero_cols.append(col)
+        set_cols = [x for x in df.columns if x not in
+                    [self.name, self.id_col, exc.upload_id_col]]
+        scope_col = None
+        scope_val = None
+        if exc.upload_id_col in df.columns:
+            scope_col = exc.upload_id_col
+            scope_val = int(self.dft.upload_id)
+        return self.db.stage_upsert(table, df, self.name, set_cols,
+                                    scope_col, scope_val, nonzero_cols)
+
     def get_upload_df(self, table):
         cols = self.dbs.get_cols_for_export(table)
         cols_to_add = []
@@ -333,8 +378,63 @@ class DBUpload(object):
         self.values = sliced_df[self.name].tolist()
 
 
+class EnginePool(object):
+    """
+    Shares one SQLAlchemy engine, and so one connection pool, per
+    connection string across every DB in the process.  Pool events count
+    the DBAPI connections opened and the checkouts that reused one.
+    """
+    engines = {}
+    stats = {}
+    lock = threading.Lock()
+    connects = 'connects'
+    checkouts = 'checkouts'
+    reused = 'reused'
+
+    @classmethod
+    def get_engine(cls, conn_string, connect_args=None):
+        connect_args = connect_args or {}
+        key = (conn_string, tuple(sorted(connect_args.items())))
+        with cls.lock:
+            if key not in cls.engines:
+                engine = sqa.create_engine(conn_string, pool_pre_ping=True,
+                                           connect_args=connect_args)
+                cls.add_listeners(engine)
+                cls.engines[key] = engine
+            return cls.engines[key]
+
+    @classmethod
+    def add_listeners(cls, engine):
+        stats = {cls.connects: 0, cls.checkouts: 0, cls.reused: 0}
+        cls.stats[engine] = stats
+
+        def on_connect(dbapi_connection, connection_record):
+            stats[cls.connects] += 1
+
+        def on_checkout(dbapi_connection, connection_record,
+                        connection_proxy):
+            stats[cls.checkouts] += 1
+            stats[cls.reused] = stats[cls.checkouts] - stats[cls.connects]
+        sqa.event.listen(engine, 'connect', on_connect)
+        sqa.event.listen(engine, 'checkout', on_checkout)
+
+    @classmethod
+    def get_stats(cls, engine):
+        return dict(cls.stats.get(engine, {}))
+
+    @classmethod
+    def dispose(cls):
+        with cls.lock:
+            for engine in cls.engines.values():
+                engine.dispose()
+            cls.engines = {}
+            cls.stats = {}
+
+
 # noinspection SqlResolve
 class DB(object):
+    connect_args = {'sslmode': 'prefer'}
+
     def __init__(self, config=None):
         self.user = None
         self.pw = None
@@ -349,6 +449,7 @@ class DB(object):
         self.cursor = None
         self.output = None
         self.conn_string = None
+        self.in_transaction = False
         self.config = config
         if self.config:
             self.input_config(self.config)
@@ -386,10 +487,32 @@ class DB(object):
                 logging.warning(item + 'not in DB config file.  Aborting.')
                 sys.exit(0)
 
+    def get_engine(self):
+        self.engine = EnginePool.get_engine(self.conn_string,
+                                            self.connect_args)
+        return self.engine
+
+    def is_connected(self):
+        if self.connection is None:
+            return False
+        return not getattr(self.connection, 'closed', False)
+
     def connect(self):
-        logging.debug('Connecting to DB at Host: ' + self.host)
-        self.engine = sqa.create_engine(self.conn_string,
-                                        connect_args={'sslmode': 'prefer'})
+        """
+        Checks a connection out of the engine's pool, or keeps the one
+        already held.  A held connection left in a failed transaction
+        outside a transaction scope is rolled back so it can be reused.
+
+        :return: None
+        """
+        if self.is_connected():
+            status = getattr(self.connection, 'get_transaction_status', None)
+            if (not self.in_transaction and status and status() ==
+                    psycopg2.extensions.TRANSACTION_STATUS_INERROR):
+                self.connection.rollback()
+            return None
+        logging.debug('Connecting to DB at Host: {}'.format(self.host))
+        self.get_engine()
         try:
             self.connection = self.engine.raw_connection()
         except AssertionError:
@@ -400,6 +523,74 @@ class DB(object):
             self.connect()
         self.cursor = self.connection.cursor()
 
+    def release(self):
+        """
+        Returns the held connection to the pool.
+
+        :return: None
+        """
+        if self.connection is not None:
+            self.connection.close()
+        self.connection = None
+        self.cursor = None
+
+    @contextlib.contextmanager
+    def connected(self):
+        """
+        Holds a connection for the block and returns it to the pool when the
+        block exits, unless one was already held when it started.
+
+        :return: None
+        """
+        held = self.is_connected()
+        self.connect()
+        try:
+            yield self
+        finally:
+            if not held:
+                self.release()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Runs the statements in the block on one connection in a single
+        transaction, committed when the block exits and rolled back if it
+        raises.  Commits made by the DB methods inside are deferred.
+
+        :return: None
+        """
+        if self.in_transaction:
+            yield self
+            return
+        self.connect()
+        self.in_transaction = True
+        try:
+            yield self
+        except Exception:
+            self.connection.rollback()
+            raise
+        else:
+            self.connection.commit()
+        finally:
+            self.in_transaction = False
+
+    def commit(self):
+        if not self.in_transaction:
+            self.connection.commit()
+
+    def end_read(self):
+        """
+        Ends the transaction a read opened outside a transaction scope, so a
+        held connection does not sit idle in transaction between calls.
+
+        :return: None
+        """
+        if not self.in_transaction:
+            self.connection.rollback()
+
+    def get_pool_stats(self):
+        return EnginePool.get_stats(self.engine)
+
     def df_to_output(self, df):
         if sys.version_info[0] == 3:
             self.output = io.StringIO()
@@ -416,9 +607,92 @@ class DB(object):
         cur = self.connection.cursor()
         cur.execute(f'SET search_path TO {self.schema}')
         cur.copy_from(self.output, table=table, columns=columns)
-        self.connection.commit()
+        self.commit()
         cur.close()
 
+    def stage_upsert(self, table, df, key_col, set_cols, scope_col=None,
+                     scope_val=None, nonzero_cols=None):
+        """
+        Copies df into a temporary table and applies it to table in one
+        transaction.  Matching rows are updated only where a value changed,
+        missing rows are inserted and, with a scope, rows of that scope
+        not in df are deleted along with duplicated keys.
+
+        :param table: Name of the table to upsert into
+        :param df: The rows to upsert
+        :param key_col: Column matching df rows to table rows
+        :param set_cols: Columns to update on matching rows
+        :param scope_col: Column limiting matches and deletes to scope_val
+        :param scope_val: Value of scope_col the upload owns
+        :param nonzero_cols: Columns that must be non zero to insert a row
+        :return: Dict of row counts updated, inserted and deleted
+        """
+        self.connect()
+        stage = 'stage_{}'.format(table)
+        target = '{}.{}'.format(self.schema, table)
+        columns = list(df.columns)
+        match = 't.{0} = s.{0}'.format(key_col)
+        scope = ''
+        if scope_col:
+            scope = 't.{} = %(scope)s'.format(scope_col)
+            match = '{} AND {}'.format(match, scope)
+        params = {'scope': scope_val}
+        commands = {}
+        if scope_col:
+            commands['duplicate'] = """
+                DELETE FROM {0} AS t
+                 WHERE {1} AND t.{2} IN (
+                    SELECT t.{2} FROM {0} AS t
+                     WHERE {1} GROUP BY t.{2} HAVING count(*) > 1)
+                """.format(target, scope, key_col)
+        if set_cols:
+            set_script = ', '.join('{0} = s.{0}'.format(x) for x in set_cols)
+            commands['update'] = """
+                UPDATE {0} AS t
+                   SET {1}
+                  FROM {2} AS s
+                 WHERE {3} AND ({4}) IS DISTINCT FROM ({5})
+                """.format(target, set_script, stage, match,
+                           ', '.join('t.{}'.format(x) for x in set_cols),
+                           ', '.join('s.{}'.format(x) for x in set_cols))
+        insert_where = ['NOT EXISTS (SELECT 1 FROM {} AS t WHERE {})'.format(
+            target, match)]
+        insert_where += ['s.{} <> 0'.format(x) for x in nonzero_cols or []]
+        commands['insert'] = """
+            INSERT INTO {0} ({1})
+            SELECT {2} FROM {3} AS s
+             WHERE {4}
+            ON CONFLICT DO NOTHING
+            """.format(target, ', '.join(columns),
+                       ', '.join('s.{}'.format(x) for x in columns), stage,
+                       ' AND '.join(insert_where))
+        if scope_col:
+            commands['delete'] = """
+                DELETE FROM {0} AS t
+                 WHERE {1} AND NOT EXISTS (
+                    SELECT 1 FROM {2} AS s WHERE s.{3} = t.{3})
+                """.format(target, scope, stage, key_col)
+        counts = {}
+        try:
+            self.cursor.execute('DROP TABLE IF EXISTS {}'.format(stage))
+            self.cursor.execute("""
+                CREATE TEMP TABLE {0} ON COMMIT DROP AS
+                SELECT {1} FROM {2} WITH NO DATA
+                """.format(stage, ', '.join(columns), target))
+            self.df_to_output(df)
+            self.cursor.copy_from(self.output, table=stage, columns=columns)
+            for name, command in commands.items():
+                self.cursor.execute(command, params)
+                counts[name] = self.cursor.rowcount
+            self.commit()
+        except psycopg2.Error:
+            if not self.in_transaction:
+                self.connection.rollback()
+            raise
+        logging.info('Staged {} row(s) to {}: {}'.format(
+            len(df), table, counts))
+        return counts
+
     def insert_rds(self, table, columns, values, return_col):
         self.connect()
         command = """
@@ -428,7 +702,7 @@ class DB(object):
                   """.format(self.schema, table, ', '.join(columns),
                              ', '.join(['%s'] * len(values)), return_col)
         self.cursor.execute(command, values)
-        self.connection.commit()
+        self.commit()
         data = self.cursor.fetchall()
         data = pd.DataFrame(data=data, columns=[return_col])
         return data
@@ -445,7 +719,7 @@ class DB(object):
                              where_col2,
                              ', '.join(['%s'] * len(where_vals2)))
         self.cursor.execute(command, where_vals2)
-        self.connection.commit()
+        self.commit()
 
     def read_rds_two_where(self, table, select_col, where_col, where_val,
                            where_col2, where_val2):
@@ -466,6 +740,7 @@ class DB(object):
                                  where_col2, where_val2)
         self.cursor.execute(command, where_val)
         data = self.cursor.fetchall()
+        self.end_read()
         if select_col == where_col:
             data = pd.DataFrame(data=data, columns=[select_col])
         else:
@@ -490,6 +765,7 @@ class DB(object):
                                  ', '.join(['%s'] * len(where_val)))
         self.cursor.execute(command, where_val)
         data = self.cursor.fetchall()
+        self.end_read()
         if select_col == where_col:
             data = pd.DataFrame(data=data, columns=[select_col])
         else:
@@ -507,6 +783,7 @@ class DB(object):
         self.cursor.execute(command, where_val)
         columns = [i[0] for i in self.cursor.description]
         data = self.cursor.fetchall()
+        self.end_read()
         data = pd.DataFrame(data=data, columns=columns)
         return data
 
@@ -527,7 +804,7 @@ class DB(object):
                              ', '.join([where_col] + set_cols),
                              where_col)
         self.cursor.execute(command, set_vals)
-        self.connection.commit()
+        self.commit()
 
     def update_rows_two_where(self, table, set_cols, set_vals, where_col,
                               where_col2, where_val2):
@@ -548,7 +825,7 @@ class DB(object):
                              ', '.join([where_col] + set_cols),
                              where_col, where_col2, where_val2)
         self.cursor.execute(command, set_vals)
-        self.connection.commit()
+        self.commit()
 
     @staticmethod
     def read_file(filename):
@@ -563,6 +840,7 @@ class DB(object):
         self.cursor.execute(command)
         data = self.cursor.fetchall()
         columns = [i[0] for i in self.cursor.description]
+        self.end_read()
         df = pd.DataFrame(data=data, columns=columns)
         return df
 
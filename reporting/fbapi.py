@@ -13,6 +13,7 @@ import reporting.gsapi as gsapi
 import reporting.vendormatrix as matrix
 import reporting.vmcolumns as vmc
 from facebook_business.api import FacebookAdsApi
+from facebook_business.session import FacebookSession
 from facebook_business.adobjects.adaccount import AdAccount
 from facebook_business.exceptions import FacebookRequestError,\
     FacebookBadObjectError
@@ -78,12 +79,17 @@ config_path = utl.config_path
 
 class FbApi(object):
     default_config_file_name = 'fbconfig.json'
+    batch_size = 50
+    min_poll_interval = 5
+    max_poll_interval = 30
+    poll_backoff = 1.5
 
     def __init__(self):
         self.df = pd.DataFrame()
         self.configfile = None
         self.config = None
         self.account = None
+        self.api = None
         self.app_id = None
         self.app_secret = None
         self.access_token = None
@@ -93,14 +99,29 @@ class FbApi(object):
         self.date_lists = None
         self.field_lists = None
         self.async_requests = []
+        self.poll_interval = self.min_poll_interval
+        self.cancelled = False
 
     def input_config(self, config):
         logging.info('Loading Facebook config file: {}'.format(config))
         self.configfile = os.path.join(config_path, config)
         self.load_config()
         self.check_config()
-        FacebookAdsApi.init(self.app_id, self.app_secret, self.access_token)
-        self.account = AdAccount(self.config['act_id'])
+        self.init_api()
+        self.account = AdAccount(self.config['act_id'], api=self.api)
+
+    def init_api(self):
+        """
+        Builds an API for this instance's credentials.  Every request this
+        instance makes goes through it rather than the process wide default,
+        so instances pulling at once each use their own credentials.
+
+        :return: The FacebookAdsApi
+        """
+        session = FacebookSession(self.app_id, self.app_secret,
+                                  self.access_token)
+        self.api = FacebookAdsApi(session)
+        return self.api
 
     def load_config(self):
         try:
@@ -210,7 +231,7 @@ class FbApi(object):
                 self.nested_dicts_to_cols(col)
         self.df = self.rename_cols()
         if screenshots:
-            previews = FacebookScreenshots(df=self.df)
+            previews = FacebookScreenshots(df=self.df, api=self.api)
             previews.get_and_take_screenshots()
         return self.df
 
@@ -225,6 +246,8 @@ class FbApi(object):
                                     time_breakdown, level)
         else:
             for date_list in self.date_lists:
+                if self.cancelled:
+                    break
                 sd = date_list[0]
                 ed = date_list[-1]
                 self.request_for_fields(sd, ed, date_list, fields, breakdowns,
@@ -337,75 +360,150 @@ class FbApi(object):
             fb_request.time_breakdown, fb_request.level,
             fb_request.times_requested + 1)
 
-    def check_and_get_async_jobs(self, async_jobs):
+    def get_reports(self, async_jobs):
+        """
+        Gets the status of async jobs in batched calls of batch_size,
+        falling back to get_report for any job whose batched call failed.
+
+        :param async_jobs: List of AdReportRun objects
+        :return: Dictionary of job id to its status
+        """
+        reports = {}
+
+        def add_report(response):
+            report = response.json()
+            reports[report['id']] = report
+        for idx in range(0, len(async_jobs), self.batch_size):
+            batch_jobs = async_jobs[idx:idx + self.batch_size]
+            if self.api and len(batch_jobs) > 1:
+                batch = self.api.new_batch()
+                for ar in batch_jobs:
+                    ar.api_get(batch=batch, success=add_report)
+                try:
+                    batch.execute()
+                except (FacebookRequestError,
+                        requests.exceptions.RequestException) as e:
+                    logging.warning('FB batch status request failed, '
+                                    'requesting jobs singly: {}'.format(e))
+            for ar in batch_jobs:
+                if ar['id'] not in reports:
+                    reports[ar['id']] = self.get_report(ar)
+        return reports
+
+    def get_async_job_result(self, ar, fb_request):
+        """
+        Gets the rows of a completed async job.  Failed requests are put back
+        in async_requests to be retried on the next poll.
+
+        :param ar: The completed AdReportRun
+        :param fb_request: The FacebookRequest that made the job
+        :return: List of rows or None if the result could not be retrieved
+        """
+        complete_job = None
+        try:
+            complete_job = list(ar.get_result())
+        except FacebookRequestError as e:
+            self.request_error(e)
+            self.async_requests.append(fb_request)
+        except FacebookBadObjectError as e:
+            logging.warning('Facebook Bad Object Error: {}'.format(e))
+            self.async_requests.append(fb_request)
+        except requests.exceptions.SSLError as e:
+            logging.warning('Warning SSLError as follows {}'.format(e))
+            self.async_requests.append(fb_request)
+        return complete_job
+
+    def check_async_jobs(self, async_jobs):
+        """
+        Polls every async job once, resetting stuck or missing jobs and
+        collecting the rows of completed jobs.  Jobs still running are put in
+        async_requests.
+
+        :param async_jobs: List of FacebookRequest objects to poll
+        :return: Tuple of list of completed dfs and whether any job progressed
+        """
         self.async_requests = []
+        dfs = []
+        progressed = False
+        jobs = {}
         for fb_request in async_jobs:
             try:
-                job = fb_request.insights
-            except AttributeError as e:
+                jobs[id(fb_request)] = AdReportRun(
+                    fb_request.insights['id'], api=self.api)
+            except (AttributeError, TypeError) as e:
                 logging.warning(
                     'A FB async_job does not contain insights and will '
                     'be requested again.  This is request #{} Error: {}'.format(
                         fb_request.times_requested, e))
                 self.reset_report_request(fb_request)
+        reports = self.get_reports(list(jobs.values()))
+        for fb_request in async_jobs:
+            if id(fb_request) not in jobs:
                 continue
-            ar = AdReportRun(job['id'])
-            report = self.get_report(ar)
+            ar = jobs[id(fb_request)]
+            report = reports[ar['id']]
             percent = report['async_percent_completion']
-            need_reset = fb_request.check_last_percent(percent)
+            if percent != fb_request.last_percent:
+                progressed = True
+            need_reset = fb_request.check_last_percent(
+                percent, self.poll_interval / self.max_poll_interval)
             if need_reset:
                 logging.warning(
                     'FB async_job #{} has been stuck for {} attempts and will '
                     'be requested again.  This is request #{}'.format(
-                        job['id'], fb_request.times_requested * 10,
+                        ar['id'], fb_request.times_requested * 10,
                         fb_request.times_requested))
                 self.reset_report_request(fb_request)
                 continue
             logging.info('FB async_job #{} percent done '
-                         '{}%'.format(job['id'], percent))
+                         '{}%'.format(ar['id'], percent))
             if percent == 100 and (report['async_status'] == 'Job Completed'):
-                try:
-                    complete_job = list(ar.get_result())
-                except FacebookRequestError as e:
-                    self.request_error(e)
-                    self.async_requests.append(fb_request)
-                    complete_job = None
-                except FacebookBadObjectError as e:
-                    logging.warning('Facebook Bad Object Error: {}'.format(e))
-                    self.async_requests.append(fb_request)
-                    complete_job = None
-                except requests.exceptions.SSLError as e:
-                    logging.warning('Warning SSLError as follows {}'.format(e))
-                    self.async_requests.append(fb_request)
-                    complete_job = None
-                    time.sleep(30)
+                complete_job = self.get_async_job_result(ar, fb_request)
                 if complete_job:
-                    self.df = pd.concat([self.df, pd.DataFrame(complete_job)],
-                                        ignore_index=True)
+                    dfs.append(pd.DataFrame(complete_job))
                     fb_request.complete = True
+                    progressed = True
             else:
                 self.async_requests.append(fb_request)
-        if self.async_requests:
-            time.sleep(30)
-            self.check_and_get_async_jobs(self.async_requests)
-
-    def get_all_async_jobs(self, async_jobs):
-        for async_job in async_jobs:
-            percent = self.get_async_job_percent(async_job)
-            while percent < 100 and type(percent) is int:
-                percent = self.get_async_job_percent(async_job)
-            complete_job = list(async_job.get_result())
-            if complete_job:
-                self.df = pd.concat([self.df, complete_job], ignore_index=True)
+        return dfs, progressed
 
-    @staticmethod
-    def get_async_job_percent(async_job):
-        job = async_job.api_get()
-        percent = job['async_percent_completion']
-        logging.info('FB async_job #{}'' percent done:'
-                     '{}%'.format(async_job['id'], percent))
-        time.sleep(30)
-        return percent
+    def check_and_get_async_jobs(self, async_jobs):
+        """
+        Polls async jobs until all are complete.  The wait between polls
+        starts at min_poll_interval, grows by poll_backoff while no job
+        progresses up to max_poll_interval and resets once one does.  Stuck
+        jobs are weighted by the wait so they still reset after the same
+        time as with a fixed max_poll_interval.  The rows of all jobs are
+        concatenated to df once at the end.  Polling stops early once
+        cancelled is set, as ImportHandler does when a pull times out.
+
+        :param async_jobs: List of FacebookRequest objects to poll
+        :return: None
+        """
+        dfs = [self.df] if not self.df.empty else []
+        self.poll_interval = self.min_poll_interval
+        self.async_requests = list(async_jobs)
+        while self.async_requests:
+            if self.cancelled:
+                logging.warning('FB pull cancelled with {} async_jobs '
+                                'running.'.format(len(self.async_requests)))
+                break
+            new_dfs, progressed = self.check_async_jobs(self.async_requests)
+            dfs.extend(new_dfs)
+            if not self.async_requests:
+                break
+            if progressed:
+                self.poll_interval = self.min_poll_interval
+            else:
+                self.poll_interval = min(
+                    self.poll_interval * self.poll_backoff,
+                    self.max_poll_interval)
+            logging.info('{} FB async_jobs running, checking again in '
+                         '{}s.'.format(len(self.async_requests),
+                                       round(self.poll_interval, 1)))
+            time.sleep(self.poll_interval)
+        if dfs:
+            self.df = pd.concat(dfs, ignore_index=True)
 
     def request_error(self, e, date_list=None, field_list=None):
         """
@@ -553,7 +651,7 @@ class FbApi(object):
 
     def test_connection(self, acc_col, camp_col, acc_pre):
         results = []
-        self.account = AdAccount(self.act_id)
+        self.account = AdAccount(self.act_id, api=self.api)
         fields = [
             'name',
             'objective',
@@ -614,9 +712,9 @@ class FacebookRequest(object):
         for k, v in self.init_dict.items():
             setattr(self, k, v)
 
-    def check_last_percent(self, new_percent):
+    def check_last_percent(self, new_percent, weight=1):
         if new_percent == self.last_percent:
-            self.consecutive_same_percent += 1
+            self.consecutive_same_percent += weight
         self.last_percent = new_percent
         if self.consecutive_same_percent > 10 * self.times_requested:
             return True
@@ -634,7 +732,7 @@ class FacebookScreenshots(object):
 
     def __init__(self, file_name='preview_config.csv',
                  s3config='s3config_screenshots.json',
-                 gsconfig='gsapi_screenshots.json', df=None):
+                 gsconfig='gsapi_screenshots.json', df=None, api=None):
         logging.info('Getting config from {}.'.format(file_name))
         self.file_name = file_name
         self.s3config = s3config
@@ -643,6 +741,7 @@ class FacebookScreenshots(object):
         self.s3 = None
         self.gsapi = None
         self.df = df
+        self.api = api
         self.pres_id = None
         self.ad_names_dic = {}
 
@@ -676,7 +775,7 @@ class FacebookScreenshots(object):
         cur_ad_ids = list(map(str, self.config[self.ad_id_col].to_list()))
         new_ad_ids = list(set(ad_ids) - set(cur_ad_ids))
         for ad in new_ad_ids:
-            response = AdCreative(ad).get_previews(
+            response = AdCreative(ad, api=self.api).get_previews(
                 fields=fields,
                 params=params,
             )
@@ -94,6 +94,8 @@ def load_db_config(config='steamdbconfig.json', paths=None):
 
 
 class GamesDB(exp.DB):
+    connect_args = {'sslmode': 'prefer', 'connect_timeout': CONNECT_TIMEOUT}
+
     def __init__(self, config='steamdbconfig.json'):
         super().__init__(None)
         self.session_maker = None
@@ -115,11 +117,14 @@ class GamesDB(exp.DB):
             self.host, self.port, self.db)
 
     def get_session(self):
+        """
+        Opens a session on the process-wide engine of this config, so every
+        GamesDB built from the same config shares one connection pool.
+
+        :return: A new sqlalchemy Session
+        """
         if self.engine is None:
-            self.engine = sqa.create_engine(
-                self.conn_string, pool_pre_ping=True,
-                connect_args={'sslmode': 'prefer',
-                              'connect_timeout': CONNECT_TIMEOUT})
+            self.get_engine()
         if self.session_maker is None:
             self.session_maker = sessionmaker(bind=self.engine)
         return self.session_maker()
@@ -150,6 +155,30 @@ def find_game(session, registry_slug=None, steam_appid=None,
     return None
 
 
+def find_games(session, col, values):
+    """``{value: game}`` for every ``game`` whose ``col`` is one of
+    ``values`` — one IN query in place of a :func:`find_game` per
+    value. ``col='canonical_name'`` matches lowercased names (keyed
+    lowercased), keeping the lowest gameid when a name repeats."""
+    values = {val for val in values if val not in (None, '')}
+    if not values:
+        return {}
+    if col == 'canonical_name':
+        values = {val.strip().lower() for val in values}
+        column = sqa.func.lower(gmdl.Game.canonical_name)
+    else:
+        column = getattr(gmdl.Game, col)
+    found = {}
+    query = session.query(gmdl.Game).filter(
+        column.in_(values)).order_by(gmdl.Game.gameid)
+    for game in query:
+        val = getattr(game, col)
+        if col == 'canonical_name':
+            val = val.lower()
+        found.setdefault(val, game)
+    return found
+
+
 def identity_conflict(game, fields):
     """True when ``game`` already carries a *different* value for an
     identity column about to be written — a name collision (remake,
@@ -187,6 +216,15 @@ def upsert_game(session, canonical_name, match_name=False, **fields):
         if game is not None and identity_conflict(game, fields):
             game = None
     now = dt.datetime.now(dt.timezone.utc).replace(tzinfo=None)
+    game = merge_game(session, game, canonical_name, fields, now)
+    session.flush()
+    return game
+
+
+def merge_game(session, game, canonical_name, fields, now):
+    """Write one upsert onto ``game`` (a new pending row when None):
+    ``canonical_name`` and identity columns last-writer-wins, other
+    fields only fill NULLs, ``updated_at`` touched. Not flushed."""
     if game is None:
         game = gmdl.Game(canonical_name=canonical_name, first_seen_at=now)
         session.add(game)
@@ -198,10 +236,46 @@ def upsert_game(session, canonical_name, match_name=False, **fields):
         if getattr(game, col) in (None, '') or col in GAME_IDENTITY_COLS:
             setattr(game, col, val)
     game.updated_at = now
-    session.flush()
     return game
 
 
+def upsert_games(session, games, match_name=False):
+    """Batched :func:`upsert_game` over ``[(canonical_name, fields)]``.
+
+    Identities resolve with one IN query per identity column (plus one
+    by lowercased name with ``match_name=True``) and new rows flush
+    together, so a run costs a handful of round-trips rather than a
+    few per game. Entries resolve in order against the preload and
+    the entries before them, as repeated :func:`upsert_game` calls
+    would. Returns the rows in input order (flushed, ``gameid`` set)."""
+    id_cols = GAME_IDENTITY_COLS + ('opencritic_id', 'igdb_id')
+    stored = {col: find_games(session, col,
+                              [fields.get(col) for _, fields in games])
+              for col in id_cols}
+    names = {}
+    if match_name:
+        names = find_games(session, 'canonical_name',
+                           [name for name, _ in games])
+    now = dt.datetime.now(dt.timezone.utc).replace(tzinfo=None)
+    written = []
+    for canonical_name, fields in games:
+        game = next((stored[col][fields[col]] for col in id_cols
+                     if fields.get(col) in stored[col]), None)
+        if game is None and match_name and canonical_name:
+            game = names.get(canonical_name.strip().lower())
+            if game is not None and identity_conflict(game, fields):
+                game = None
+        game = merge_game(session, game, canonical_name, fields, now)
+        for col in id_cols:
+            if getattr(game, col) not in (None, ''):
+                stored[col][getattr(game, col)] = game
+        if match_name:
+            names.setdefault(game.canonical_name.lower(), game)
+        written.append(game)
+    session.flush()
+    return written
+
+
 def upsert_fact(session, model, keys, fields):
     """Insert or update one fact row matched by its natural key.
 
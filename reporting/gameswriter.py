@@ -80,7 +80,10 @@ def event_fields(row):
 
 def write_steam_events(df, config='steamdbconfig.json'):
     """Upsert ``game`` dims + one ``game_event`` per appid for one
-    steapi run. Returns rows written (0 on any games-DB problem)."""
+    steapi run. Games resolve in bulk (:func:`gamesdb.upsert_games`)
+    and events preload per eventdate (:func:`gamesdb.upsert_facts`),
+    so round-trips stay flat as the app count grows. Returns rows
+    written (0 on any games-DB problem)."""
     if df is None or df.empty or 'appid' not in df.columns:
         return 0
     if not games_db_available(config):
@@ -92,24 +95,30 @@ def write_steam_events(df, config='steamdbconfig.json'):
     except Exception as e:
         logging.warning('Games DB unavailable - skipping write: %s', e)
         return 0
-    written = 0
-    for _, row in df.iterrows():
+    games = []
+    events = []
+    for row in df.to_dict('records'):
         if clean_val(row.get('appid')) is None:
             continue
         name = (clean_val(row.get('app_detail_name'))
                 or 'Steam app {}'.format(int(row['appid'])))
-        game = gdb.upsert_game(session, name, match_name=True,
-                               **game_fields(row))
+        games.append((name, game_fields(row)))
         eventdate = row.get('gameeventdate')
         if hasattr(eventdate, 'to_pydatetime'):
             eventdate = eventdate.to_pydatetime()
-        if eventdate is None:
-            continue
-        written += gdb.upsert_fact(
-            session, gmdl.GameEvent,
-            {'gameid': game.gameid, 'eventdate': eventdate},
-            event_fields(row))
-    if not gdb.safe_commit(session, 'Steam games write'):
-        return 0
+        events.append((eventdate, event_fields(row)))
+    with session:
+        stored = gdb.upsert_games(session, games, match_name=True)
+        by_date = {}
+        for game, (eventdate, fields) in zip(stored, events):
+            if eventdate is None:
+                continue
+            by_date.setdefault(eventdate, []).append((game.gameid, fields))
+        written = 0
+        for eventdate, rows in by_date.items():
+            written += gdb.upsert_facts(
+                session, gmdl.GameEvent, 'eventdate', eventdate, rows)
+        if not gdb.safe_commit(session, 'Steam games write'):
+            return 0
     logging.info('Games DB: %s game_event row(s) written.', written)
     return written
@@ -40,6 +40,10 @@ from pathlib import Path
 import os
 import time
 import uuid
+import queue
+import threading
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
 from filelock import FileLock
 from typing import Dict, Optional, Any, Union, List, Iterable, Generator
 import re
@@ -128,6 +132,18 @@ DBAPI_BATCHSIZE: int = 10000
     Defines how many lines are fetched for each call to fetchmany().
 """
 
+HYPER_CHUNK_ROWS: int = 5000000
+"""
+    HYPER_CHUNK_ROWS (int): Rows written to each hyper file by export_load and load_sample
+    before rolling over to a new file.  The first file is published and the rest appended.
+"""
+
+PREFETCH_BATCHES: int = 2
+"""
+    PREFETCH_BATCHES (int): How many fetchmany() batches are fetched ahead of the Hyper
+    inserter by the background fetch thread.
+"""
+
 CONFIGURATION_FILE: str = "config.yml"
 """
     CONFIGURATION_FILE (str): Defines defaults for this utility
@@ -247,6 +263,7 @@ class BaseExtractor(ABC):
         self.tableau_project_id = self._get_project_id(tableau_project)
         """
         self.dbapi_batchsize = DBAPI_BATCHSIZE
+        self.hyper_chunk_rows = HYPER_CHUNK_ROWS
         self.sql_identifier_quote = """`"""
 
     @property
@@ -420,6 +437,146 @@ class BaseExtractor(ABC):
         logger.info("The Hyper process has been shut down.")
         return path_to_database
 
+    def fetch_batches(self, cursor: Any, rows: Optional[List] = None) -> Generator[List, None, None]:
+        """
+        Yield fetchmany() batches from cursor.
+
+        The next batches are fetched on a background thread while the caller
+        consumes the current one, so database round trips overlap Hyper inserts.
+
+        cursor : A Python DBAPI v2 compliant Cursor object
+        rows (list): Rows already fetched from cursor, yielded first
+        """
+        if rows:
+            yield rows
+        batches = queue.Queue(maxsize=PREFETCH_BATCHES)
+        stop = threading.Event()
+        done = object()
+
+        def fetch():
+            try:
+                batch = cursor.fetchmany(self.dbapi_batchsize)
+                while batch and not stop.is_set():
+                    batches.put(batch)
+                    batch = cursor.fetchmany(self.dbapi_batchsize)
+                batches.put(done)
+            except Exception as e:
+                batches.put(e)
+
+        fetcher = threading.Thread(target=fetch, daemon=True)
+        fetcher.start()
+        try:
+            while True:
+                batch = batches.get()
+                if batch is done:
+                    break
+                if isinstance(batch, Exception):
+                    raise batch
+                yield batch
+        finally:
+            stop.set()
+            while fetcher.is_alive():
+                try:
+                    batches.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+
+    @staticmethod
+    def hyper_chunk_path(hyper_table_name: str, chunk: int) -> str:
+        """
+        Path of the hyper file for chunk, the first chunk keeps hyper_table_name
+        and later chunks are suffixed, e.g. Extract.hyper, Extract_1.hyper
+        """
+        if not chunk:
+            return hyper_table_name
+        path = Path(hyper_table_name)
+        return str(path.with_name("{}_{}{}".format(path.stem, chunk, path.suffix)))
+
+    def cursor_to_hyper_files(
+        self,
+        cursor: Any,
+        target_table_def: Optional[TableDefinition] = None,
+        hyper_table_name: str = "Extract",
+        chunk_rows: Optional[int] = None,
+    ) -> Generator[str, None, None]:
+        """
+        Stream query output from a cursor into one or more Hyper files.
+
+        Returns Iterable of Paths to hyper files, each yielded as soon as it is
+        complete so it can be published while the next one is written
+
+        cursor : A Python DBAPI v2 compliant Cursor object, ideally server side
+        target_table_def (TableDefinition): Schema for target extract tables
+        hyper_table_name (string): Name of the target Hyper table and first file, default=Extract
+        chunk_rows (int): Roll over to a new file every chunk_rows rows, default=None (one file)
+
+        NOTES:
+        - An empty result still yields one (empty) hyper file
+        """
+        rows = None
+        if target_table_def is None:
+            # If using a server side cursor then description may be None until first call
+            if cursor.description is None:
+                rows = cursor.fetchmany(self.dbapi_batchsize)
+            if cursor.description is None:
+                raise Exception("DBAPI Cursor did not return any schema description for query:{}".format(cursor.query))
+            target_table_def = self.hyper_table_definition(source_table=cursor.description, hyper_table_name=hyper_table_name)
+
+        with HyperProcess(telemetry=TELEMETRY) as hyper:
+            chunk = 0
+            chunk_count = 0
+            stack = None
+            connection = None
+            inserter = None
+
+            def open_chunk():
+                chunk_stack = ExitStack()
+                chunk_connection = chunk_stack.enter_context(
+                    Connection(
+                        endpoint=hyper.endpoint,
+                        database=self.hyper_chunk_path(hyper_table_name, chunk),
+                        create_mode=CreateMode.CREATE_AND_REPLACE,
+                    )
+                )
+                chunk_connection.catalog.create_schema(schema=target_table_def.table_name.schema_name)
+                chunk_connection.catalog.create_table(table_definition=target_table_def)
+                chunk_inserter = chunk_stack.enter_context(Inserter(chunk_connection, target_table_def))
+                return chunk_stack, chunk_connection, chunk_inserter
+
+            def close_chunk():
+                inserter.execute()
+                row_count = connection.execute_scalar_query(query=f"SELECT COUNT(*) FROM {target_table_def.table_name}")
+                logger.info(f"The number of rows in table {target_table_def.table_name} is {row_count}.")
+                stack.close()
+                logger.info("The connection to the Hyper file has been closed.")
+                return self.hyper_chunk_path(hyper_table_name, chunk)
+
+            try:
+                for batch in self.fetch_batches(cursor, rows):
+                    while batch:
+                        if stack is None:
+                            stack, connection, inserter = open_chunk()
+                            chunk_count = 0
+                        take = batch[: chunk_rows - chunk_count] if chunk_rows else batch
+                        inserter.add_rows(take)
+                        chunk_count += len(take)
+                        batch = batch[len(take) :]
+                        if chunk_rows and chunk_count >= chunk_rows:
+                            path_to_database = close_chunk()
+                            stack = None
+                            yield path_to_database
+                            chunk += 1
+                if stack is None and not chunk:
+                    stack, connection, inserter = open_chunk()
+                if stack is not None:
+                    path_to_database = close_chunk()
+                    stack = None
+                    yield path_to_database
+            finally:
+                if stack is not None:
+                    stack.close()
+        logger.info("The Hyper process has been shut down.")
+
     def csv_to_hyper_file(
         self,
         path_to_csv: str,
@@ -584,6 +741,7 @@ class BaseExtractor(ABC):
         sql_query: Optional[str] = None,
         source_table: Optional[str] = None,
         hyper_table_name: str = "Extract.hyper",
+        chunk_rows: Optional[int] = None,
     ) -> Generator[Path, None, None]:
         """
         Execute sql_query or export rows from source_table and write output to one or more hyper files.
@@ -597,6 +755,7 @@ class BaseExtractor(ABC):
         sql_query (string): SQL to pass to the source database
         source_table (string): Source table ref ("project ID.dataset ID.table ID")
         hyper_table_name (string): Name of the target Hyper table, default=Extract
+        chunk_rows (int): Roll over to a new hyper file every chunk_rows rows, default=None (one file)
 
         NOTES:
         - Specify either sql_query OR source_table, error if both specified
@@ -621,9 +780,49 @@ class BaseExtractor(ABC):
             logger.warning('Table does not exist: {}'.format(e))
             yield ''
             return
-        path_to_database = self.query_result_to_hyper_file(cursor=cursor, hyper_table_name=hyper_table_name)
-        yield path_to_database
-        return
+        yield from self.cursor_to_hyper_files(cursor=cursor, hyper_table_name=hyper_table_name, chunk_rows=chunk_rows)
+
+    def publish_hyper_files(
+        self,
+        paths: Iterable[str],
+        tab_ds_name: str,
+        publish_mode: TSC.Server.PublishMode = TSC.Server.PublishMode.CreateNew,
+        changeset_table_name: str = "Extract.hyper",
+    ) -> None:
+        """
+        Publish the first hyper file in paths and append the rest to the datasource.
+
+        Uploads run on a worker thread so the next file is written while the
+        previous one is sent; at most one upload is in flight.  Each file is
+        removed once uploaded.
+
+        paths (iterable): Hyper files, e.g. from query_to_hyper_files
+        tab_ds_name (string): Target datasource name
+        publish_mode: One of TSC.Server.[Overwrite|CreateNew] (default=CreateNew)
+        changeset_table_name (string): The name of the table in the appended hyper files
+        """
+
+        def upload(path_to_database, first_chunk):
+            if first_chunk:
+                self.publish_hyper_file(path_to_database, tab_ds_name, publish_mode)
+            else:
+                self.update_datasource_from_hyper_file(
+                    path_to_database=path_to_database,
+                    tab_ds_name=tab_ds_name,
+                    changeset_table_name=changeset_table_name,
+                    action="INSERT",
+                )
+            os.remove(path_to_database)
+
+        pending = None
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            for path_to_database in paths:
+                first_chunk = pending is None
+                if pending is not None:
+                    pending.result()
+                pending = executor.submit(upload, path_to_database, first_chunk)
+            if pending is not None:
+                pending.result()
 
     @log_execution_time
     def load_sample(
@@ -656,18 +855,9 @@ class BaseExtractor(ABC):
         else:
             assert source_table is not None
             sql_query = "SELECT * FROM {} LIMIT {}".format(self.quoted_sql_identifier(source_table), sample_rows)
-        first_chunk = True
-        for path_to_database in self.query_to_hyper_files(sql_query=sql_query):
-            if first_chunk:
-                self.publish_hyper_file(path_to_database, tab_ds_name, publish_mode)
-                first_chunk = False
-            else:
-                self.update_datasource_from_hyper_file(
-                    path_to_database=path_to_database,
-                    tab_ds_name=tab_ds_name,
-                    action="INSERT",
-                )
-            os.remove(path_to_database)
+        hyper_table_name = "Extract.hyper"
+        paths = self.query_to_hyper_files(sql_query=sql_query, hyper_table_name=hyper_table_name, chunk_rows=self.hyper_chunk_rows)
+        self.publish_hyper_files(paths, tab_ds_name, publish_mode, changeset_table_name=hyper_table_name)
 
     @log_execution_time
     def export_load(
@@ -688,18 +878,14 @@ class BaseExtractor(ABC):
         NOTES:
         - Specify either sql_query OR source_table, error if both specified
         """
-        first_chunk = True
-        for path_to_database in self.query_to_hyper_files(source_table=source_table, sql_query=sql_query):
-            if first_chunk:
-                self.publish_hyper_file(path_to_database, tab_ds_name, publish_mode)
-                first_chunk = False
-            else:
-                self.update_datasource_from_hyper_file(
-                    path_to_database=path_to_database,
-                    tab_ds_name=tab_ds_name,
-                    action="INSERT",
-                )
-            os.remove(path_to_database)
+        hyper_table_name = "Extract.hyper"
+        paths = self.query_to_hyper_files(
+            source_table=source_table,
+            sql_query=sql_query,
+            hyper_table_name=hyper_table_name,
+            chunk_rows=self.hyper_chunk_rows,
+        )
+        self.publish_hyper_files(paths, tab_ds_name, publish_mode, changeset_table_name=hyper_table_name)
 
     @log_execution_time
     def append_to_datasource(
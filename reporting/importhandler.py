@@ -1,115 +1,111 @@
 import os
+import json
 import time
+import hashlib
 import logging
+import importlib
+import threading
+import numpy as np
 import pandas as pd
 import datetime as dt
-import processor.reporting.fbapi as fbapi
-import processor.reporting.awapi as awapi
-import processor.reporting.twapi as twapi
-import processor.reporting.gaapi as gaapi
-import processor.reporting.nbapi as nbapi
-import processor.reporting.afapi as afapi
-import processor.reporting.scapi as scapi
-import processor.reporting.ajapi as ajapi
-import processor.reporting.dcapi as dcapi
-import processor.reporting.rsapi as rsapi
-import processor.reporting.dbapi as dbapi
-import processor.reporting.vkapi as vkapi
-import processor.reporting.rcapi as rcapi
-import processor.reporting.ttdapi as ttdapi
-import processor.reporting.szkapi as szkapi
-import processor.reporting.redapi as redapi
-import processor.reporting.dvapi as dvapi
-import processor.reporting.adkapi as adkapi
-import processor.reporting.innapi as innapi
-import processor.reporting.tikapi as tikapi
-import processor.reporting.amzapi as amzapi
-import processor.reporting.criapi as criapi
-import processor.reporting.pmapi as pmapi
-import processor.reporting.samapi as samapi
-import processor.reporting.gsapi as gsapi
-import processor.reporting.qtapi as qtapi
-import processor.reporting.yvapi as yvapi
-import processor.reporting.ssapi as ssapi
-import processor.reporting.nzapi as nzapi
-import processor.reporting.ytdapi as ytdapi
-import processor.reporting.simapi as simapi
-import processor.reporting.pixapi as pixapi
-import processor.reporting.iasapi as iasapi
-import processor.reporting.steapi as steapi
-import processor.reporting.asaapi as asaapi
-import processor.reporting.ftp as ftp
-import processor.reporting.awss3 as awss3
-import processor.reporting.azapi as azu
-import processor.reporting.export as export
+import concurrent.futures as cf
+from collections.abc import Mapping
 import processor.reporting.vmcolumns as vmc
 import processor.reporting.vendormatrix as vm
 import processor.reporting.utils as utl
 
 
 class ImportHandler(object):
+    default_api_workers = 1
+    api_workers = {vmc.api_fb_key: 4, vmc.api_tw_key: 2, vmc.api_ttd_key: 2,
+                   vmc.api_amz_key: 2, vmc.api_amd_key: 2}
+    api_timeout = 60 * 60
+    poll_interval = 5
+    api_modules = {
+        vmc.api_fb_key: ('fbapi', 'FbApi'),
+        vmc.api_aw_key: ('awapi', 'AwApi'),
+        vmc.api_goad_key: ('awapi', 'AwApi'),
+        vmc.api_tw_key: ('twapi', 'TwApi'),
+        vmc.api_ttd_key: ('ttdapi', 'TtdApi'),
+        vmc.api_ga_key: ('gaapi', 'GaApi'),
+        vmc.api_nb_key: ('nbapi', 'NbApi'),
+        vmc.api_af_key: ('afapi', 'AfApi'),
+        vmc.api_sc_key: ('scapi', 'ScApi'),
+        vmc.api_aj_key: ('ajapi', 'AjApi'),
+        vmc.api_dc_key: ('dcapi', 'DcApi'),
+        vmc.api_db_key: ('dbapi', 'DbApi'),
+        vmc.api_dvo_key: ('dbapi', 'DbApi'),
+        vmc.api_vk_key: ('vkapi', 'VkApi'),
+        vmc.api_rs_key: ('rsapi', 'RsApi'),
+        vmc.api_rc_key: ('rcapi', 'RcApi'),
+        vmc.api_szk_key: ('szkapi', 'SzkApi'),
+        vmc.api_red_key: ('redapi', 'RedApi'),
+        vmc.api_dv_key: ('dvapi', 'DvApi'),
+        vmc.api_adk_key: ('adkapi', 'AdkApi'),
+        vmc.api_inn_key: ('innapi', 'InnApi'),
+        vmc.api_tik_key: ('tikapi', 'TikApi'),
+        vmc.api_amz_key: ('amzapi', 'AmzApi'),
+        vmc.api_cri_key: ('criapi', 'CriApi'),
+        vmc.api_pm_key: ('pmapi', 'PmApi'),
+        vmc.api_sam_key: ('samapi', 'SamApi'),
+        vmc.api_gs_key: ('gsapi', 'GsApi'),
+        vmc.api_qt_key: ('qtapi', 'QtApi'),
+        vmc.api_yv_key: ('yvapi', 'YvApi'),
+        vmc.api_amd_key: ('amzapi', 'AmzApi'),
+        vmc.api_ss_key: ('ssapi', 'SsApi'),
+        vmc.api_nz_key: ('nzapi', 'NzApi'),
+        vmc.api_ytd_key: ('ytdapi', 'YtdApi'),
+        vmc.api_wal_key: ('ttdapi', 'TtdApi'),
+        vmc.api_sim_key: ('simapi', 'SimApi'),
+        vmc.api_pix_key: ('pixapi', 'PixApi'),
+        vmc.api_ias_key: ('iasapi', 'IasApi'),
+        vmc.api_ste_key: ('steapi', 'SteApi'),
+        vmc.api_asa_key: ('asaapi', 'AsaApi'),
+    }
+
     def __init__(self, args, matrix):
         self.args = args
         self.matrix = matrix
-        self.class_list = {
-            vmc.api_fb_key: fbapi.FbApi,
-            vmc.api_aw_key: awapi.AwApi,
-            vmc.api_goad_key: awapi.AwApi,
-            vmc.api_tw_key: twapi.TwApi,
-            vmc.api_ttd_key: ttdapi.TtdApi,
-            vmc.api_ga_key: gaapi.GaApi,
-            vmc.api_nb_key: nbapi.NbApi,
-            vmc.api_af_key: afapi.AfApi,
-            vmc.api_sc_key: scapi.ScApi,
-            vmc.api_aj_key: ajapi.AjApi,
-            vmc.api_dc_key: dcapi.DcApi,
-            vmc.api_db_key: dbapi.DbApi,
-            vmc.api_dvo_key: dbapi.DbApi,
-            vmc.api_vk_key: vkapi.VkApi,
-            vmc.api_rs_key: rsapi.RsApi,
-            vmc.api_rc_key: rcapi.RcApi,
-            vmc.api_szk_key: szkapi.SzkApi,
-            vmc.api_red_key: redapi.RedApi,
-            vmc.api_dv_key: dvapi.DvApi,
-            vmc.api_adk_key: adkapi.AdkApi,
-            vmc.api_inn_key: innapi.InnApi,
-            vmc.api_tik_key: tikapi.TikApi,
-            vmc.api_amz_key: amzapi.AmzApi,
-            vmc.api_cri_key: criapi.CriApi,
-            vmc.api_pm_key: pmapi.PmApi,
-            vmc.api_sam_key: samapi.SamApi,
-            vmc.api_gs_key: gsapi.GsApi,
-            vmc.api_qt_key: qtapi.QtApi,
-            vmc.api_yv_key: yvapi.YvApi,
-            vmc.api_amd_key: amzapi.AmzApi,
-            vmc.api_ss_key: ssapi.SsApi,
-            vmc.api_nz_key: nzapi.NzApi,
-            vmc.api_ytd_key: ytdapi.YtdApi,
-            vmc.api_wal_key: ttdapi.TtdApi,
-            vmc.api_sim_key: simapi.SimApi,
-            vmc.api_pix_key: pixapi.PixApi,
-            vmc.api_ias_key: iasapi.IasApi,
-            vmc.api_ste_key: steapi.SteApi,
-            vmc.api_asa_key: asaapi.AsaApi,
-        }
+        self.timed_out = set()
+        self.lock = threading.Lock()
+        self.file_locks = {}
+        self.class_list = ApiRegistry(self.api_modules)
 
     def output(self, api_df, filename, api_merge=None, first_row=None,
-               last_row=None, date_col=None, start_date=None, end_date=None):
+               last_row=None, date_col=None, start_date=None, end_date=None,
+               vk=None):
         """Writes a df to disk from an API
 
         Keyword arguments:
         api_df -- the dataframe to be written
         filename -- the name of the file to write to on disk
+        vk -- vendor key pulled, its output is dropped if it timed out
         """
         utl.dir_check(utl.raw_path)
         if '/' in filename:
             full_file = filename
         else:
             full_file = os.path.join(utl.raw_path, filename)
-        if str(api_merge) != 'nan':
-            api_df = self.merge_df(api_df, full_file, date_col, start_date,
-                                   end_date, first_row, last_row, api_merge)
-        self.write_df(api_df, full_file)
+        with self.get_file_lock(full_file):
+            if self.is_timed_out(vk):
+                logging.warning('{} finished after timing out - not '
+                                'writing output.'.format(vk))
+                return None
+            if str(api_merge) != 'nan':
+                self.merge_output(api_df, full_file, date_col, start_date,
+                                  end_date, first_row, last_row, api_merge)
+            else:
+                self.write_df(api_df, full_file)
+
+    def is_timed_out(self, vk):
+        with self.lock:
+            return vk in self.timed_out
+
+    def get_file_lock(self, full_file):
+        with self.lock:
+            if full_file not in self.file_locks:
+                self.file_locks[full_file] = threading.Lock()
+            return self.file_locks[full_file]
 
     def write_df(self, api_df, full_file, attempt=0):
         if not api_df.empty:
@@ -126,16 +122,50 @@ class ImportHandler(object):
             logging.warning('Imported df empty - '
                             'not overwriting {}.'.format(full_file))
 
-    def merge_df(self, api_df, filename, date_col, start_date, end_date,
-                 first_row, last_row, api_merge):
-        if not os.path.isfile(filename):
-            return api_df
+    def merge_output(self, api_df, full_file, date_col, start_date, end_date,
+                     first_row, last_row, api_merge):
+        """Merges an API pull into an existing raw file and writes it.
+
+        If the raw file was written by a previous merge and is unchanged
+        since, only the dates after the merge window start are replaced.
+        Otherwise the whole file is merged and rewritten sorted by date so
+        later merges can append to it.
+        """
+        if not os.path.isfile(full_file) or api_df.empty:
+            api_df = self.merge_df(api_df, full_file, date_col, start_date,
+                                   end_date, first_row, last_row, api_merge)
+            self.write_df(api_df, full_file)
+            return None
+        store = ApiMergeStore(full_file)
+        cutoff = end_date - dt.timedelta(days=api_merge)
+        if store.index:
+            new_df = self.merge_df_cleaning(api_df.copy(), first_row, last_row,
+                                            date_col, start_date, end_date)
+            if store.append(new_df, date_col[0], cutoff, last_row):
+                return None
+        df = self.merge_df_data(api_df, full_file, date_col, start_date,
+                                end_date, first_row, last_row, api_merge)
+        if not store.write(df, date_col[0], first_row, last_row):
+            df = utl.add_dummy_header(df, first_row)
+            df = utl.add_dummy_header(df, last_row, location='foot')
+            self.write_df(df, full_file)
+
+    def merge_df_data(self, api_df, filename, date_col, start_date, end_date,
+                      first_row, last_row, api_merge):
         df = utl.import_read_csv(filename)
         df = self.merge_df_cleaning(df, first_row, last_row, date_col, pd.NaT,
                                     end_date - dt.timedelta(days=api_merge))
         api_df = self.merge_df_cleaning(api_df, first_row, last_row, date_col,
                                         start_date, end_date)
         df = pd.concat([df, api_df], ignore_index=True).reset_index(drop=True)
+        return df
+
+    def merge_df(self, api_df, filename, date_col, start_date, end_date,
+                 first_row, last_row, api_merge):
+        if not os.path.isfile(filename):
+            return api_df
+        df = self.merge_df_data(api_df, filename, date_col, start_date,
+                                end_date, first_row, last_row, api_merge)
         df = utl.add_dummy_header(df, first_row)
         df = utl.add_dummy_header(df, last_row, location='foot')
         return df
@@ -187,47 +217,122 @@ class ImportHandler(object):
         api_class -- The class of API to call
         """
         for vk in key_list:
-            params = self.matrix.vendor_set(vk)
-            try:
-                api_class.input_config(params[vmc.apifile])
-            except (FileNotFoundError, SystemExit) as e:
-                logging.warning(e)
-                continue
-            start_check = self.date_check(params[vmc.startdate])
-            end_check = self.date_check(params[vmc.enddate])
-            if params[vmc.apifields] == ['nan']:
-                params[vmc.apifields] = None
-            if start_check:
-                params[vmc.startdate] = None
-            if end_check:
-                params[vmc.enddate] = None
-            params[vmc.startdate] = self.set_start(params[vmc.startdate],
-                                                   params[vmc.enddate],
-                                                   params[vmc.apimerge])
-            df = pd.DataFrame()
-            try:
-                df = api_class.get_data(sd=params[vmc.startdate],
-                                        ed=params[vmc.enddate],
-                                        fields=params[vmc.apifields])
-            except Exception as e:
-                logging.error("API error occurred", exc_info=True)
-                if hasattr(api_class, 'sw') and api_class.sw:
-                    api_class.sw.quit()
-                else:
-                    raise e
-            self.output(df, params[vmc.filename], params[vmc.apimerge],
-                        params[vmc.firstrow], params[vmc.lastrow],
-                        params[vmc.date], params[vmc.startdate],
-                        params[vmc.enddate])
+            self.api_call(vk, api_class)
+
+    def api_call(self, vk, api_class):
+        """Makes an API Call for a single vendor key and writes the output
 
-    def api_loop(self):
+        Keyword arguments:
+        vk -- Vendormatrix key to pull
+        api_class -- The class of API to call
+        """
+        params = self.matrix.vendor_set(vk)
+        try:
+            api_class.input_config(params[vmc.apifile])
+        except (FileNotFoundError, SystemExit) as e:
+            logging.warning(e)
+            return None
+        start_check = self.date_check(params[vmc.startdate])
+        end_check = self.date_check(params[vmc.enddate])
+        if params[vmc.apifields] == ['nan']:
+            params[vmc.apifields] = None
+        if start_check:
+            params[vmc.startdate] = None
+        if end_check:
+            params[vmc.enddate] = None
+        params[vmc.startdate] = self.set_start(params[vmc.startdate],
+                                               params[vmc.enddate],
+                                               params[vmc.apimerge])
+        df = pd.DataFrame()
+        try:
+            df = api_class.get_data(sd=params[vmc.startdate],
+                                    ed=params[vmc.enddate],
+                                    fields=params[vmc.apifields])
+        except Exception as e:
+            logging.error("API error occurred", exc_info=True)
+            if hasattr(api_class, 'sw') and api_class.sw:
+                api_class.sw.quit()
+            else:
+                raise e
+        self.output(df, params[vmc.filename], params[vmc.apimerge],
+                    params[vmc.firstrow], params[vmc.lastrow],
+                    params[vmc.date], params[vmc.startdate],
+                    params[vmc.enddate], vk=vk)
+
+    def api_loop(self, concurrent=False):
         """Loops through all APIs and makes function call to retrieve data.
 
+        Keyword arguments:
+        concurrent -- pulls vendor keys at once, see api_loop_concurrent
         """
-        for key, api in self.class_list.items():
-            if (self.arg_check(vmc.api_translation[key]) and
-                    self.matrix.vks[key]):
-                self.api_calls(self.matrix.vks[key], api())
+        api_keys = {key: self.class_list[key] for key in self.class_list
+                    if (self.arg_check(vmc.api_translation[key]) and
+                        self.matrix.vks[key])}
+        if concurrent:
+            self.api_loop_concurrent(api_keys)
+            return None
+        for key, api in api_keys.items():
+            self.api_calls(self.matrix.vks[key], api())
+
+    def api_call_timed(self, vk, api, start_times, api_classes):
+        api_class = api()
+        with self.lock:
+            start_times[vk] = time.time()
+            api_classes[vk] = api_class
+        self.api_call(vk, api_class)
+
+    def api_loop_concurrent(self, api_keys):
+        """Pulls vendor keys at once with a thread pool per API, so keys of
+        one API are limited to api_workers at a time while different APIs
+        run side by side.  Each key gets a new instance of its API class.
+        A key running longer than api_timeout is abandoned, its output
+        discarded and its instance's cancelled attribute set.  Python can't
+        stop a thread, so the pull only ends early if its API checks
+        cancelled between polls (FbApi does); otherwise the thread runs on
+        and the interpreter waits for it before exiting.  Any API error is
+        raised once all other keys finish.
+
+        Keyword arguments:
+        api_keys -- dictionary of API key to API class to pull
+        """
+        start_times = {}
+        api_classes = {}
+        futures = {}
+        executors = []
+        for key, api in api_keys.items():
+            workers = self.api_workers.get(key, self.default_api_workers)
+            executor = cf.ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix=key)
+            executors.append(executor)
+            for vk in self.matrix.vks[key]:
+                future = executor.submit(self.api_call_timed, vk, api,
+                                         start_times, api_classes)
+                futures[future] = vk
+        logging.info('Pulling {} vendor keys from {} APIs '
+                     'concurrently.'.format(len(futures), len(executors)))
+        errors = []
+        pending = set(futures)
+        while pending:
+            done, pending = cf.wait(pending, timeout=self.poll_interval,
+                                    return_when=cf.FIRST_COMPLETED)
+            for future in done:
+                if future.exception():
+                    errors.append(future.exception())
+            with self.lock:
+                for future in list(pending):
+                    vk = futures[future]
+                    start_time = start_times.get(vk)
+                    if (start_time and
+                            time.time() - start_time > self.api_timeout):
+                        logging.warning('{} timed out after {}s.'.format(
+                            vk, self.api_timeout))
+                        self.timed_out.add(vk)
+                        api_classes[vk].cancelled = True
+                        pending.remove(future)
+        for executor in executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+        if errors:
+            raise errors[0]
 
     def test_api_calls(self, key_list):
         """Makes an API Call to Test Connection
@@ -267,13 +372,15 @@ class ImportHandler(object):
 
     def ftp_loop(self):
         if self.arg_check('sz'):
+            import processor.reporting.ftp as ftp
             self.ftp_load(self.matrix.ftp_sz_key, ftp.FTP())
 
     def db_load(self, db_key, db_class):
         for vk in db_key:
             params = self.matrix.vendor_set(vk)
             db_class.input_config(params[vmc.apifile])
-            df = db_class.get_data(filename=params[vmc.apifields][0])
+            with db_class.connected():
+                df = db_class.get_data(filename=params[vmc.apifields][0])
             self.output(df, params[vmc.filename], params[vmc.apimerge],
                         params[vmc.firstrow], params[vmc.lastrow],
                         params[vmc.date], params[vmc.startdate],
@@ -281,6 +388,7 @@ class ImportHandler(object):
 
     def db_loop(self):
         if self.arg_check('dna'):
+            import processor.reporting.export as export
             self.db_load(self.matrix.db_dna_key, export.DB())
 
     def s3_load(self, s3_key, s3_class):
@@ -302,6 +410,7 @@ class ImportHandler(object):
 
     def s3_loop(self):
         if self.arg_check('dna'):
+            import processor.reporting.awss3 as awss3
             self.s3_load(self.matrix.s3_dna_key, awss3.S3())
 
     def azu_load(self, azu_key, azu_class):
@@ -317,4 +426,197 @@ class ImportHandler(object):
 
     def azu_loop(self):
         if self.arg_check('dna'):
+            import processor.reporting.azapi as azu
             self.azu_load(self.matrix.azu_dna_key, azu.AzuApi())
+
+
+class ApiRegistry(Mapping):
+    """
+    Maps API keys to their connector classes without importing them.  A
+    connector module, and the SDKs it pulls in, is only imported the first
+    time its class is looked up, so a run pays for the APIs it pulls.
+    """
+    package = 'processor.reporting'
+
+    def __init__(self, api_modules):
+        """
+        :param api_modules: Dict of API key to (module name, class name)
+        """
+        self.api_modules = api_modules
+        self.loaded = {}
+
+    def __getitem__(self, key):
+        if key not in self.loaded:
+            module_name, class_name = self.api_modules[key]
+            module = importlib.import_module(
+                '{}.{}'.format(self.package, module_name))
+            self.loaded[key] = getattr(module, class_name)
+        return self.loaded[key]
+
+    def __contains__(self, key):
+        return key in self.api_modules
+
+    def __iter__(self):
+        return iter(self.api_modules)
+
+    def __len__(self):
+        return len(self.api_modules)
+
+
+class ApiMergeStore(object):
+    """
+    Keeps a raw csv written by an api_merge date sorted, with an index of
+    the byte offset each date starts at.  The dates of the file act as
+    partitions, so a merge truncates the file at the first date after the
+    merge window and appends the new pull instead of reading and rewriting
+    the whole file.  The index is only trusted while the file's mtime and
+    size match it, so a file changed by anything else is merged in full.
+    """
+    file_path = os.path.join(utl.cache_path, 'merge')
+    columns = 'columns'
+    dates = 'dates'
+    data_end = 'data_end'
+    mtime = 'mtime'
+    size = 'size'
+    date_format = '%Y-%m-%d'
+
+    def __init__(self, full_file):
+        self.full_file = full_file
+        file_key = os.path.abspath(full_file).encode('utf-8')
+        file_key = hashlib.md5(file_key).hexdigest()
+        self.index_file = os.path.join(self.file_path,
+                                       '{}.json'.format(file_key))
+        self.index = self.read()
+
+    def read(self):
+        if (os.path.splitext(self.full_file)[1].lower() != '.csv' or
+                not os.path.isfile(self.index_file) or
+                not os.path.isfile(self.full_file)):
+            return None
+        try:
+            with open(self.index_file, 'r') as f:
+                index = json.load(f)
+        except (IOError, ValueError):
+            return None
+        stat = os.stat(self.full_file)
+        if (index[self.mtime] != stat.st_mtime_ns or
+                index[self.size] != stat.st_size):
+            logging.info('{} changed since last merge, merging in '
+                         'full.'.format(self.full_file))
+            return None
+        return index
+
+    def write_index(self):
+        stat = os.stat(self.full_file)
+        self.index[self.mtime] = stat.st_mtime_ns
+        self.index[self.size] = stat.st_size
+        utl.dir_check(self.file_path)
+        with open(self.index_file, 'w') as f:
+            json.dump(self.index, f)
+
+    def remove_index(self):
+        self.index = None
+        if os.path.isfile(self.index_file):
+            os.remove(self.index_file)
+
+    @staticmethod
+    def df_to_bytes(df, header=False):
+        return df.to_csv(index=False, header=header).encode('utf-8')
+
+    def write_dates(self, f, df, date_col):
+        """
+        Writes df to an open file one date at a time, recording the offset
+        each date starts at.
+
+        :param f: File opened in binary mode positioned at the end of data
+        :param df: Df to write with no null dates
+        :param date_col: Name of the date column
+        :return: None
+        """
+        df = df.sort_values(date_col, kind='stable')
+        dates = df[date_col].dt.strftime(self.date_format).to_numpy()
+        bounds = np.flatnonzero(dates[1:] != dates[:-1]) + 1
+        for start, end in zip(np.r_[0, bounds], np.r_[bounds, len(df)]):
+            self.index[self.dates].append([dates[start], f.tell()])
+            f.write(self.df_to_bytes(df.iloc[start:end]))
+
+    def write_footer(self, f, columns, last_row):
+        self.index[self.data_end] = f.tell()
+        if last_row:
+            dummy_df = pd.DataFrame(data=[columns] * last_row, columns=columns)
+            f.write(self.df_to_bytes(dummy_df))
+        f.truncate()
+
+    def write(self, df, date_col, first_row, last_row):
+        """
+        Writes a fully merged df sorted by date and indexes it.
+
+        :param df: The merged df without dummy header or footer rows
+        :param date_col: Name of the date column
+        :param first_row: Number of dummy rows to write above the data
+        :param last_row: Number of dummy rows to write below the data
+        :return: True if written, False if df could not be date indexed or
+            written
+        """
+        if (os.path.splitext(self.full_file)[1].lower() != '.csv' or
+                df.empty or date_col not in df or
+                df[date_col].dtype != 'datetime64[ns]' or
+                df[date_col].isna().any()):
+            self.remove_index()
+            return False
+        columns = list(df.columns)
+        self.index = {self.columns: [str(x) for x in columns], self.dates: []}
+        try:
+            with open(self.full_file, 'wb') as f:
+                f.write(self.df_to_bytes(df.head(0), header=True))
+                if first_row:
+                    dummy_df = pd.DataFrame(data=[columns] * first_row,
+                                            columns=columns)
+                    f.write(self.df_to_bytes(dummy_df))
+                self.write_dates(f, df, date_col)
+                self.write_footer(f, columns, last_row)
+        except IOError:
+            self.remove_index()
+            return False
+        self.write_index()
+        return True
+
+    def append(self, df, date_col, cutoff, last_row):
+        """
+        Replaces the dates after cutoff with a new pull.  Matches a full
+        merge, which keeps existing rows up to cutoff, or every row when
+        cutoff is today.
+
+        :param df: The cleaned new pull
+        :param date_col: Name of the date column
+        :param cutoff: Last date of the existing file to keep
+        :param last_row: Number of dummy rows to write below the data
+        :return: True if appended, False if a full merge is needed
+        """
+        columns = [str(x) for x in df.columns]
+        if (df.empty or columns != self.index[self.columns]
+                or df[date_col].dtype != 'datetime64[ns]'
+                or df[date_col].isna().any()):
+            return False
+        dates = self.index[self.dates]
+        offset = self.index[self.data_end]
+        keep = len(dates)
+        if cutoff.date() != dt.date.today():
+            cutoff = cutoff.strftime(self.date_format)
+            keep = next((idx for idx, x in enumerate(dates)
+                         if x[0] > cutoff), len(dates))
+            if keep < len(dates):
+                offset = dates[keep][1]
+        if keep and dates[keep - 1][0] > df[date_col].min().strftime(
+                self.date_format):
+            return False
+        logging.info('Appending {} rows to {} from {}.'.format(
+            len(df), self.full_file, df[date_col].min().date()))
+        self.index[self.dates] = dates[:keep]
+        with open(self.full_file, 'r+b') as f:
+            f.seek(offset)
+            f.truncate()
+            self.write_dates(f, df, date_col)
+            self.write_footer(f, list(df.columns), last_row)
+        self.write_index()
+        return True
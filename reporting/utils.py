@@ -5,6 +5,7 @@ import gzip
 import json
 import time
 import shutil
+import hashlib
 import random
 import base64
 import zipfile
@@ -12,7 +13,9 @@ import logging
 import requests
 import pandas as pd
 import numpy as np
+import pyarrow as pa
 import datetime as dt
+import pyarrow.compute as pc
 import urllib3.exceptions as url_ex
 import selenium.webdriver as wd
 import reporting.vmcolumns as vmc
@@ -32,6 +35,7 @@ raw_path = 'raw_data/'
 error_path = 'ERROR_REPORTS/'
 dict_path = 'dictionaries/'
 backup_path = 'backup/'
+cache_path = 'cache/'
 preview_path = './ad_previews/'
 preview_config = 'preview_config.csv'
 db_df_trans_config = 'db_df_translation.csv'
@@ -49,6 +53,10 @@ na_values = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN',
              'nan']
 sheet_name_splitter = ':::'
 tmp_file_suffix = 'TMP'
+read_cache_path = os.path.join(cache_path, 'read')
+read_cache_suffix = '.feather'
+read_cache_min_size = 1024 ** 2
+read_cache_max_size = 1024 ** 3
 
 
 def dir_check(directory):
@@ -56,6 +64,125 @@ def dir_check(directory):
         os.makedirs(directory)
 
 
+def clear_cache(path=cache_path):
+    """
+    Removes every cached file, both raw file reads and processed data sources.
+
+    :param path: The cache directory to remove
+    :return: None
+    """
+    if os.path.isdir(path):
+        logging.info('Clearing cache at {}'.format(path))
+        shutil.rmtree(path)
+
+
+def get_read_cache_file(filename, kwargs):
+    """
+    Gets the columnar cache file for a raw file read.  The name is keyed on
+    the file path and on its mtime, size and the read kwargs, so any change
+    to the file or to how it is read misses the cache.  Files under
+    dict_path are rewritten on every run so are not cached.
+
+    :param filename: Path of the file being read
+    :param kwargs: The kwargs the file is read with
+    :return: Path of the cache file or None if the file should not be cached
+    """
+    if not isinstance(filename, str) or not os.path.isfile(filename):
+        return None
+    file_path = os.path.abspath(filename)
+    if file_path.startswith(os.path.join(os.path.abspath(dict_path), '')):
+        return None
+    stat = os.stat(filename)
+    if stat.st_size < read_cache_min_size:
+        return None
+    keys = [file_path, [stat.st_mtime_ns, stat.st_size], kwargs]
+    keys = [json.dumps(x, sort_keys=True, default=str).encode('utf-8')
+            for x in keys]
+    cache_file = '_'.join(hashlib.md5(x).hexdigest() for x in keys)
+    cache_file = '{}{}'.format(cache_file, read_cache_suffix)
+    return os.path.join(read_cache_path, cache_file)
+
+
+def read_from_cache(cache_file):
+    """
+    Loads a df from the columnar cache, marking it as recently used.  Nulls
+    in text columns are restored to NaN as they were in the parsed file.
+
+    :param cache_file: Path of the cache file
+    :return: The cached df or None on a cache miss
+    """
+    if not cache_file or not os.path.isfile(cache_file):
+        return None
+    try:
+        df = pd.read_feather(cache_file)
+        os.utime(cache_file)
+    except Exception as e:
+        logging.warning('Could not read cache {}: {}'.format(cache_file, e))
+        return None
+    for col in df.columns[df.dtypes == object]:
+        df[col] = df[col].where(df[col].notna(), np.nan)
+    return df
+
+
+def write_to_cache(df, cache_file):
+    """
+    Writes a df to the columnar cache, replacing cached reads of older
+    versions of the same file and evicting the least recently used files
+    once the cache exceeds read_cache_max_size.  Dfs arrow cannot store,
+    such as columns with mixed types, are left uncached.
+
+    :param df: The df to cache
+    :param cache_file: Path of the cache file
+    :return: None
+    """
+    if not cache_file or df is None:
+        return None
+    dir_check(read_cache_path)
+    tmp_file = '{}{}{}'.format(cache_file, os.getpid(), tmp_file_suffix)
+    try:
+        df.to_feather(tmp_file)
+    except Exception as e:
+        logging.debug('Not caching {}: {}'.format(cache_file, e))
+        if os.path.isfile(tmp_file):
+            os.remove(tmp_file)
+        return None
+    os.replace(tmp_file, cache_file)
+    try:
+        evict_read_cache(cache_file)
+    except OSError as e:
+        logging.debug('Could not evict from read cache: {}'.format(e))
+
+
+def evict_read_cache(cache_file):
+    """
+    Removes cached reads of older versions of the file behind cache_file,
+    then removes the least recently used files until the cache fits in
+    read_cache_max_size.
+
+    :param cache_file: Path of the cache file just written
+    :return: None
+    """
+    path_key, state_key = os.path.basename(cache_file).split('_')[:2]
+    cache_files = []
+    for file_name in os.listdir(read_cache_path):
+        keys = file_name.split('_')
+        file_name = os.path.join(read_cache_path, file_name)
+        if (not file_name.endswith(read_cache_suffix) or
+                file_name == cache_file):
+            continue
+        if keys[0] == path_key and keys[1] != state_key:
+            os.remove(file_name)
+        else:
+            cache_files.append(file_name)
+    cache_files = sorted(cache_files, key=os.path.getmtime)
+    cache_size = (sum(os.path.getsize(x) for x in cache_files) +
+                  os.path.getsize(cache_file))
+    while cache_files and cache_size > read_cache_max_size:
+        file_name = cache_files.pop(0)
+        cache_size -= os.path.getsize(file_name)
+        os.remove(file_name)
+
+
 def import_read_csv(filename, path=None, file_check=True, error_bad='error',
                     empty_df=False, nrows=None, file_type=None):
     sheet_names = []
@@ -85,6 +212,10 @@ def import_read_csv(filename, path=None, file_check=True, error_bad='error',
         kwargs['encoding'] = 'utf-8'
         kwargs['on_bad_lines'] = error_bad
         kwargs['low_memory'] = True
+    cache_file = get_read_cache_file(filename, dict(kwargs, type=file_type))
+    df = read_from_cache(cache_file)
+    if df is not None:
+        return df
     try:
         df = read_func(filename, **kwargs)
     except UnicodeDecodeError:
@@ -106,6 +237,7 @@ def import_read_csv(filename, path=None, file_check=True, error_bad='error',
     if sheet_names:
         df = pd.concat(df, ignore_index=True, sort=True)
     df = df.rename(columns=lambda x: x.strip())
+    write_to_cache(df, cache_file)
     return df
 
 
@@ -226,6 +358,101 @@ def string_to_date(my_string):
         return my_string
 
 
+date_formats = [
+    (r'20\d{2}-\d{2}-\d{2}', '%Y-%m-%d'),
+    (r'20\d{2}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}', '%Y-%m-%d %H:%M:%S'),
+    (r'\d{1,2}/\d{1,2}/20\d{2}', '%m/%d/%Y'),
+    (r'2\d{7}', '%Y%m%d'),
+]
+excel_date_format = r'4\d{4}'
+
+
+def unique_strings_to_dates(uniques):
+    """
+    Parses an array of distinct date strings.  Strings matching a format in
+    date_formats or an excel serial in full are parsed in bulk, so a
+    trailing newline still falls through, and the rest go through
+    string_to_date.  Results match string_to_date for every string.
+
+    :param uniques: Array of distinct strings
+    :return: Object array of parsed values in the same order as uniques
+    """
+    parsed = np.empty(len(uniques), dtype=object)
+    done = np.zeros(len(uniques), dtype=bool)
+    ser = pd.Series(uniques, dtype=object)
+    for pattern, date_format in date_formats:
+        mask = ~done & ser.str.fullmatch(pattern).to_numpy(dtype=bool)
+        if not mask.any():
+            continue
+        dates = pd.to_datetime(ser[mask], format=date_format, errors='coerce')
+        valid = dates.notna().to_numpy()
+        idx = np.flatnonzero(mask)[valid]
+        parsed[idx] = dates[valid].to_numpy(dtype=object)
+        done[idx] = True
+    mask = ~done & ser.str.fullmatch(excel_date_format).to_numpy(dtype=bool)
+    if mask.any():
+        days = pd.to_timedelta(ser[mask].astype(int), unit='D')
+        dates = dt.datetime(1899, 12, 30) + days
+        parsed[mask] = dates.to_numpy(dtype=object)
+        done[mask] = True
+    for idx in np.flatnonzero(~done):
+        parsed[idx] = string_to_date(uniques[idx])
+    return parsed
+
+
+def strings_to_dates(ser):
+    """
+    Converts a series of strings to normalized datetimes with the
+    string_to_date heuristics, parsing each distinct string only once.
+
+    :param ser: Series of strings
+    :return: Series of datetime64 with the same index as ser
+    """
+    codes, uniques = pd.factorize(ser)
+    parsed = unique_strings_to_dates(np.asarray(uniques, dtype=object))
+    dates = pd.to_datetime(parsed, errors='coerce')
+    dates = pd.DatetimeIndex(dates).normalize()
+    return pd.Series(dates.take(codes), index=ser.index, name=ser.name)
+
+
+def is_float_ready(ser):
+    """
+    Checks if a series already holds numbers that can be cast straight to
+    float, so converting it does not need a round trip through strings.
+    Booleans are excluded as their string form does not parse as a number.
+
+    :param ser: Series to check
+    :return: True if the series dtype is a non-boolean numeric dtype
+    """
+    return (pd.api.types.is_numeric_dtype(ser.dtype) and
+            not pd.api.types.is_bool_dtype(ser.dtype))
+
+
+def numeric_to_float(ser):
+    """
+    Converts a series to float, stripping currency symbols and thousands
+    separators from string values.  Columns already of a numeric dtype,
+    including any converted by an earlier call, skip the string parsing.
+    Strings are cleaned and cast with arrow kernels, falling back to
+    pd.to_numeric to coerce values arrow cannot parse to NaN.
+
+    :param ser: Series to convert
+    :return: Float series with unparseable values as NaN
+    """
+    ser = ser.fillna(0)
+    if is_float_ready(ser):
+        return ser.astype(float)
+    values = pa.array(ser.astype('U').to_numpy(dtype=object), type=pa.string())
+    for char in ['$', ',']:
+        values = pc.replace_substring(values, char, '')
+    try:
+        values = pc.cast(values, pa.float64()).to_numpy(zero_copy_only=False)
+    except pa.ArrowInvalid:
+        values = values.to_numpy(zero_copy_only=False)
+        values = pd.to_numeric(values, errors='coerce')
+    return pd.Series(values, index=ser.index, name=ser.name, dtype=float)
+
+
 def data_to_type(df, float_col=None, date_col=None, str_col=None, int_col=None,
                  fill_empty=True):
     df = df.loc[:, ~df.columns.duplicated()]
@@ -240,15 +467,15 @@ def data_to_type(df, float_col=None, date_col=None, str_col=None, int_col=None,
     for col in float_col:
         if col not in df:
             continue
-        df[col] = df[col].fillna(0)
-        df[col] = df[col].astype('U')
-        df[col] = df[col].apply(lambda x: x.replace('$', ''))
-        df[col] = df[col].apply(lambda x: x.replace(',', ''))
-        df[col] = pd.to_numeric(df[col], errors='coerce')
-        df[col] = df[col].astype(float)
+        df[col] = numeric_to_float(df[col])
     for col in date_col:
         if col not in df:
             continue
+        if df[col].dtype == 'datetime64[ns]':
+            if fill_empty:
+                df[col] = df[col].fillna(pd.Timestamp(dt.date.today()))
+            df[col] = df[col].dt.normalize()
+            continue
         df[col] = df[col].replace(['1/0/1900', '1/1/1970'], '0')
         if fill_empty:
             df[col] = (
@@ -258,9 +485,7 @@ def data_to_type(df, float_col=None, date_col=None, str_col=None, int_col=None,
             )
         else:
             df[col] = df[col].fillna(pd.Timestamp('nat'))
-        df[col] = df[col].astype('U')
-        df[col] = df[col].apply(lambda x: string_to_date(x))
-        df[col] = pd.to_datetime(df[col], errors='coerce').dt.normalize()
+        df[col] = strings_to_dates(df[col].astype('U'))
     for col in str_col:
         if col not in df:
             continue
@@ -345,83 +570,180 @@ def col_removal(df, key, removal_cols, warn=True):
     return df
 
 
-def apply_rules(df, vm_rules, pre_or_post, **kwargs):
-    grouped_q_idx = {}
-    for rule in vm_rules:
-        for item in RULE_CONST:
-            if item not in vm_rules[rule].keys():
-                logging.warning('{} not in vendormatrix for rule {}.  '
-                                'The rule did not run.'.format(item, rule))
-                return df
-        metrics = kwargs[vm_rules[rule][RULE_METRIC]]
-        queries = kwargs[vm_rules[rule][RULE_QUERY]]
-        factor = kwargs[vm_rules[rule][RULE_FACTOR]]
-        if (str(metrics) == 'nan' or str(queries) == 'nan' or
-                str(factor) == 'nan'):
-            continue
-        metrics = metrics.split('::')
-        if metrics[0] != pre_or_post:
-            continue
-        set_column_to_value = False
-        if len(metrics) == 3:
-            set_column_to_value = True
-            if metrics[1] not in df.columns:
-                logging.warning(
-                    '{} not in columns setting to 0.'.format(metrics[1]))
-                df[metrics[1]] = 0
-            if metrics[2] in grouped_q_idx:
-                df.loc[~df.index.isin(grouped_q_idx[metrics[2]]),
-                       metrics[2]] = (
-                    df.loc[~df.index.isin(grouped_q_idx[metrics[2]]),
-                           metrics[1]])
-            else:
-                df[metrics[2]] = df[metrics[1]]
-            metrics[1] = metrics[2]
-        tdf = df
-        metrics = metrics[1].split('|')
-        queries = queries.split('|')
-        for query in queries:
-            query = query.split('::')
-            if len(query) == 1:
-                logging.warning('Malformed query: {} \n In rule: {} \n'
-                                'It may only have one :.  It was not used to'
-                                'filter data'.format(query, rule))
+class RuleSet(object):
+    """
+    Vendor matrix rules of a data source parsed once into metrics, query
+    filters and factors, then evaluated as boolean masks over the df.
+    Rows affected and seconds taken by each rule are kept in stats.
+    """
+    abort = 'ABORT'
+    exclude = 'EXCLUDE'
+    rule_col = 'Rule'
+    phase_col = 'Phase'
+    rows_col = 'Rows'
+    seconds_col = 'Seconds'
+
+    def __init__(self, vm_rules, **kwargs):
+        self.rules = {PRE: [], POST: []}
+        self.stats = []
+        self.compile(vm_rules, **kwargs)
+
+    def compile(self, vm_rules, **kwargs):
+        """
+        Parses the RULE_ params into a list of rules for PRE and POST.  A
+        rule missing a param stops both lists at its position.
+
+        :param vm_rules: Dict of rule number to {param: vm column}
+        :param kwargs: The vendor params holding the rule values
+        :return: None
+        """
+        for rule in vm_rules:
+            missing = [x for x in RULE_CONST if x not in vm_rules[rule]]
+            if missing:
+                for phase in self.rules:
+                    self.rules[phase].append(
+                        {self.abort: '{} not in vendormatrix for rule {}.  '
+                                     'The rule did not run.'.format(
+                                        missing[0], rule)})
                 continue
-            values = query[1].split(',')
-            if query[0] not in df:
-                logging.warning('{} not in data for rule {}.  '
-                                'The rule did not run.'.format(query[0], rule))
-                return df
-            if query[0] == vmc.date:
-                sd = string_to_date(values[0])
-                ed = string_to_date(values[1])
-                tdf = tdf.loc[(df[query[0]] >= sd) & (df[query[0]] <= ed)]
+            metrics = kwargs[vm_rules[rule][RULE_METRIC]]
+            queries = kwargs[vm_rules[rule][RULE_QUERY]]
+            factor = kwargs[vm_rules[rule][RULE_FACTOR]]
+            if (str(metrics) == 'nan' or str(queries) == 'nan' or
+                    str(factor) == 'nan'):
+                continue
+            metrics = metrics.split('::')
+            if metrics[0] not in self.rules:
+                continue
+            compiled = {'name': rule, 'factor': float(factor),
+                        'source': None, 'target': None, 'queries': []}
+            if len(metrics) == 3:
+                compiled['source'] = metrics[1]
+                compiled['target'] = metrics[2]
+                metrics[1] = metrics[2]
+            compiled['metrics'] = metrics[1].split('|')
+            for query in queries.split('|'):
+                query = query.split('::')
+                if len(query) == 1:
+                    logging.warning(
+                        'Malformed query: {} \n In rule: {} \n'
+                        'It may only have one :.  It was not used to'
+                        'filter data'.format(query, rule))
+                    continue
+                values = query[1].split(',')
+                if query[0] == vmc.date:
+                    values = [string_to_date(values[0]),
+                              string_to_date(values[1])]
+                    query_type = vmc.date
+                elif len(query) == 3 and query[2] == self.exclude:
+                    query_type = self.exclude
+                else:
+                    query_type = None
+                compiled['queries'].append((query[0], values, query_type))
+            self.rules[metrics[0]].append(compiled)
+
+    @staticmethod
+    def get_mask(df, rule):
+        """
+        Builds the boolean mask of rows matching every query of a rule.
+
+        :param df: The df the rule is applied to
+        :param rule: A compiled rule
+        :return: Numpy bool array, or None if a query column is missing
+        """
+        mask = np.ones(len(df), dtype=bool)
+        for col, values, query_type in rule['queries']:
+            if col not in df:
+                logging.warning('{} not in data for rule {}.  The rule did '
+                                'not run.'.format(col, rule['name']))
+                return None
+            if query_type == vmc.date:
+                mask &= ((df[col] >= values[0]) &
+                         (df[col] <= values[1])).to_numpy()
+            elif query_type == RuleSet.exclude:
+                mask &= ~df[col].isin(values).to_numpy()
             else:
-                if len(query) == 3 and query[2] == 'EXCLUDE':
-                    tdf = tdf.loc[~tdf[query[0]].isin(values)]
+                mask &= df[col].isin(values).to_numpy()
+        return mask
+
+    def apply(self, df, pre_or_post):
+        """
+        Applies the PRE or POST rules in order.  Metrics set from another
+        column are zeroed on rows no rule of that kind matched.
+
+        :param df: The df to apply rules to
+        :param pre_or_post: PRE or POST
+        :return: The df with rules applied
+        """
+        if df.columns.duplicated().any():
+            df = df.loc[:, ~df.columns.duplicated()]
+        grouped_mask = {}
+        for rule in self.rules[pre_or_post]:
+            if self.abort in rule:
+                logging.warning(rule[self.abort])
+                return df
+            start = time.time()
+            if rule['source']:
+                source = rule['source']
+                target = rule['target']
+                if source not in df.columns:
+                    logging.warning(
+                        '{} not in columns setting to 0.'.format(source))
+                    df[source] = 0
+                if target in grouped_mask:
+                    unset = ~grouped_mask[target]
+                    df.loc[unset, target] = df.loc[unset, source]
                 else:
-                    tdf = tdf.loc[tdf[query[0]].isin(values)]
-        q_idx = list(tdf.index.values)
-        for metric in metrics:
+                    df[target] = df[source]
+            mask = self.get_mask(df, rule)
+            if mask is None:
+                return df
+            for metric in rule['metrics']:
+                if metric not in df:
+                    logging.warning(
+                        '{} not in data for rule {}.  The rule did not '
+                        'run.'.format(metric, rule['name']))
+                    continue
+                df[metric] = numeric_to_float(df[metric])
+                df.loc[mask, metric] = df.loc[mask, metric] * rule['factor']
+                if rule['source']:
+                    if metric in grouped_mask:
+                        grouped_mask[metric] = grouped_mask[metric] | mask
+                    else:
+                        grouped_mask[metric] = mask
+            self.add_stat(rule['name'], pre_or_post, int(mask.sum()),
+                          time.time() - start)
+        for metric, mask in grouped_mask.items():
             if metric not in df:
-                logging.warning('{} not in data for rule {}.  '
-                                'The rule did not run.'.format(metric, rule))
                 continue
-            df = data_to_type(df, float_col=[metric])
-            df.loc[q_idx, metric] = (df.loc[q_idx, metric].astype(float) *
-                                     float(factor))
-            if set_column_to_value:
-                if metric not in grouped_q_idx:
-                    grouped_q_idx[metric] = q_idx
-                else:
-                    grouped_q_idx[metric].extend(q_idx)
-    for metric in grouped_q_idx:
-        if metric not in df:
-            continue
-        df.loc[~df.index.isin(grouped_q_idx[metric]), metric] = (
-                df.loc[~df.index.isin(grouped_q_idx[metric]), metric]
-                .astype(float) * 0)
-    return df
+            df.loc[~mask, metric] = df.loc[~mask, metric].astype(float) * 0
+        return df
+
+    def add_stat(self, rule, pre_or_post, rows, seconds):
+        logging.debug('Rule {} {} affected {} rows in {}s.'.format(
+            rule, pre_or_post, rows, round(seconds, 4)))
+        self.stats.append({self.rule_col: rule, self.phase_col: pre_or_post,
+                           self.rows_col: rows, self.seconds_col: seconds})
+
+    def get_stats(self):
+        return pd.DataFrame(self.stats, columns=[
+            self.rule_col, self.phase_col, self.rows_col, self.seconds_col])
+
+
+def apply_rules(df, vm_rules, pre_or_post, rule_set=None, **kwargs):
+    """
+    Applies vendor matrix rules to a df.
+
+    :param df: The df to apply rules to
+    :param vm_rules: Dict of rule number to {param: vm column}
+    :param pre_or_post: PRE or POST
+    :param rule_set: Already compiled RuleSet of these rules and params
+    :param kwargs: The vendor params holding the rule values
+    :return: The df with rules applied
+    """
+    if rule_set is None:
+        rule_set = RuleSet(vm_rules, **kwargs)
+    return rule_set.apply(df, pre_or_post)
 
 
 def add_header(df, header, first_row):
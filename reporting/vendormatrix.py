@@ -1,12 +1,16 @@
 import os
 import json
+import time
 import yaml
+import hashlib
 import urllib
 import shutil
 import logging
 import numpy as np
 import pandas as pd
 import datetime as dt
+import concurrent.futures as cf
+from contextlib import contextmanager
 import reporting.utils as utl
 import reporting.calc as cal
 import reporting.vmcolumns as vmc
@@ -30,22 +34,120 @@ class VendorMatrix(object):
         self.vm = None
         self.vm_df = pd.DataFrame()
         self.vl = []
-        self.vks = {api_key: [] for api_key in vmc.api_keys}
+        self.vks = {}
         self.ftp_sz_key = []
         self.db_dna_key = []
         self.s3_dna_key = []
         self.azu_dna_key = []
         self.vm_rules_dict = {}
+        self.vm_rule_sets = {}
         self.ven_param = None
         self.plan_omit_list = None
         self.process_omit_list = None
         self.tdf = None
         self.df = None
-        self.vm_parse()
+        self.parsed_df = None
+        self.journal = []
+        self.defer_write = False
+        self.write_pending = False
+        self.build_views()
+
+    def build_views(self, df=pd.DataFrame()):
+        """
+        Parses the vendormatrix and builds every view derived from it: the vm
+        dict, import keys, rules, omit lists and the sorted vendor list.
+
+        :param df: In memory vendormatrix to parse, read from the csv if empty
+        :return: None
+        """
+        self.vks = {api_key: [] for api_key in vmc.api_keys}
+        self.ftp_sz_key = []
+        self.db_dna_key = []
+        self.s3_dna_key = []
+        self.azu_dna_key = []
+        self.vm_rules_dict = {}
+        self.vm_rule_sets = {}
+        self.vm_parse(df)
         self.vm_import_keys()
         self.vm_rules()
         self.make_omit_lists()
         self.sort_vendor_list()
+        self.parsed_df = self.vm_df.copy()
+
+    def get_changes(self):
+        """
+        Cells of vm_df changed in memory since the views were last built.
+
+        :return: List of (vendor key, column, old value, new value) tuples, or
+            None when rows or columns were added, removed or reordered
+        """
+        old_df = self.parsed_df
+        if (old_df is None or not old_df.index.equals(self.vm_df.index) or
+                not old_df.columns.equals(self.vm_df.columns)):
+            return None
+        old_df = old_df.astype(object).where(old_df.notna(), '')
+        new_df = self.vm_df.astype(object).where(self.vm_df.notna(), '')
+        rows, cols = np.nonzero((old_df != new_df).values)
+        changes = [(new_df[vmc.vendorkey].iat[row], new_df.columns[col],
+                    old_df.iat[row, col], new_df.iat[row, col])
+                   for row, col in zip(rows, cols)]
+        return changes
+
+    def refresh(self):
+        """
+        Brings the views up to date with changes made to vm_df in memory
+        without reading the csv.  Changed rows are re-parsed into the vm dict
+        and their compiled rules dropped when a rule changed.  The vendor list
+        is only re-sorted, which stats every raw file, when a file name or
+        omit setting changed.  Changed vendor keys, rows or columns rebuild
+        every view.  Changes are added to the journal.
+
+        :return: List of changes applied, None if every view was rebuilt
+        """
+        self.vm_df = self.add_file_name_col()
+        changes = self.get_changes()
+        cols = set() if changes is None else {x[1] for x in changes}
+        if changes is None or vmc.vendorkey in cols:
+            logging.debug('Rebuilding vendormatrix views.')
+            self.journal.extend(changes or [])
+            self.build_views(self.vm_df)
+            return None
+        if not changes:
+            return changes
+        self.journal.extend(changes)
+        vks = {x[0] for x in changes}
+        rows = self.parse_vm_df(
+            self.vm_df[self.vm_df[vmc.vendorkey].isin(vks)])
+        for col, values in rows.items():
+            self.vm[col].update(values)
+        if any(x.startswith(utl.RULE_PREF) for x in cols):
+            for vk in vks:
+                self.vm_rule_sets.pop(vk, None)
+        if vmc.omit_plan in cols:
+            self.make_omit_lists()
+        if cols & {vmc.filename, vmc.omit_plan}:
+            self.sort_vendor_list()
+        else:
+            self.set_full_filename()
+        self.parsed_df = self.vm_df.copy()
+        return changes
+
+    @contextmanager
+    def deferred_write(self):
+        """
+        Holds writes of the vendormatrix csv until the block exits, so a run
+        of fixes writes the file once.
+
+        :return: This matrix
+        """
+        self.defer_write = True
+        try:
+            yield self
+        finally:
+            self.defer_write = False
+            if self.write_pending:
+                self.write_pending = False
+                self.write()
 
     @staticmethod
     def read():
@@ -57,6 +159,9 @@ class VendorMatrix(object):
         return vm
 
     def write(self):
+        if self.defer_write:
+            self.write_pending = True
+            return None
         logging.debug('Writing vendormatrix to {}.'.format(csv_full_file))
         rules = [x for x in self.vm_df.columns if 'RULE' in x]
         cols = [vmc.vendorkey] + vmc.vmkeys + rules
@@ -90,14 +195,24 @@ class VendorMatrix(object):
             self.vm_df = pd.DataFrame(columns=cols)
         self.vm = self.vm_df.copy()
         self.plan_net_check()
-        drop = self.vm.columns[self.vm.columns.str.startswith('|')]
-        self.vm = utl.col_removal(self.vm, 'vm', drop)
-        self.vm = utl.data_to_type(self.vm, [], vmc.datecol, vmc.barsplitcol)
         self.vl = self.vm[vmc.vendorkey].tolist()
+        self.vm = self.parse_vm_df(self.vm)
+
+    @staticmethod
+    def parse_vm_df(df):
+        """
+        Types the rows of a vendormatrix df into the vm dict format.
+
+        :param df: Vendormatrix rows to parse
+        :return: Dict of column to dict of vendor key to value
+        """
+        drop = df.columns[df.columns.str.startswith('|')]
+        df = utl.col_removal(df, 'vm', drop)
+        df = utl.data_to_type(df, [], vmc.datecol, vmc.barsplitcol)
         for col in vmc.barsplitcol:
-            if col in self.vm.columns:
-                self.vm[col] = self.vm[col].str.split('|')
-        self.vm = self.vm.set_index(vmc.vendorkey).to_dict()
+            if col in df.columns:
+                df[col] = df[col].str.split('|')
+        return df.set_index(vmc.vendorkey).to_dict()
 
     def vm_import_keys(self):
         for vk in self.vl:
@@ -215,14 +330,16 @@ class VendorMatrix(object):
 
     def get_data_sources(self):
         self.sort_vendor_list()
-        return [self.get_data_source(vk) for vk in self.vl]
+        vl = self.vl
+        return [self.get_data_source(vk) for vk in vl]
 
     def get_data_source(self, vk):
         try:
-            self.ven_param = self.vendor_set(vk)
+            ven_param = self.vendor_set(vk)
         except KeyError:
-            self.ven_param = self.vendor_set('{}_'.format(vk))
-        ds = DataSource(vk, self.vm_rules_dict, **self.ven_param)
+            ven_param = self.vendor_set('{}_'.format(vk))
+        ds = DataSource(vk, self.vm_rules_dict, rule_sets=self.vm_rule_sets,
+                        **ven_param)
         return ds
 
     def vendor_get(self, vk):
@@ -232,7 +349,8 @@ class VendorMatrix(object):
             self.tdf = import_plan_data(vk, self.df, self.plan_omit_list,
                                         **self.ven_param)
         else:
-            ds = DataSource(vk, self.vm_rules_dict, **self.ven_param)
+            ds = DataSource(vk, self.vm_rules_dict,
+                            rule_sets=self.vm_rule_sets, **self.ven_param)
             self.tdf = ds.import_data()
         return self.tdf
 
@@ -245,27 +363,122 @@ class VendorMatrix(object):
 
     def sort_vendor_list(self):
         self.set_full_filename()
-        self.vl = self.vm_df[vmc.vendorkey].to_list()
-        self.vl = sorted(
-            (x for x in self.vl
+        vl = self.vm_df[vmc.vendorkey].to_list()
+        vl = sorted(
+            (x for x in vl
              if x not in self.process_omit_list
              and os.path.isfile(self.vm[vmc.filename][x].
                                 split(utl.sheet_name_splitter)[0])),
             key=lambda x: os.path.getsize(self.vm[vmc.filename][x].
                                           split(utl.sheet_name_splitter)[0]))
-        self.vl.append(plan_key)
+        vl.append(plan_key)
+        self.vl = vl
+
+    def get_shared_file_groups(self, vendor_keys):
+        """
+        Groups vendor keys that write to the same dictionary or error report
+        so a single worker processes them in order.
+
+        :param vendor_keys: List of vendor keys in processing order
+        :return: List of lists of vendor keys, each in processing order
+        """
+        groups = []
+        for vk in vendor_keys:
+            files = {self.vm[col].get(vk) for col in
+                     [vmc.filenamedict, vmc.filenameerror] if col in self.vm}
+            files = {x for x in files if str(x) != 'nan'}
+            new_group = (files, [vk])
+            for group in [x for x in groups if x[0] & files]:
+                groups.remove(group)
+                new_group[0].update(group[0])
+                new_group[1].extend(group[1])
+            groups.append(new_group)
+        key_order = {vk: idx for idx, vk in enumerate(vendor_keys)}
+        groups = [sorted(x[1], key=lambda vk: key_order[vk]) for x in groups]
+        groups = sorted(groups, key=lambda x: key_order[x[0]])
+        return groups
+
+    def vendor_get_parallel(self, vendor_keys, processes):
+        """
+        Imports non plan data sources across a pool of processes.
+
+        :param vendor_keys: List of vendor keys to import
+        :param processes: Number of worker processes
+        :return: List of (df, seconds) tuples in the same order as vendor_keys
+        """
+        groups = self.get_shared_file_groups(vendor_keys)
+        logging.info('Processing {} data sources in {} groups with {} '
+                     'processes.'.format(len(vendor_keys), len(groups),
+                                         processes))
+        results = {}
+        with cf.ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = [executor.submit(
+                import_data_sources, group, self.vm_rules_dict,
+                [self.vendor_set(vk) for vk in group],
+                {vk: self.vm_rule_sets[vk] for vk in group
+                 if vk in self.vm_rule_sets})
+                for group in groups]
+            for group, future in zip(groups, futures):
+                results.update(zip(group, future.result()))
+        results = [results[vk] for vk in vendor_keys]
+        return results
+
+    def vendor_get_timed(self, vk):
+        start_time = time.time()
+        self.tdf = self.vendor_get(vk)
+        return self.tdf, time.time() - start_time
+
+    def vendor_get_all(self, vendor_keys, processes=None):
+        """
+        Imports non plan data sources sharing one set of dictionary configs,
+        writing relational dictionary additions once all are imported.
+
+        :param vendor_keys: List of vendor keys to import
+        :param processes: Number of worker processes, sequential if None
+        :return: Dictionary of vendor key to (df, seconds)
+        """
+        dct.ConfigRegistry.start()
+        try:
+            if processes and len(vendor_keys) > 1:
+                results = self.vendor_get_parallel(vendor_keys, processes)
+                results = dict(zip(vendor_keys, results))
+            else:
+                results = {vk: self.vendor_get_timed(vk) for vk in vendor_keys}
+        finally:
+            dct.ConfigRegistry.stop()
+        return results
 
-    def vm_loop(self):
+    def vm_loop(self, processes=None, incremental=False):
+        """
+        Imports every data source in the vendor matrix and combines them.
+
+        :param processes: Number of worker processes for non plan data
+            sources, runs sequentially if None
+        :param incremental: Reuse cached processed dfs for data sources
+            whose inputs have not changed since the last run
+        :return: The combined df of all data sources
+        """
         logging.info('Initializing Vendor Matrix Loop')
         self.df = pd.DataFrame(columns=[vmc.date, dctc.FPN, dctc.PN, dctc.BM])
         self.sort_vendor_list()
-        for vk in self.vl:
-            self.tdf = self.vendor_get(vk)
-            self.df = pd.concat(
-                [self.df.dropna(axis=1, how="all"),
-                 self.tdf.dropna(axis=1, how="all"),],
-                ignore_index=True,
-            )
+        vendor_keys = [x for x in self.vl if x != plan_key]
+        results = {}
+        cache = None
+        if incremental:
+            cache = DataSourceCache(self)
+            results = cache.load_sources(vendor_keys)
+        new_keys = [x for x in vendor_keys if x not in results]
+        results.update(self.vendor_get_all(new_keys, processes))
+        if cache:
+            cache.save_sources(new_keys, results, vendor_keys)
+        acc = DataSourceAccumulator()
+        for vk in vendor_keys:
+            acc.add(vk, *results.pop(vk))
+        self.df = acc.combine()
+        self.tdf, seconds = self.vendor_get_timed(plan_key)
+        acc.add(plan_key, self.tdf, seconds)
+        self.df = acc.combine()
+        acc.log_stats()
         self.df = full_placement_creation(self.df, plan_key, dctc.PFPN,
                                           self.vm[vmc.fullplacename][plan_key])
         if not os.listdir(er.csv_path):
@@ -286,8 +499,9 @@ class VendorMatrix(object):
             logging.warning('{} could not be opened.  '
                             'Final Output not updated.'.format(output_file))
 
-    def vm_loop_with_costs(self, output_file):
-        df = self.vm_loop()
+    def vm_loop_with_costs(self, output_file, processes=None,
+                           incremental=False):
+        df = self.vm_loop(processes=processes, incremental=incremental)
         df = cal.calculate_cost(df)
         self.write_output_data(df, output_file)
         return df
@@ -317,7 +531,7 @@ class ImportConfig(object):
     def import_vm(self):
         if not self.matrix:
             self.matrix = VendorMatrix(display_log=False)
-        self.matrix_df = self.matrix.read()
+        self.matrix_df = self.matrix.vm_df.copy()
         self.df = self.read()
 
     def read(self):
@@ -719,27 +933,322 @@ def ad_cost_calculation(df):
         for col in [cost_col, vmc.impressions, vmc.clicks, model_col, rate_col]:
             if col not in df:
                 df[col] = 0
-        calc_ser = (df[df[model_col].isin(cal.BUY_MODELS) &
-                       df[rate_col] != 0].
-                    apply(cal.net_cost, cost_col=cost_col,
-                          bm_col=model_col, br_col=rate_col, axis=1))
-        if not calc_ser.empty:
+        mask = (df[model_col].isin(cal.BUY_MODELS) &
+                df[rate_col] != 0).to_numpy()
+        if mask.any():
             df = utl.data_to_type(df, float_col=[cost_col])
-            df.loc[calc_ser.index, cost_col] = calc_ser
+            calc = cal.buy_model_cost(df, cost_col=cost_col, bm_col=model_col,
+                                      br_col=rate_col, mask=mask)
+            df.loc[mask, cost_col] = calc[mask]
     return df
 
 
+class DataSourceAccumulator(object):
+    key_col = 'Vendor Key'
+    rows_col = 'Rows'
+    seconds_col = 'Seconds'
+    memory_col = 'Memory (MB)'
+    total_memory_col = 'Total Memory (MB)'
+
+    def __init__(self):
+        self.dfs = []
+        self.columns = {}
+        self.stats = []
+        self.memory = 0
+        self.peak_memory = 0
+
+    @staticmethod
+    def get_memory(df):
+        return df.memory_usage(index=True, deep=False).sum() / 1024 ** 2
+
+    def add(self, vk, df, seconds=0):
+        """
+        Holds a data source df until combine is called, recording its
+        time to process and its memory footprint.
+
+        :param vk: The vendor key of the data source
+        :param df: The processed df of the data source
+        :param seconds: Time in seconds it took to process the data source
+        :return: None
+        """
+        rows = 0
+        memory = 0
+        if df is not None:
+            df = df.dropna(axis=1, how='all')
+            rows = len(df)
+            memory = self.get_memory(df)
+            self.columns.update(dict.fromkeys(df.columns))
+            self.dfs.append(df)
+        self.memory += memory
+        self.peak_memory = max(self.peak_memory, self.memory)
+        self.stats.append({self.key_col: vk, self.rows_col: rows,
+                           self.seconds_col: seconds,
+                           self.memory_col: memory,
+                           self.total_memory_col: self.memory})
+
+    def combine(self):
+        """
+        Concatenates all held dfs in a single pass.  The result replaces the
+        held dfs so more data sources can be added and combined after.
+
+        :return: The combined df
+        """
+        if not self.dfs:
+            return pd.DataFrame()
+        if len(self.dfs) == 1:
+            df = self.dfs[0].reset_index(drop=True)
+        else:
+            logging.info('Combining {} data sources with {} columns.'.format(
+                len(self.dfs), len(self.columns)))
+            df = pd.concat(self.dfs, ignore_index=True)
+        memory = self.get_memory(df)
+        self.peak_memory = max(self.peak_memory, self.memory + memory)
+        self.dfs = [df]
+        self.memory = memory
+        return df
+
+    def get_stats(self):
+        return pd.DataFrame(self.stats, columns=[
+            self.key_col, self.rows_col, self.seconds_col, self.memory_col,
+            self.total_memory_col])
+
+    def log_stats(self):
+        for stat in self.stats:
+            logging.info('{} processed {} rows in {}s using {} MB.'.format(
+                stat[self.key_col], stat[self.rows_col],
+                round(stat[self.seconds_col], 3),
+                round(stat[self.memory_col], 3)))
+        logging.info('Peak data source memory: {} MB.'.format(
+            round(self.peak_memory, 3)))
+
+
+class DataSourceCache(object):
+    file_path = os.path.join(utl.cache_path, 'processed')
+    file_name = 'manifest.json'
+    files_key = 'files'
+    sources_key = 'sources'
+    mtime = 'mtime'
+    size = 'size'
+    hash = 'hash'
+    file_suffix = '.pkl'
+    lock_suffix = '.lock'
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+        utl.dir_check(self.file_path)
+        self.full_file_path = os.path.join(self.file_path, self.file_name)
+        self.manifest = self.read()
+
+    def read(self):
+        manifest = {}
+        if os.path.isfile(self.full_file_path):
+            try:
+                with open(self.full_file_path, 'r') as f:
+                    manifest = json.load(f)
+            except (IOError, ValueError):
+                logging.warning('Could not read {}, rebuilding data source '
+                                'cache.'.format(self.full_file_path))
+        for key in [self.files_key, self.sources_key]:
+            manifest.setdefault(key, {})
+        return manifest
+
+    def write(self):
+        with open(self.full_file_path, 'w') as f:
+            json.dump(self.manifest, f)
+
+    @staticmethod
+    def hash_file(file_name, chunk_size=1024 * 1024):
+        file_hash = hashlib.md5()
+        with open(file_name, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                file_hash.update(chunk)
+        return file_hash.hexdigest()
+
+    def get_file_hash(self, file_name):
+        """
+        Hashes a file's contents, reusing the hash stored in the manifest
+        when the file's mtime and size have not changed.
+
+        :param file_name: Path of the file to hash
+        :return: The hash of the file or None if it does not exist
+        """
+        if not os.path.isfile(file_name):
+            return None
+        stat = os.stat(file_name)
+        state = self.manifest[self.files_key].get(file_name)
+        if (not state or state[self.mtime] != stat.st_mtime
+                or state[self.size] != stat.st_size):
+            state = {self.mtime: stat.st_mtime, self.size: stat.st_size,
+                     self.hash: self.hash_file(file_name)}
+            self.manifest[self.files_key][file_name] = state
+        return state[self.hash]
+
+    def get_source_files(self, ven_param):
+        """
+        Lists every file the processing of a data source reads from.
+
+        :param ven_param: The vendor matrix params of the data source
+        :return: List of file paths
+        """
+        files = [ven_param[vmc.filename].split(utl.sheet_name_splitter)[0]]
+        dict_file = ven_param.get(vmc.filenamedict)
+        if str(dict_file) != 'nan' and dict_file:
+            files.append(os.path.join(dct.csv_path, dict_file))
+        files.extend([
+            os.path.join(utl.config_path, dctc.filename_rel_config),
+            os.path.join(utl.config_path, dctc.filename_con_config),
+            os.path.join(dct.csv_path, dctc.filepath_tran_config,
+                         dctc.filename_tran_config)])
+        rel_path = os.path.join(dct.csv_path, 'Relational')
+        if os.path.isdir(rel_path):
+            files.extend(os.path.join(rel_path, x)
+                         for x in sorted(os.listdir(rel_path))
+                         if not x.endswith(self.lock_suffix))
+        transform = str(ven_param.get(vmc.transform))
+        for t in transform.split(':::'):
+            t = t.split('::')
+            if t[0] not in ['Merge', 'MergeReplace', 'MergeReplaceExclude']:
+                continue
+            if '.' in t[1]:
+                files.append(t[1])
+            elif t[1] in self.matrix.vm[vmc.filename]:
+                merge_file = self.matrix.vm[vmc.filename][t[1]]
+                files.append(merge_file.split(utl.sheet_name_splitter)[0])
+        return files
+
+    def get_fingerprint(self, vk):
+        """
+        Fingerprints a data source from its vendor matrix row, rules and the
+        contents of every file it reads.
+
+        :param vk: The vendor key of the data source
+        :return: Hex digest identifying the data source's inputs
+        """
+        ven_param = self.matrix.vendor_set(vk)
+        files = self.get_source_files(ven_param)
+        fingerprint = {
+            vmc.vendorkey: vk,
+            'params': ven_param,
+            'rules': self.matrix.vm_rules_dict,
+            self.files_key: [(x, self.get_file_hash(x)) for x in files]}
+        fingerprint = json.dumps(fingerprint, sort_keys=True, default=str)
+        return hashlib.md5(fingerprint.encode('utf-8')).hexdigest()
+
+    def get_cache_file(self, fingerprint):
+        return os.path.join(self.file_path,
+                            '{}{}'.format(fingerprint, self.file_suffix))
+
+    def load_sources(self, vendor_keys):
+        """
+        Loads the cached processed df of each data source whose fingerprint
+        matches the one stored on its last run.
+
+        :param vendor_keys: List of vendor keys to load
+        :return: Dictionary of vendor key to (df, seconds) for cache hits
+        """
+        results = {}
+        for vk in vendor_keys:
+            start_time = time.time()
+            fingerprint = self.get_fingerprint(vk)
+            if self.manifest[self.sources_key].get(vk) != fingerprint:
+                continue
+            cache_file = self.get_cache_file(fingerprint)
+            if not os.path.isfile(cache_file):
+                continue
+            try:
+                df = pd.read_pickle(cache_file)
+            except Exception as e:
+                logging.warning('Could not load cache for {}: {}'.format(
+                    vk, e))
+                continue
+            logging.info('{} unchanged, loaded from cache.'.format(vk))
+            results[vk] = (df, time.time() - start_time)
+        logging.info('Loaded {} of {} data sources from cache.'.format(
+            len(results), len(vendor_keys)))
+        return results
+
+    def remove_source(self, vk):
+        old_fingerprint = self.manifest[self.sources_key].pop(vk, None)
+        if old_fingerprint:
+            old_file = self.get_cache_file(old_fingerprint)
+            if os.path.isfile(old_file):
+                os.remove(old_file)
+
+    def save_sources(self, vendor_keys, results, matrix_keys=None):
+        """
+        Caches the processed df of each data source under the fingerprint of
+        its inputs after processing, as processing can update dictionaries.
+
+        :param vendor_keys: List of vendor keys that were processed
+        :param results: Dictionary of vendor key to (df, seconds)
+        :param matrix_keys: List of every vendor key in the matrix, cached
+            sources of keys not in it are removed
+        :return: None
+        """
+        if matrix_keys is not None:
+            removed = [x for x in self.manifest[self.sources_key]
+                       if x not in matrix_keys]
+            for vk in removed:
+                self.remove_source(vk)
+        for vk in vendor_keys:
+            self.remove_source(vk)
+            df = results[vk][0]
+            if df is None:
+                continue
+            fingerprint = self.get_fingerprint(vk)
+            df.to_pickle(self.get_cache_file(fingerprint))
+            self.manifest[self.sources_key][vk] = fingerprint
+        self.write()
+
+
+def import_data_sources(vendor_keys, vm_rules, ven_params, rule_sets=None):
+    """
+    Imports data sources in order, used as the process pool entry point.
+
+    :param vendor_keys: List of vendor keys to import
+    :param vm_rules: The vendor matrix rules dictionary
+    :param ven_params: List of vendor matrix params matching vendor_keys
+    :param rule_sets: Dictionary of vendor key to RuleSet already compiled
+    :return: List of (df, seconds) tuples in the same order as vendor_keys
+    """
+    results = []
+    dct.ConfigRegistry.start()
+    try:
+        for vk, ven_param in zip(vendor_keys, ven_params):
+            logging.info('Initializing {}'.format(vk))
+            start_time = time.time()
+            ds = DataSource(vk, vm_rules, rule_sets=rule_sets, **ven_param)
+            df = ds.import_data()
+            results.append((df, time.time() - start_time))
+    finally:
+        dct.ConfigRegistry.stop()
+    return results
+
+
 class DataSource(object):
-    def __init__(self, key, vm_rules, **ven_param):
+    def __init__(self, key, vm_rules, rule_sets=None, **ven_param):
         self.key = key
         self.vm_rules = vm_rules
         self.params = ven_param
         self.ic_params = None
         self.p = self.params
         self.df = pd.DataFrame()
+        self.rule_sets = {} if rule_sets is None else rule_sets
         for k in ven_param:
             setattr(self, k, ven_param[k])
 
+    def get_rule_set(self):
+        """
+        Returns the compiled rules of this source, compiling them on first
+        use into rule_sets, which a VendorMatrix shares between the sources
+        it builds so each key is compiled once per matrix load.
+
+        :return: RuleSet of this source
+        """
+        if self.key not in self.rule_sets:
+            self.rule_sets[self.key] = utl.RuleSet(self.vm_rules, **self.p)
+        return self.rule_sets[self.key]
+
     def get_active_metrics(self):
         active_metrics = {x: self.params[x] for x in self.params
                           if x in vmc.datacol and self.params[x] != ['nan']}
@@ -749,10 +1258,12 @@ class DataSource(object):
         if not matrix:
             matrix = VendorMatrix()
         index = matrix.vm_df[matrix.vm_df[vmc.vendorkey] == self.key].index[0]
-        matrix.vm_df.loc[index, col] = new_value
+        matrix.vm_change(index, col, new_value)
         return matrix
 
     def add_new_rule(self, new_rule, matrix=None):
+        if not matrix:
+            matrix = VendorMatrix()
         last_val = max(self.vm_rules.keys())
         vm_rule = self.vm_rules[last_val]
         vm_rule = {x: vm_rule[x].replace(last_val, str(int(last_val) + 1))
@@ -761,18 +1272,21 @@ class DataSource(object):
             self.set_in_vendormatrix(vm_rule[col], new_rule[col], matrix)
         return matrix
 
-    def get_raw_df_before_transform(self, nrows=None):
+    def get_raw_df_before_transform(self, nrows=None, raw_df=None):
         if vmc.filename not in self.p:
             return pd.DataFrame()
-        df = utl.import_read_csv(self.p[vmc.filename], nrows=nrows)
+        if raw_df is None:
+            df = utl.import_read_csv(self.p[vmc.filename], nrows=nrows)
+        else:
+            df = raw_df
         if df is None or df.empty:
             return df
         df = utl.add_header(df, self.p[vmc.header], self.p[vmc.firstrow])
         df = utl.first_last_adj(df, self.p[vmc.firstrow], self.p[vmc.lastrow])
         return df
 
-    def get_raw_df(self, nrows=None):
-        df = self.get_raw_df_before_transform(nrows=nrows)
+    def get_raw_df(self, nrows=None, raw_df=None):
+        df = self.get_raw_df_before_transform(nrows=nrows, raw_df=raw_df)
         if df is None or df.empty:
             return df
         df = df_transform(df, self.p[vmc.transform])
@@ -790,8 +1304,7 @@ class DataSource(object):
         if self.df.empty:
             return self.df
         dic = dct.Dict()
-        rc = dct.RelationalConfig()
-        rc.read(dctc.filename_rel_config)
+        rc = dct.ConfigRegistry.get_relational_config()
         rc_auto_tuple = rc.get_auto_tuple()
         err = er.ErrorReport(self.df, dic, self.p[vmc.placement],
                              self.p[vmc.filenameerror])
@@ -808,8 +1321,7 @@ class DataSource(object):
         dic = dct.Dict(self.p[vmc.filenamedict], self.key, df)
         err = er.ErrorReport(df, dic, self.p[vmc.placement],
                              self.p[vmc.filenameerror])
-        rc = dct.RelationalConfig()
-        rc.read(dctc.filename_rel_config)
+        rc = dct.ConfigRegistry.get_relational_config()
         rc_auto_tuple = rc.get_auto_tuple()
         dic.auto_functions(err=err, autodicord=self.p[vmc.autodicord],
                            placement=self.p[vmc.autodicplace],
@@ -827,7 +1339,8 @@ class DataSource(object):
         """
         df = combining_data(df, self.key, vmc.datadatecol, **self.p)
         df = utl.data_to_type(df, date_col=vmc.datadatecol)
-        df = utl.apply_rules(df, self.vm_rules, utl.PRE, **self.p)
+        df = utl.apply_rules(df, self.vm_rules, utl.PRE,
+                             rule_set=self.get_rule_set(), **self.p)
         if self.p[vmc.omit_plan] == 'MEDIAPLAN':
             float_cols = []
             for col in vmc.datafloatcol:
@@ -845,7 +1358,8 @@ class DataSource(object):
                               self.p[vmc.enddate])
         df = ad_cost_calculation(df)
         df = utl.col_removal(df, self.key, self.p[vmc.dropcol])
-        df = utl.apply_rules(df, self.vm_rules, utl.POST, **self.p)
+        df = utl.apply_rules(df, self.vm_rules, utl.POST,
+                             rule_set=self.get_rule_set(), **self.p)
         return df
 
     def import_data(self):
@@ -978,7 +1492,8 @@ def df_single_transform(df, transform):
             matrix = VendorMatrix(display_log=False)
             matrix.sort_vendor_list()
             ven_param = matrix.vendor_set(merge_file)
-            ds = DataSource(merge_file, matrix.vm_rules_dict, **ven_param)
+            ds = DataSource(merge_file, matrix.vm_rules_dict,
+                            rule_sets=matrix.vm_rule_sets, **ven_param)
             merge_df = ds.get_raw_df_before_transform()
             if not merge_df.empty and merge_df is not None:
                 merge_df = df_transform(merge_df, ds.p[vmc.transform],
@@ -1088,8 +1603,7 @@ def df_single_transform(df, transform):
                        + df[cols[1]].astype(str))
         df.drop(cols[1], axis=1, inplace=True)
     if transform_type == vmc.transform_raw_translate:
-        tc = dct.DictTranslationConfig()
-        tc.read(dctc.filename_tran_config)
+        tc = dct.ConfigRegistry.get_translation_config()
         df = tc.apply_translation_to_dict(df)
     if transform_type == 'AddColumn':
         if len(transform) < 3:
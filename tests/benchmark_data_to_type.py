@@ -0,0 +1,61 @@
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import processor.reporting.utils as utl
+
+
+def legacy_to_float(ser):
+    """
+    Float conversion as data_to_type performed it before numeric_to_float.
+
+    :param ser: Series to convert
+    :return: Float series
+    """
+    ser = ser.fillna(0)
+    ser = ser.astype('U')
+    ser = ser.apply(lambda x: x.replace('$', ''))
+    ser = ser.apply(lambda x: x.replace(',', ''))
+    ser = pd.to_numeric(ser, errors='coerce')
+    return ser.astype(float)
+
+
+def make_frame(rows):
+    """
+    Builds a frame with a currency string column and an already numeric
+    column, the two shapes float columns take through the pipeline.
+
+    :param rows: Number of rows in the frame
+    :return: Dataframe with 'str_cost' and 'num_cost' columns
+    """
+    rng = np.random.default_rng(0)
+    values = rng.random(rows) * 10000
+    str_cost = pd.Series(values.round(2)).map('${:,.2f}'.format)
+    return pd.DataFrame({'str_cost': str_cost, 'num_cost': values})
+
+
+def time_call(func, ser):
+    start = time.perf_counter()
+    result = func(ser)
+    return time.perf_counter() - start, result
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Times data_to_type float conversion against the legacy '
+                    'per-row implementation.')
+    parser.add_argument('--rows', type=int, default=5000000)
+    args = parser.parse_args(args)
+    df = make_frame(args.rows)
+    print('Rows: {}'.format(args.rows))
+    for col in df.columns:
+        old_time, old = time_call(legacy_to_float, df[col])
+        new_time, new = time_call(utl.numeric_to_float, df[col])
+        pd.testing.assert_series_equal(old, new)
+        print('{}: legacy {:.2f}s, current {:.2f}s, {:.1f}x faster'.format(
+            col, old_time, new_time, old_time / max(new_time, 1e-9)))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,60 @@
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EAGER_MODULES = ['nltk', 'openai', 'seaborn', 'yaml', 'reporting.ftp',
+                 'reporting.awss3', 'reporting.azapi', 'reporting.awapi',
+                 'reporting.export']
+TIMER = """
+import time
+start = time.perf_counter()
+import main
+{}
+print(time.perf_counter() - start)
+"""
+EAGER_IMPORTS = """
+import importlib
+import reporting.importhandler as ih
+for module_name in {}:
+    importlib.import_module(module_name)
+for key in ih.ImportHandler.api_modules:
+    ih.ImportHandler(None, None).class_list[key]
+"""
+
+
+def time_import(code):
+    """
+    Times one import of main in a fresh interpreter.
+
+    :param code: Extra statements timed after importing main
+    :return: Seconds taken
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [os.path.dirname(REPO_PATH), env.get('PYTHONPATH', '')])
+    out = subprocess.run(
+        [sys.executable, '-c', TIMER.format(code)], cwd=REPO_PATH, env=env,
+        capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Times importing main with lazy connectors against '
+                    'importing every connector and analysis dependency up '
+                    'front, as main did before the connector registry.')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args(args)
+    eager_code = EAGER_IMPORTS.format(EAGER_MODULES)
+    old = statistics.median(time_import(eager_code) for _ in range(args.runs))
+    new = statistics.median(time_import('') for _ in range(args.runs))
+    print('Runs: {}'.format(args.runs))
+    print('import main: eager {:.2f}s, lazy {:.2f}s, {:.1f}x faster'.format(
+        old, new, old / max(new, 1e-9)))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -2,8 +2,10 @@ import os
 import sys
 import json
 import yaml
+import time
 import types
 import string
+import threading
 import pytest
 import logging
 import numpy as np
@@ -50,6 +52,7 @@ import processor.reporting.simapi as simapi
 import processor.reporting.steapi as steapi
 import processor.reporting.asaapi as asaapi
 import processor.reporting.importhandler as ih
+import processor.reporting.hyper.postgres_extractor as pge
 
 # Dev machines carry gitignored credentials and data artifacts that
 # CI checkouts lack; gate the tests that genuinely need them.
@@ -221,6 +224,50 @@ class TestUtils:
         df = utl.apply_rules(df, vm_rules, utl.POST, **kwargs)
         assert pd.testing.assert_frame_equal(df, ndf) is None
 
+    def test_rule_set(self):
+        rules = [
+            ('PRE::{}::{}'.format(vmc.impressions, vmc.views),
+             '{}::a'.format(dctc.VEN), 2),
+            ('PRE::{}::{}'.format(vmc.clicks, vmc.views),
+             '{}::b'.format(dctc.VEN), 3),
+            ('PRE::{}'.format(vmc.clicks),
+             '{}::a::EXCLUDE|{}::2024-01-02,2024-01-03'.format(
+                 dctc.VEN, vmc.date), 10),
+            ('POST::{}'.format(vmc.impressions), '{}::c'.format(dctc.VEN), 0),
+        ]
+        vm_rules = {}
+        kwargs = {}
+        for idx, rule in enumerate(rules):
+            vm_rules[str(idx)] = {}
+            for key, val in zip(utl.RULE_CONST, rule):
+                col = 'RULE_{}_{}'.format(idx, key)
+                vm_rules[str(idx)][key] = col
+                kwargs[col] = val
+        df = pd.DataFrame({
+            dctc.VEN: ['a', 'b', 'c', 'c'],
+            vmc.date: pd.to_datetime(['2024-01-01', '2024-01-02',
+                                      '2024-01-03', '2024-01-04']),
+            vmc.impressions: ['1', '2', '$3', None],
+            vmc.clicks: [1.0, 2.0, 3.0, 4.0]})
+        rule_set = utl.RuleSet(vm_rules, **kwargs)
+        assert [x['name'] for x in rule_set.rules[utl.PRE]] == ['0', '1', '2']
+        df = utl.apply_rules(df, vm_rules, utl.PRE, rule_set=rule_set,
+                             **kwargs)
+        assert df[vmc.views].tolist() == [2.0, 6.0, 0.0, 0.0]
+        assert df[vmc.clicks].tolist() == [1.0, 20.0, 30.0, 4.0]
+        df = utl.apply_rules(df, vm_rules, utl.POST, rule_set=rule_set,
+                             **kwargs)
+        assert df[vmc.impressions].tolist() == [1.0, 2.0, 0.0, 0.0]
+        stats = rule_set.get_stats()
+        assert stats[utl.RuleSet.rows_col].tolist() == [1, 1, 2, 2]
+        assert stats[utl.RuleSet.phase_col].tolist() == [utl.PRE] * 3 + [
+            utl.POST]
+        del vm_rules['3'][utl.RULE_FACTOR]
+        rule_set = utl.RuleSet(vm_rules, **kwargs)
+        df = utl.apply_rules(df, vm_rules, utl.POST, rule_set=rule_set,
+                             **kwargs)
+        assert len(rule_set.stats) == 0
+
     def test_data_to_type(self):
         str_col = 'str_col'
         float_col = 'float_col'
@@ -251,6 +298,88 @@ class TestUtils:
         for col in [str_col, float_col, date_col, int_col]:
             assert pd.testing.assert_series_equal(df[col], ndf[col]) is None
 
+    def test_strings_to_dates(self):
+        str_list = ['2024-01-05', '2024-13-01', '1/5/2024', '13/1/2024',
+                    '20240105', '20241305', '45123', '45123.5', '1/5/24',
+                    '2024-01-05 10:11:12', 'PST Fri Jan 05 00:00:00 2024',
+                    '0', 'NaT', 'nan', '2024-01-05', '45123', '1/5/2024',
+                    '45000\n', '2024-01-05\n', '20240105\n', '1/5/2024\n']
+        ser = pd.Series(str_list, index=range(10, 10 + len(str_list)),
+                        name='date_col')
+        ndf = utl.strings_to_dates(ser)
+        df = ser.apply(utl.string_to_date)
+        df = pd.to_datetime(df, errors='coerce').dt.normalize()
+        assert pd.testing.assert_series_equal(df, ndf) is None
+        assert pd.isna(ndf[ser == '45000\n']).all()
+
+    def test_import_read_csv_cache(self, tmp_path, monkeypatch):
+        cache_path = os.path.join(tmp_path, 'cache')
+        monkeypatch.setattr(utl, 'read_cache_path', cache_path)
+        monkeypatch.setattr(utl, 'read_cache_min_size', 0)
+        file_name = os.path.join(tmp_path, 'raw.csv')
+        raw_df = pd.DataFrame({'Placement': ['a', None, 'c'],
+                               'Imps': [1, 2, 3], 'Cost': [1.5, None, 0]})
+        raw_df.to_csv(file_name, index=False)
+        df = utl.import_read_csv(file_name)
+        assert len(os.listdir(cache_path)) == 1
+        cache_df = utl.import_read_csv(file_name)
+        pd.testing.assert_frame_equal(df, cache_df)
+        assert np.isnan(cache_df['Placement'][1])
+        raw_df['Imps'] = 5
+        raw_df.to_csv(file_name, index=False)
+        df = utl.import_read_csv(file_name)
+        assert df['Imps'].tolist() == [5, 5, 5]
+        assert len(os.listdir(cache_path)) == 1
+        utl.import_read_csv(file_name, nrows=1)
+        assert len(os.listdir(cache_path)) == 2
+        raw_df.to_csv(file_name, index=False, sep=',', mode='a',
+                      header=False)
+        df = utl.import_read_csv(file_name)
+        assert len(df) == 6
+        assert len(os.listdir(cache_path)) == 1
+        other_file = os.path.join(tmp_path, 'other.csv')
+        raw_df.to_csv(other_file, index=False)
+        monkeypatch.setattr(utl, 'read_cache_max_size', 1)
+        utl.import_read_csv(other_file)
+        assert len(os.listdir(cache_path)) == 1
+        dict_path = os.path.join(tmp_path, 'dictionaries')
+        monkeypatch.setattr(utl, 'dict_path', dict_path)
+        utl.dir_check(dict_path)
+        dict_file = os.path.join(dict_path, 'dict.csv')
+        raw_df.to_csv(dict_file, index=False)
+        assert utl.get_read_cache_file(dict_file, {}) is None
+        utl.clear_cache(cache_path)
+        assert not os.path.isdir(cache_path)
+
+    def test_numeric_to_float(self):
+        def old_to_float(ser):
+            ser = ser.fillna(0).astype('U')
+            ser = ser.apply(lambda x: x.replace('$', ''))
+            ser = ser.apply(lambda x: x.replace(',', ''))
+            return pd.to_numeric(ser, errors='coerce').astype(float)
+        sers = [
+            pd.Series(['$1,000.50', '2', None, 'abc', '', '-3.5', 4.0]),
+            pd.Series([1.5, np.nan, 3.0]),
+            pd.Series([1, 2, 3], dtype='int64'),
+            pd.Series([1, None, 3], dtype='Int64'),
+            pd.Series([True, False]),
+            pd.Series([], dtype=object)]
+        for ser in sers:
+            ndf = utl.numeric_to_float(ser)
+            df = old_to_float(ser)
+            assert pd.testing.assert_series_equal(df, ndf) is None
+
+    def test_data_to_type_datetime(self):
+        date_col = 'date_col'
+        dates = pd.to_datetime(['2024-01-05 10:00', None, '2024-01-06 00:00'])
+        df = pd.DataFrame({date_col: dates})
+        ndf = utl.data_to_type(df.copy(), date_col=[date_col])
+        assert ndf[date_col].iloc[0] == pd.Timestamp('2024-01-05')
+        assert ndf[date_col].iloc[1] == pd.Timestamp(dt.date.today())
+        ndf = utl.data_to_type(df.copy(), date_col=[date_col],
+                               fill_empty=False)
+        assert pd.isna(ndf[date_col].iloc[1])
+
     def test_selenium_wrapper(self):
         sw = utl.SeleniumWrapper()
         test_url = 'https://www.google.com/'
@@ -753,6 +882,116 @@ def _no_sleep(*args, **kwargs):
     """Keep polling loops instant under test."""
 
 
+class TestFbApi:
+    def test_fbapi_async_jobs(self, monkeypatch):
+        polls = {'1': [50, 100], '2': [10, 10, 10, 60, 100]}
+        calls = []
+        sleeps = []
+
+        class FakeResponse(object):
+            def __init__(self, report):
+                self.report = report
+
+            def json(self):
+                return self.report
+
+        class FakeBatch(object):
+            def __init__(self):
+                self.requests = []
+
+            def execute(self):
+                calls.append(len(self.requests))
+                for success, report in self.requests:
+                    success(FakeResponse(report))
+
+        class FakeApi(object):
+            @staticmethod
+            def new_batch():
+                return FakeBatch()
+
+        class FakeReportRun(dict):
+            def __init__(self, job_id, api=None):
+                super().__init__(id=job_id)
+                assert isinstance(api, FakeApi)
+
+            def report(self):
+                percent = polls[self['id']].pop(0)
+                status = 'Job Completed' if percent == 100 else 'Running'
+                return {'id': self['id'], 'async_percent_completion': percent,
+                        'async_status': status}
+
+            def api_get(self, batch=None, success=None):
+                if batch is None:
+                    return self.report()
+                batch.requests.append((success, self.report()))
+
+            def get_result(self):
+                return [{'ad_id': self['id'], 'impressions': 1}]
+
+        monkeypatch.setattr(fbapi, 'AdReportRun', FakeReportRun)
+        monkeypatch.setattr(fbapi.time, 'sleep', sleeps.append)
+        monkeypatch.setattr(pd, 'concat', self.count_calls(pd.concat, calls))
+        api = fbapi.FbApi()
+        api.api = FakeApi()
+        api.check_and_get_async_jobs(
+            [fbapi.FacebookRequest({'insights': {'id': x}}) for x in polls])
+        assert api.df['ad_id'].tolist() == ['1', '2']
+        assert calls == [2, 2, 'concat']
+        assert sleeps == [5, 5, 7.5, 5]
+
+    def test_fbapi_cancelled_stops_polling(self, monkeypatch):
+        api = fbapi.FbApi()
+        monkeypatch.setattr(api, 'check_async_jobs', None)
+        api.cancelled = True
+        api.check_and_get_async_jobs(
+            [fbapi.FacebookRequest({'insights': {'id': '1'}})])
+        assert api.df.empty
+
+    def test_fbapi_instances_use_own_api(self):
+        default_api = fbapi.FacebookAdsApi.get_default_api()
+        apis = []
+        for token in ['a', 'b']:
+            api = fbapi.FbApi()
+            api.app_id, api.app_secret, api.access_token = '1', '2', token
+            api.init_api()
+            apis.append(api)
+        try:
+            assert [x.api._session.access_token for x in apis] == ['a', 'b']
+            assert fbapi.FacebookAdsApi.get_default_api() is default_api
+            account = fbapi.AdAccount('act_1', api=apis[0].api)
+            assert account.get_api_assured() is apis[0].api
+        finally:
+            fbapi.FacebookAdsApi.set_default_api(default_api)
+
+    def test_fb_screenshots_use_instance_api(self, monkeypatch):
+        apis = []
+
+        class FakeCreative(object):
+            def __init__(self, ad, api=None):
+                apis.append(api)
+
+            @staticmethod
+            def get_previews(fields, params):
+                return [{'body': 'src="https://a.com/?amp;t=1" width=1'}]
+
+        monkeypatch.setattr(fbapi, 'AdCreative', FakeCreative)
+        api = object()
+        previews = fbapi.FacebookScreenshots.__new__(
+            fbapi.FacebookScreenshots)
+        previews.api = api
+        previews.df = pd.DataFrame({'ad_id': ['1']})
+        previews.config = pd.DataFrame({'ad_id': []})
+        assert previews.get_screenshots() == {'1': 'https://a.com/?amp&t=1'}
+        assert apis == [api]
+
+    @staticmethod
+    def count_calls(func, calls):
+        def wrapper(*args, **kwargs):
+            calls.append('concat')
+            return func(*args, **kwargs)
+        return wrapper
+
+
 class TestSimApi:
     """Failure paths must degrade or recover, never raise."""
 
@@ -908,6 +1147,42 @@ class TestVendormatrix:
         plan_val = matrix.vm[bar_col][vm.plan_key]
         assert isinstance(plan_val, list)
 
+    def test_vm_rule_sets_shared(self):
+        vks = ['API_Rawfile_A', 'API_Rawfile_B']
+        vm_df = pd.DataFrame(
+            {x: [''] * len(vks) for x in [vmc.vendorkey] + vmc.vmkeys})
+        vm_df[vmc.vendorkey] = vks
+        vm_df[vmc.filename] = ['a.csv', 'b.csv']
+        vm_df['RULE_1_FACTOR'] = [0.5, '']
+        vm_df['RULE_1_METRIC'] = ['POST::{}'.format(vmc.clicks), '']
+        vm_df['RULE_1_QUERY'] = ['{}::a'.format(dctc.VEN), '']
+        matrix = vm.VendorMatrix()
+        matrix.build_views(vm_df)
+        assert not matrix.vm_rule_sets
+        rule_sets = [matrix.get_data_source(vk).get_rule_set() for vk in vks]
+        assert set(matrix.vm_rule_sets) == set(vks)
+        assert len(rule_sets[0].rules[utl.POST]) == 1
+        assert not rule_sets[1].rules[utl.POST]
+        for vk, rule_set in zip(vks, rule_sets):
+            source = matrix.get_data_source(vk)
+            assert source.get_rule_set() is rule_set
+
+    def test_vm_bad_rule_fails_only_its_source(self):
+        vks = ['API_Rawfile_A', 'API_Rawfile_B']
+        vm_df = pd.DataFrame(
+            {x: [''] * len(vks) for x in [vmc.vendorkey] + vmc.vmkeys})
+        vm_df[vmc.vendorkey] = vks
+        vm_df[vmc.filename] = ['a.csv', 'b.csv']
+        vm_df['RULE_1_FACTOR'] = ['half', '']
+        vm_df['RULE_1_METRIC'] = ['POST::{}'.format(vmc.clicks), '']
+        vm_df['RULE_1_QUERY'] = ['{}::a'.format(dctc.VEN), '']
+        matrix = vm.VendorMatrix()
+        matrix.build_views(vm_df)
+        assert not matrix.get_data_source(vks[1]).get_rule_set().rules[
+            utl.POST]
+        with pytest.raises(ValueError):
+            matrix.get_data_source(vks[0]).get_rule_set()
+
     @staticmethod
     def _bare_source(original, new):
         return {
@@ -944,6 +1219,191 @@ class TestVendormatrix:
         assert matrix.vm_df.loc[0, vmc.vendorkey] == 'Adikteev'
         assert matrix.vm_df.loc[1, vmc.vendorkey] == 'API_DBM_DBM'
 
+    @staticmethod
+    def make_processor_dir(path, vendor_keys):
+        """Writes a vendor matrix with a raw file per key under path."""
+        for sub_path in [utl.config_path, utl.raw_path, utl.dict_path]:
+            utl.dir_check(os.path.join(path, sub_path))
+        rows = [{vmc.vendorkey: vm.plan_key, vmc.filename: 'plannet.csv',
+                 vmc.fullplacename: '|'.join([dctc.CAM, dctc.VEN]),
+                 vmc.filenamedict: dctc.PFN,
+                 vmc.filenameerror: 'PLANNET_ERROR_REPORT.csv'}]
+        for idx, vk in enumerate(vendor_keys):
+            file_name = '{}.csv'.format(vk)
+            raw_df = pd.DataFrame({
+                'Day': ['2024-01-01', '2024-01-02'] * (idx + 1),
+                'Placement': ['{}_Camp{}_{}'.format(vk, idx, x)
+                              for x in range(2 * (idx + 1))],
+                'Imps': [100 * (idx + 1)] * 2 * (idx + 1)})
+            raw_df.to_csv(os.path.join(path, utl.raw_path, file_name),
+                          index=False)
+            rows.append({
+                vmc.vendorkey: vk, vmc.filename: file_name,
+                vmc.fullplacename: 'Placement', vmc.placement: 'Placement',
+                vmc.filenamedict: '{}_dictionary.csv'.format(vk),
+                vmc.filenameerror: '{}_ERROR_REPORT.csv'.format(vk),
+                vmc.autodicplace: dctc.FPN,
+                vmc.autodicord: '|'.join([dctc.VEN, dctc.CAM, dctc.PKD]),
+                vmc.date: 'Day', vmc.impressions: 'Imps'})
+        vm_df = pd.DataFrame(rows, columns=[vmc.vendorkey] + vmc.vmkeys)
+        vm_df[[vmc.firstrow, vmc.lastrow]] = 0
+        vm_df.to_csv(os.path.join(path, vm.csv_path, vm.csv_file),
+                     index=False)
+        rc_df = pd.DataFrame({dctc.RK: ['Creative'],
+                              dctc.FN: ['Creative.csv'],
+                              dctc.KEY: [dctc.CRE], dctc.DEP: [dctc.SIZ],
+                              dctc.AUTO: [np.nan]})
+        rc_df.to_csv(os.path.join(path, utl.config_path,
+                                  dctc.filename_rel_config), index=False)
+        con_df = pd.DataFrame(columns=[dctc.DICT_COL_NAME, dctc.DICT_COL_VALUE,
+                                       dctc.DICT_COL_DICTNAME])
+        con_df.to_csv(os.path.join(path, utl.config_path,
+                                   dctc.filename_con_config), index=False)
+
+    def test_get_shared_file_groups(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        self.make_processor_dir(tmp_path, ['A', 'B', 'C'])
+        matrix = vm.VendorMatrix()
+        for col in [vmc.filenamedict, vmc.filenameerror]:
+            matrix.vm[col]['C'] = matrix.vm[col]['A']
+        groups = matrix.get_shared_file_groups(['A', 'B', 'C'])
+        assert groups == [['A', 'C'], ['B']]
+
+    def test_refresh_recompiles_rules(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        self.make_processor_dir(tmp_path, ['A', 'B'])
+        matrix = vm.VendorMatrix()
+        rule = {'RULE_1_FACTOR': 1.0,
+                'RULE_1_METRIC': 'POST::{}'.format(vmc.clicks),
+                'RULE_1_QUERY': '{}::a'.format(dctc.VEN)}
+        for col, val in rule.items():
+            matrix.vm_df[col] = ''
+            matrix.vm_change_on_key('A', col, val)
+        assert matrix.refresh() is None
+        rule_set = matrix.get_data_source('A').get_rule_set()
+        assert rule_set.rules[utl.POST][0]['metrics'] == [vmc.clicks]
+        b_rule_set = matrix.get_data_source('B').get_rule_set()
+        matrix.vm_change_on_key('A', 'RULE_1_FACTOR', 0.0)
+        matrix.vm_change_on_key('A', 'RULE_1_METRIC',
+                                'POST::{}'.format(vmc.impressions))
+        assert matrix.refresh()
+        assert 'A' not in matrix.vm_rule_sets
+        compiled = matrix.get_data_source('A').get_rule_set()
+        compiled = compiled.rules[utl.POST][0]
+        assert compiled['factor'] == 0.0
+        assert compiled['metrics'] == [vmc.impressions]
+        assert matrix.get_data_source('B').get_rule_set() is b_rule_set
+
+    def test_refresh_with_deferred_write(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        self.make_processor_dir(tmp_path, ['A', 'API_Facebook_B'])
+        matrix = vm.VendorMatrix()
+        sorts = []
+        sort_vendor_list = matrix.sort_vendor_list
+        monkeypatch.setattr(matrix, 'sort_vendor_list',
+                            lambda: sorts.append(1) or sort_vendor_list())
+        with matrix.deferred_write():
+            matrix.vm_change_on_key('A', vmc.firstrow, 3)
+            matrix.write()
+            assert vm.VendorMatrix().vm[vmc.firstrow]['A'] == 0
+            assert matrix.refresh() == [('A', vmc.firstrow, 0, 3)]
+            ic = vm.ImportConfig(matrix=matrix)
+            assert ic.matrix is matrix
+            ic_df = ic.matrix_df
+            assert ic_df is not matrix.vm_df
+            assert ic_df.loc[ic_df[vmc.vendorkey] == 'A',
+                             vmc.firstrow].item() == 3
+            assert matrix.vm[vmc.firstrow]['A'] == 3
+            assert not sorts
+            matrix.vm_change_on_key('A', vmc.filename, 'missing.csv')
+            matrix.refresh()
+            assert sorts and 'A' not in matrix.vl
+            matrix.vm_change_on_key('API_Facebook_B', vmc.vendorkey,
+                                    'API_Facebook_C')
+            assert matrix.refresh() is None
+            assert matrix.vks[vmc.api_fb_key] == ['API_Facebook_C']
+        assert [x[1] for x in matrix.journal] == [
+            vmc.firstrow, vmc.filename, vmc.filename_true, vmc.vendorkey]
+        fresh = vm.VendorMatrix()
+        pd.testing.assert_frame_equal(pd.DataFrame(fresh.vm),
+                                      pd.DataFrame(matrix.vm))
+        assert fresh.vl == matrix.vl
+
+    def test_vm_loop_parallel_matches_sequential(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        self.make_processor_dir(tmp_path, ['A', 'B', 'C'])
+        vm.VendorMatrix().vm_loop()
+        df = vm.VendorMatrix().vm_loop()
+        parallel_df = vm.VendorMatrix().vm_loop(processes=2)
+        assert not df.empty
+        assert set(df[vmc.vendorkey].dropna()) == {'A', 'B', 'C'}
+        pd.testing.assert_frame_equal(df, parallel_df)
+
+    def test_vm_loop_incremental(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        self.make_processor_dir(tmp_path, ['A', 'B'])
+        vm.VendorMatrix().vm_loop()
+        df = vm.VendorMatrix().vm_loop()
+        cache_df = vm.VendorMatrix().vm_loop(incremental=True)
+        pd.testing.assert_frame_equal(df, cache_df)
+        processed = []
+        vendor_get_timed = vm.VendorMatrix.vendor_get_timed
+
+        def track_vendor_get(matrix, vk):
+            processed.append(vk)
+            return vendor_get_timed(matrix, vk)
+        monkeypatch.setattr(vm.VendorMatrix, 'vendor_get_timed',
+                            track_vendor_get)
+        cache_df = vm.VendorMatrix().vm_loop(incremental=True)
+        assert processed == [vm.plan_key]
+        pd.testing.assert_frame_equal(df, cache_df)
+        raw_file = os.path.join(utl.raw_path, 'B.csv')
+        raw_df = pd.read_csv(raw_file)
+        raw_df['Imps'] = 1
+        raw_df.to_csv(raw_file, index=False)
+        processed.clear()
+        cache_df = vm.VendorMatrix().vm_loop(incremental=True)
+        assert processed == ['B', vm.plan_key]
+        assert cache_df[cache_df[vmc.vendorkey] == 'B'][
+            vmc.impressions].tolist() == [1, 1, 1, 1]
+        cache = vm.DataSourceCache(vm.VendorMatrix())
+        fingerprint = cache.get_fingerprint('A')
+        rel_path = os.path.join(dct.csv_path, 'Relational')
+        utl.dir_check(rel_path)
+        with open(os.path.join(rel_path, 'test.csv.lock'), 'w') as f:
+            f.write('')
+        assert cache.get_fingerprint('A') == fingerprint
+        old_file = cache.get_cache_file(cache.manifest[cache.sources_key]['A'])
+        assert os.path.isfile(old_file)
+        cache.save_sources([], {}, ['B'])
+        assert 'A' not in cache.manifest[cache.sources_key]
+        assert not os.path.isfile(old_file)
+        assert vm.DataSourceCache(vm.VendorMatrix()).manifest[
+            cache.sources_key].keys() == {'B'}
+
+    def test_data_source_accumulator(self):
+        dfs = [pd.DataFrame({vmc.date: ['2024-01-01'], vmc.impressions: [1],
+                             vmc.clicks: [np.nan]}, index=[3]),
+               None,
+               pd.DataFrame({vmc.clicks: [2, 3], dctc.VEN: ['a', 'b']})]
+        expected = pd.DataFrame(columns=[vmc.date, dctc.FPN])
+        for df in [x for x in dfs if x is not None]:
+            expected = pd.concat([expected.dropna(axis=1, how='all'),
+                                  df.dropna(axis=1, how='all')],
+                                 ignore_index=True)
+        acc = vm.DataSourceAccumulator()
+        for idx, df in enumerate(dfs):
+            acc.add('Key{}'.format(idx), df, seconds=idx)
+        df = acc.combine()
+        pd.testing.assert_frame_equal(df, expected)
+        stats = acc.get_stats()
+        assert stats[acc.rows_col].tolist() == [1, 0, 2]
+        assert stats[acc.seconds_col].tolist() == [0, 1, 2]
+        assert acc.peak_memory >= stats[acc.total_memory_col].max() > 0
+        acc.add('Key3', pd.DataFrame({vmc.clicks: [4]}))
+        df = acc.combine()
+        assert df[vmc.clicks].fillna(0).tolist() == [0, 2, 3, 4]
+
     def test_get_default_vm_value_returns_single_row(self):
         ic = vm.ImportConfig()
         ic.matrix_df = pd.DataFrame({
@@ -954,11 +1414,235 @@ class TestVendormatrix:
         assert len(result) == 1
 
 
+class TestImportHandler:
+    class FakeMatrix(object):
+        def __init__(self, vks, path):
+            self.vks = vks
+            self.path = path
+
+        def vendor_set(self, vk):
+            return {vmc.apifile: 'config.json', vmc.startdate: pd.NaT,
+                    vmc.enddate: pd.NaT, vmc.apifields: ['nan'],
+                    vmc.apimerge: np.nan, vmc.firstrow: 0, vmc.lastrow: 0,
+                    vmc.date: 'Date',
+                    vmc.filename: os.path.join(self.path, vk + '.csv')}
+
+    @staticmethod
+    def make_api(delay, state):
+        class FakeApi(object):
+            def __init__(self):
+                self.vk = None
+
+            def input_config(self, config):
+                pass
+
+            def get_data(self, sd=None, ed=None, fields=None):
+                with state['lock']:
+                    state['running'] += 1
+                    state['max'] = max(state['max'], state['running'])
+                time.sleep(delay)
+                with state['lock']:
+                    state['running'] -= 1
+                if delay < 0.1:
+                    raise ValueError('API error')
+                return pd.DataFrame({'Date': ['2024-01-01'], 'Imps': [1]})
+        return FakeApi
+
+    def test_class_list_imports_connectors_lazily(self, monkeypatch):
+        imported = []
+
+        def import_module(name):
+            imported.append(name)
+            return sys.modules[name]
+        monkeypatch.setattr(ih.importlib, 'import_module', import_module)
+        handler = ih.ImportHandler(None, None)
+        assert vmc.api_ttd_key in handler.class_list
+        assert len(handler.class_list) == len(handler.api_modules)
+        assert not imported
+        assert handler.class_list[vmc.api_ttd_key] is ttdapi.TtdApi
+        assert handler.class_list[vmc.api_ttd_key] is ttdapi.TtdApi
+        assert imported == ['processor.reporting.ttdapi']
+
+    def test_api_loop_concurrent(self, tmp_path):
+        states = [{'lock': threading.Lock(), 'running': 0, 'max': 0}
+                  for _ in range(2)]
+        vks = {vmc.api_fb_key: ['API_Facebook_{}'.format(x)
+                                for x in range(4)],
+               vmc.api_aw_key: ['API_Adwords_{}'.format(x)
+                                for x in range(2)]}
+        handler = ih.ImportHandler('all', self.FakeMatrix(vks, tmp_path))
+        handler.class_list = {
+            vmc.api_fb_key: self.make_api(0.3, states[0]),
+            vmc.api_aw_key: self.make_api(0.3, states[1])}
+        handler.api_workers = {vmc.api_fb_key: 2}
+        start_time = time.time()
+        handler.api_loop(concurrent=True)
+        assert time.time() - start_time < 0.3 * 4
+        assert states[0]['max'] == 2
+        assert states[1]['max'] == 1
+        for vk in vks[vmc.api_fb_key] + vks[vmc.api_aw_key]:
+            assert os.path.isfile(os.path.join(tmp_path, vk + '.csv'))
+
+    def test_api_loop_concurrent_timeout_and_error(self, tmp_path):
+        state = {'lock': threading.Lock(), 'running': 0, 'max': 0}
+        vks = {vmc.api_fb_key: ['API_Facebook_Slow'],
+               vmc.api_aw_key: ['API_Adwords_Error']}
+        handler = ih.ImportHandler('all', self.FakeMatrix(vks, tmp_path))
+        handler.class_list = {vmc.api_fb_key: self.make_api(0.6, state),
+                              vmc.api_aw_key: self.make_api(0, state)}
+        handler.api_timeout = 0.2
+        handler.poll_interval = 0.05
+        with pytest.raises(ValueError):
+            handler.api_loop(concurrent=True)
+        assert handler.timed_out == {'API_Facebook_Slow'}
+        time.sleep(0.6)
+        assert not os.listdir(tmp_path)
+
+    def test_api_loop_concurrent_cancels_timed_out(self, tmp_path):
+        stopped = threading.Event()
+
+        class PollingApi(object):
+            def __init__(self):
+                self.cancelled = False
+
+            def input_config(self, config):
+                pass
+
+            def get_data(self, sd=None, ed=None, fields=None):
+                while not self.cancelled:
+                    time.sleep(0.01)
+                stopped.set()
+                return pd.DataFrame()
+        vks = {vmc.api_fb_key: ['API_Facebook_Slow']}
+        handler = ih.ImportHandler('all', self.FakeMatrix(vks, tmp_path))
+        handler.class_list = {vmc.api_fb_key: PollingApi}
+        handler.api_timeout = 0.1
+        handler.poll_interval = 0.05
+        handler.api_loop(concurrent=True)
+        assert handler.timed_out == {'API_Facebook_Slow'}
+        assert stopped.wait(1)
+
+    @staticmethod
+    def make_pull(start_day, end_day, imps, first_row=1, last_row=1):
+        dates = pd.date_range('2024-01-{:02d}'.format(start_day),
+                              '2024-01-{:02d}'.format(end_day))
+        df = pd.DataFrame({'Date': dates.strftime('%Y-%m-%d'),
+                           'Campaign': ['a,b'] * len(dates),
+                           'Imps': [imps] * len(dates)})
+        df = pd.concat([df, df.assign(Campaign='c')], ignore_index=True)
+        df = utl.add_dummy_header(df, first_row)
+        return utl.add_dummy_header(df, last_row, location='foot')
+
+    def test_merge_output_append(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(ih.ApiMergeStore, 'file_path',
+                            os.path.join(tmp_path, 'merge'))
+        handler = ih.ImportHandler('all', None)
+        full_file = os.path.join(tmp_path, 'raw.csv')
+        old_file = os.path.join(tmp_path, 'old.csv')
+        args = (['Date'], 1, 1)
+        pulls = [(1, 10, 1), (9, 12, 2), (11, 14, 3), (14, 15, 4)]
+        for idx, (sd, ed, imps) in enumerate(pulls):
+            sd = pd.Timestamp('2024-01-{:02d}'.format(sd))
+            ed = pd.Timestamp('2024-01-{:02d}'.format(ed))
+            df = self.make_pull(sd.day, ed.day, imps)
+            if idx > 1:
+                expected = handler.merge_df_data(
+                    df.copy(), old_file, ['Date'], sd, ed, 1, 1, 3)
+                monkeypatch.setattr(
+                    utl, 'import_read_csv',
+                    lambda *a, **k: pytest.fail('Read full raw file.'))
+            handler.output(df, full_file, 3, 1, 1, ['Date'], sd, ed)
+            monkeypatch.undo()
+            monkeypatch.setattr(ih.ApiMergeStore, 'file_path',
+                                os.path.join(tmp_path, 'merge'))
+            if idx > 1:
+                result = utl.import_read_csv(full_file)
+                result = handler.merge_df_cleaning(
+                    result, 1, 1, ['Date'], pd.NaT, pd.NaT)
+                sort_cols = ['Date', 'Campaign']
+                expected = expected.sort_values(sort_cols).reset_index(
+                    drop=True)
+                result = result.sort_values(sort_cols).reset_index(drop=True)
+                for df in [expected, result]:
+                    df['Imps'] = df['Imps'].astype('int64')
+                pd.testing.assert_frame_equal(result, expected,
+                                              check_names=False)
+            utl.write_file(utl.import_read_csv(full_file), old_file)
+        assert ih.ApiMergeStore(full_file).index
+        with open(full_file, 'a') as f:
+            f.write('2024-01-20,d,1\n')
+        assert not ih.ApiMergeStore(full_file).index
+
+
 class TestDictionary:
     dic = dct.Dict()
     mock_rc_auto = ({dctc.TAR: [dctc.TB, dctc.DT1, dctc.GT]},
                     {dctc.TAR: ['_', '_']})
 
+    def test_split_error_df(self):
+        names = ['a_b_c', 'a_b_c', 'd_e', np.nan, 'f_g_h_i', 'd_e']
+        data_err = pd.DataFrame({dctc.FPN: names, dctc.PN: names})
+        err = types.SimpleNamespace(get=lambda: data_err.copy())
+        autodicord = [dctc.CAM, dctc.VEN, dctc.CRE]
+        error = self.dic.split_error_df(err, autodicord, dctc.PN)
+        for i, col in enumerate(autodicord):
+            expected = data_err[dctc.PN].str.split('_').str[i]
+            assert error[col].fillna('').tolist() == expected.fillna(
+                '').tolist()
+        error = self.dic.split_error_df(err, [dctc.CAM], dctc.PN,
+                                        include_index=True,
+                                        include_full_name=True)
+        assert len(error.columns) == 6
+        assert error.iloc[4, 2:].tolist() == ['f', 'g', 'h', 'i']
+        assert error.iloc[3, 2:].fillna('').tolist() == ['nan', '', '', '']
+
+    def test_auto_split(self):
+        col = '{}::-::{}::.::{}'.format(dctc.CAM, dctc.VEN, dctc.CRE)
+        values = ['a-b.c', 'a-b.c', 'd-e', 'f', np.nan, 'g-h.i.j']
+        df = pd.DataFrame({col: values})
+        df = self.dic.auto_split(df)
+        assert col not in df.columns
+        assert df[dctc.CAM].tolist() == ['a', 'a', 'd', 'f', 'nan', 'g']
+        assert df[dctc.VEN].tolist() == ['b', 'b', 'e', '', '', 'h']
+        assert df[dctc.CRE].tolist() == ['c', 'c', '', '', '', 'i.j']
+
+    def test_config_registry(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        TestVendormatrix.make_processor_dir(tmp_path, [])
+        reads = []
+        import_read_csv = utl.import_read_csv
+
+        def count_reads(filename, *args, **kwargs):
+            reads.append(filename)
+            return import_read_csv(filename, *args, **kwargs)
+        monkeypatch.setattr(dct.utl, 'import_read_csv', count_reads)
+        rel_file = os.path.join(utl.dict_path, 'Relational', 'Creative.csv')
+        dct.ConfigRegistry.start()
+        try:
+            for idx in range(3):
+                dic = dct.Dict('dict{}.csv'.format(idx))
+                dic.data_dict = pd.DataFrame({
+                    dctc.FPN: ['a{}'.format(idx)],
+                    dctc.CRE: ['cre{}'.format(idx)]})
+                dic.apply_functions()
+                assert dic.data_dict[dctc.CRE].tolist() == [
+                    'cre{}'.format(idx)]
+            assert pd.read_csv(rel_file).empty
+        finally:
+            dct.ConfigRegistry.stop()
+        assert dct.ConfigRegistry.current is None
+        df = pd.read_csv(rel_file)
+        assert df[dctc.CRE].tolist() == ['cre0', 'cre1', 'cre2']
+        for config_file in [dctc.filename_rel_config, dctc.filename_con_config,
+                            dctc.filename_tran_config]:
+            assert reads.count(config_file) == 1
+        reads.clear()
+        dic = dct.Dict('dict3.csv')
+        dic.data_dict = pd.DataFrame({dctc.FPN: ['a3'], dctc.CRE: ['cre3']})
+        dic.apply_functions()
+        assert reads.count(dctc.filename_rel_config) == 1
+        assert pd.read_csv(rel_file)[dctc.CRE].tolist()[-1] == 'cre3'
+
     def construct_empty_sort(self):
         auto = self.mock_rc_auto[0]
         empty_sort = {key: {comp: [] for comp in auto[key]} for key in auto}
@@ -1155,6 +1839,79 @@ class TestDictionary:
         assert df[col][1] != new_value
         assert df[col][2] != new_value
 
+    @staticmethod
+    def legacy_select_translation(rules, col, data_dict, fnc_type):
+        for col2, col2_q, val, nval in rules:
+            if fnc_type == 'Select':
+                data_dict.loc[(data_dict[col2].astype('U') == col2_q) &
+                              (data_dict[col] == val), col] = nval
+            else:
+                mask = pd.Series(True, index=data_dict.index)
+                for c, q in zip(col2.split('||'), col2_q.split('||')):
+                    mask &= (data_dict[c].astype('U') == q)
+                data_dict.loc[mask, col] = nval
+        return data_dict
+
+    @pytest.mark.parametrize('fnc_type', ['Select', 'Set'])
+    def test_select_translation_matches_rule_order(self, fnc_type):
+        np.random.seed(0)
+        col = dctc.TAR
+        values = ['a', 'b', 'c', 'd']
+        data_dict = pd.DataFrame({
+            dctc.VEN: np.random.choice(['v1', 'v2', 'v3'], 500),
+            dctc.PKD: np.random.choice(['p1', 'p2'], 500),
+            col: np.random.choice(values, 500)})
+        cols = [dctc.VEN, dctc.PKD, col, '{}||{}'.format(dctc.VEN, dctc.PKD)]
+        rules = []
+        for _ in range(60):
+            col2 = cols[np.random.randint(len(cols))]
+            col2_q = '||'.join(
+                np.random.choice(data_dict[x].unique())
+                for x in col2.split('||'))
+            val, nval = np.random.choice(values, 2)
+            rules.append((col2, col2_q, val, nval))
+        tdf = pd.DataFrame(rules, columns=[
+            dctc.DICT_COL_FNC, dctc.DICT_COL_SEL, dctc.DICT_COL_VALUE,
+            dctc.DICT_COL_NVALUE])
+        tdf[dctc.DICT_COL_FNC] = fnc_type + '::' + tdf[dctc.DICT_COL_FNC]
+        if fnc_type == 'Select':
+            rules = [x for x in rules if '||' not in x[0]]
+        expected = self.legacy_select_translation(
+            rules, col, data_dict.copy(), fnc_type)
+        df = dct.DictTranslationConfig.select_translation(
+            tdf, col, data_dict.copy(), fnc_type=fnc_type)
+        pd.testing.assert_frame_equal(df, expected)
+
+    def test_translation_compiled_once(self, monkeypatch):
+        tc = dct.DictTranslationConfig()
+        tc.df = pd.DataFrame({
+            dctc.DICT_COL_NAME: [dctc.TAR, dctc.TAR, dctc.TAR, dctc.VEN],
+            dctc.DICT_COL_VALUE: ['x', 'y', 'a', 'v1'],
+            dctc.DICT_COL_NVALUE: ['', '', 'b', 'v2'],
+            dctc.DICT_COL_FNC: ['Strip', 'Strip', np.nan, np.nan],
+            dctc.DICT_COL_SEL: [np.nan] * 4})
+        compiles = []
+        compile_config = tc.compile
+
+        def count_compile():
+            compiles.append(1)
+            return compile_config()
+        monkeypatch.setattr(tc, 'compile', count_compile)
+        data_dict = pd.DataFrame({dctc.TAR: ['axy', 'yxa', 'c'],
+                                  dctc.VEN: ['v1', 'v1', 'v3']})
+        for _ in range(2):
+            data_dict = tc.apply_translation_to_dict(data_dict)
+        assert data_dict[dctc.TAR].tolist() == ['b', 'b', 'c']
+        assert data_dict[dctc.VEN].tolist() == ['v2', 'v2', 'v3']
+        assert len(compiles) == 1
+
+    def test_strip_in_config_order(self):
+        tdf = pd.DataFrame({dctc.DICT_COL_VALUE: ['b', 'ac'],
+                            dctc.DICT_COL_FNC: ['Strip', 'Strip']})
+        data_dict = pd.DataFrame({dctc.TAR: ['abc', 'acb', 'a.c']})
+        df = dct.DictTranslationConfig.strip_dict(tdf, dctc.TAR, data_dict)
+        assert df[dctc.TAR].tolist() == ['', '', 'a.c']
+
 
 class TestErrorReport:
     def test_error_report(self, tmp_path_factory):
@@ -1187,6 +1944,29 @@ class TestErrorReport:
         assert not err.data_err.empty
         assert len(err.data_err) == 1
 
+    def test_error_report_add_keys(self, tmp_path_factory):
+        file_path = tmp_path_factory.mktemp(utl.error_path)
+        error_filename = '{}/ER_keys.csv'.format(file_path)
+        place_col = 'b'
+        names = ['a_b', 'b_c', 'c_d', np.nan, 'a_b', 'd_e', 'b_c']
+        df = pd.DataFrame({place_col: [x + 'p' if isinstance(x, str) else x
+                                       for x in names], dctc.FPN: names})
+        dic = pd.DataFrame({dctc.FPN: ['a_b', np.nan, 'x_y']})
+        err = er.ErrorReport(df, dic, place_col, error_filename)
+        merge_df = pd.merge(df[[dctc.FPN, place_col]].fillna(''),
+                            dic.fillna(''), on=dctc.FPN, how='left',
+                            indicator=True)
+        expected = merge_df[merge_df['_merge'] == 'left_only']
+        expected = expected[[dctc.FPN, place_col]].drop_duplicates()
+        assert err.data_err.values.tolist() == expected.values.tolist()
+        assert err.data_err.iloc[:, 0].tolist() == ['b_c', 'c_d', 'd_e']
+        err.add_keys(['b_c', 'd_e'])
+        assert err.data_err.iloc[:, 0].tolist() == ['c_d']
+        assert os.path.isfile(error_filename)
+        err.add_keys(['c_d'])
+        assert err.data_err.empty
+        assert not os.path.isfile(error_filename)
+
 
 class TestCalc:
     def test_calculate_cost(self):
@@ -1214,6 +1994,74 @@ class TestCalc:
         df = df[[x for x in edf.columns]]
         assert pd.testing.assert_frame_equal(df, edf) is None
 
+    @staticmethod
+    def get_buy_model_df(rows_per_model=20):
+        np.random.seed(0)
+        buy_models = cal.BUY_MODELS + ['', 'Unknown']
+        n = len(buy_models) * rows_per_model
+        dates = pd.date_range('2024-01-01', periods=10)
+        df = pd.DataFrame({dctc.BM: np.repeat(buy_models, rows_per_model),
+                           vmc.date: np.random.choice(dates, n)})
+        float_cols = [vmc.cost, vmc.impressions, vmc.clicks, vmc.views,
+                      vmc.views100, vmc.landingpage, vmc.view_imps,
+                      vmc.engagements, vmc.conv1, vmc.newuser, vmc.signup,
+                      cal.CLI_PD, cal.IMP_PD, dctc.BR, dctc.BR2, dctc.BR3,
+                      dctc.BR4, dctc.BR5]
+        for col in float_cols:
+            df[col] = np.random.randint(0, 1000, n).astype(float)
+        for col in [dctc.PD, dctc.PD2, dctc.PD3, dctc.PD4]:
+            df[col] = np.random.choice(dates, n)
+        df.loc[df.sample(frac=.1, random_state=0).index, dctc.PD] = pd.NaT
+        return df
+
+    def test_net_cost_final_calculation(self):
+        dates = pd.to_datetime(['2024-01-03', '2024-01-01', '2024-01-02',
+                                '2024-01-02', '2024-01-01', '2024-01-02'])
+        df = pd.DataFrame({
+            dctc.PFPN: ['a', 'a', 'a', 'a', 'b', np.nan],
+            vmc.date: dates,
+            vmc.cost: [10.0, 60.0, 30.0, 30.0, 40.0, 5.0],
+            dctc.PNC: [0, 100.0, 0, np.nan, 0, 10.0],
+            dctc.UNC: [False, False, True, np.nan, False, False],
+            cal.CLI_PD: 1}, index=[3, 3, 1, 0, 2, 2])
+        df = cal.net_cost_final_calculation(df)
+        assert df.index.tolist() == list(range(6))
+        assert df[cal.NCF].tolist() == [0.0, 60.0, 20.0, 20.0, 40.0, 5.0]
+        assert cal.NCF == df.columns[-1]
+        assert not [x for x in cal.DROP_COL if x in df.columns]
+
+    def test_buy_model_cost_matches_net_cost(self):
+        df = self.get_buy_model_df()
+        mask = df[dctc.BM].isin(cal.BUY_MODELS)
+        expected = df[mask].apply(cal.net_cost, axis=1).astype(float)
+        result = cal.buy_model_cost(df, mask=mask.to_numpy())[mask]
+        np.testing.assert_allclose(result, expected.to_numpy())
+        result = cal.buy_model_cost(df, br_col=dctc.BR2,
+                                    mask=mask.to_numpy())[mask]
+        expected = df[mask].apply(cal.net_cost, br_col=dctc.BR2,
+                                  axis=1).astype(float)
+        np.testing.assert_allclose(result, expected.to_numpy())
+
+    def test_buy_model_cost_missing_optional_metric(self):
+        df = self.get_buy_model_df(rows_per_model=2)
+        df = df[df[dctc.BM].isin([cal.BM_CPE, cal.BM_CPA])]
+        df = df.drop(columns=[vmc.engagements, vmc.conv1])
+        result = cal.buy_model_cost(df)
+        assert np.isnan(result).all()
+
+    def test_register_buy_model(self):
+        buy_model = 'CPTest'
+        df = pd.DataFrame({dctc.BM: [buy_model, cal.BM_CPC],
+                           dctc.BR: [2.0, 3.0], vmc.clicks: [5.0, 7.0],
+                           vmc.cost: [0.0, 0.0]})
+        cal.register_buy_model(buy_model, cal.rate_cost(vmc.clicks, 10))
+        try:
+            df = cal.net_cost_calculation(df)
+        finally:
+            cal.BUY_MODELS.remove(buy_model)
+            cal.BUY_MODEL_CALCULATIONS.pop(buy_model)
+        assert df[vmc.cost].tolist() == [1.0, 21.0]
+
     def test_prog_fees_calculation(self):
         prog_fee = .05
         net_cost = 100
@@ -1498,6 +2346,40 @@ class TestAnalyze:
         assert rdf
         return True
 
+    def test_raw_profile_shared_reads(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        file_name = 'raw_profile_test.csv'
+        place = 'a_b_c_d_e_f_g_h_i_j_k_l_m_n_o_p_q_r_s_t'
+        rows = [['Report', '', ''], [vmc.placement, vmc.date, vmc.clicks]]
+        rows += [[place, '1/1/2024', '1'] for _ in range(20)]
+        pd.DataFrame(rows).to_csv(file_name, index=False, header=False)
+        source = vm.DataSource(key='API_Rawfile_Profile', vm_rules={})
+        source.p.update({
+            vmc.filename: file_name, vmc.firstrow: 0, vmc.lastrow: 0,
+            vmc.header: 'nan', vmc.transform: 'nan',
+            vmc.placement: vmc.placement, vmc.fullplacename: [vmc.placement],
+            dctc.FPN: [vmc.placement], vmc.clicks: [vmc.clicks]})
+        aly = az.Analyze()
+        first_row = az.CheckFirstRow(aly).find_first_row(source)
+        assert first_row[az.CheckFirstRow.new_first_line][0] == '1'
+        source.p[vmc.firstrow] = 1
+        profile = aly.get_raw_profile(source)
+        tdf = profile.get_raw_df(source, nrows=5)
+        assert vmc.placement in tdf.columns
+        assert profile.reads == 1
+        az.CheckLastRow(aly).find_last_row(source)
+        az.FindPlacementNameCol(aly).do_analysis_on_data_source(source, [])
+        assert len(profile.get_raw_df(source)) == 20
+        assert aly.get_raw_profile(source) is profile
+        assert profile.reads == 2
+        with open(file_name, 'a') as f:
+            f.write('{},1/2/2024,2\n'.format(place))
+        new_profile = aly.get_raw_profile(source)
+        assert new_profile is not profile
+        assert len(new_profile.get_raw_df(source)) == 21
+        aly.clear_raw_profiles([file_name])
+        assert file_name not in aly.raw_profiles
+
     @staticmethod
     def get_output_as_df(with_plan=False, new_place=''):
         date_val = dt.datetime.today().strftime('%m/%d/%Y')
@@ -1597,6 +2479,81 @@ class TestAnalyze:
         df = cdc.find_metric_double_counting(df)
         assert df.empty
 
+    def test_run_analysis_classes(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        readers_started = threading.Barrier(2, timeout=5)
+        finished = []
+
+        class First(az.AnalyzeBase):
+            name = 'first'
+
+            def do_analysis(self):
+                readers_started.wait()
+                time.sleep(0.05)
+                self.aly.add_to_analysis_dict(self.name, data='1')
+                finished.append(self.name)
+
+        class Second(az.AnalyzeBase):
+            name = 'second'
+            reads = (az.Analyze.df_resource,)
+
+            def do_analysis(self):
+                readers_started.wait()
+                self.aly.add_to_analysis_dict(self.name, data='2')
+                finished.append(self.name)
+
+        class Dependent(az.AnalyzeBase):
+            name = 'dependent'
+            depends_on = (First,)
+
+            def do_analysis(self):
+                seen = [self.aly.find_in_analysis_dict(x)
+                        for x in ['pre', 'first', 'second']]
+                self.aly.add_to_analysis_dict(
+                    self.name, data=[len(x) for x in seen])
+                finished.append(self.name)
+
+        class Writer(az.AnalyzeBase):
+            name = 'writer'
+            reads = ()
+            writes = (az.Analyze.df_resource,)
+
+            def do_analysis(self):
+                self.aly.add_to_analysis_dict(
+                    self.name, data=sorted(finished))
+
+        aly = az.Analyze()
+        aly.add_to_analysis_dict('pre')
+        class_list = [First, Second, Dependent, Writer]
+        aly.run_analysis_classes(class_list, workers=4)
+        assert [x[aly.analysis_dict_key_col] for x in aly.analysis_dict] == [
+            'pre', 'first', 'second', 'dependent', 'writer']
+        assert aly.find_in_analysis_dict('dependent')[0]['data'] == [1, 1, 0]
+        assert aly.find_in_analysis_dict('writer')[0]['data'] == [
+            'dependent', 'first', 'second']
+        aly.write_analysis_timing()
+        with open(aly.analysis_timing_file_name, 'r') as f:
+            timing = json.load(f)
+        assert [x['check'] for x in timing] == [x.__name__ for x in class_list]
+        assert all(x['seconds'] >= 0 for x in timing)
+
+    def test_run_analysis_classes_matches_sequential(self, tmp_path,
+                                                     monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        TestVendormatrix.make_processor_dir(tmp_path, ['A', 'B'])
+        vm.VendorMatrix().vm_loop()
+        matrix = vm.VendorMatrix()
+        df = cal.calculate_cost(matrix.vm_loop())
+        assert not df.empty
+        results = []
+        for workers in [1, 4]:
+            aly = az.Analyze(df=df.copy(), matrix=matrix)
+            aly.run_analysis_classes(workers=workers)
+            assert not aly.raw_profiles
+            pd.testing.assert_frame_equal(aly.df, df)
+            results.append(json.dumps(aly.analysis_dict, default=str))
+        assert results[0] == results[1]
+
     @requires_base_config
     def test_adwords_split(self):
         df = pd.DataFrame()
@@ -2007,6 +2964,85 @@ class TestAliChat:
         for i in range(item_num):
             assert word_idx[str(i)] == [i]
 
+    def test_sync_word_index(self, tmp_path, monkeypatch):
+        import sqlalchemy as sqa
+        from sqlalchemy.orm import declarative_base, sessionmaker
+        base = declarative_base()
+        names_read = []
+
+        class Item(base):
+            __tablename__ = 'item'
+            id = sqa.Column(sqa.Integer, primary_key=True)
+            item_name = sqa.Column(sqa.Text)
+            updated_at = sqa.Column(sqa.DateTime)
+
+            @property
+            def name(self):
+                names_read.append(self.id)
+                return self.item_name
+
+            @classmethod
+            def ali_index_query(cls):
+                return session.query(cls)
+
+        engine = sqa.create_engine('sqlite://')
+        base.metadata.create_all(engine)
+        session = sessionmaker(bind=engine)()
+        day = dt.datetime(2024, 1, 1)
+        for x in range(3):
+            session.add(Item(id=x + 1, item_name='item {}'.format(x),
+                             updated_at=day + dt.timedelta(days=x)))
+        session.commit()
+        monkeypatch.setattr(az.AliChat, 'word_index_path',
+                            str(tmp_path / 'word_index.db'))
+        monkeypatch.setattr(az.AliChat, '_WORD_INDEX_CACHE', {})
+        monkeypatch.setattr(az.AliChat, '_WORD_INDEX_STORES', {})
+        word_idx = az.AliChat.sync_word_index(Item)
+        assert word_idx['item'] == [1, 2, 3]
+        assert sorted(names_read) == [1, 2, 3]
+        store = az.AliChat.get_word_index_store()
+        id_diffs = []
+        get_ids = store.get_ids
+        monkeypatch.setattr(store, 'get_ids',
+                            lambda *args: id_diffs.append(1) or get_ids(*args))
+        del names_read[:]
+        assert az.AliChat.sync_word_index(Item) is word_idx
+        assert names_read == [3]
+        version = store.get_state(Item.__name__).version
+        session.get(Item, 1).item_name = 'renamed 0'
+        session.get(Item, 1).updated_at = day + dt.timedelta(days=5)
+        session.add(Item(id=4, item_name='item 3', updated_at=day))
+        session.commit()
+        del names_read[:]
+        word_idx = az.AliChat.sync_word_index(Item)
+        assert sorted(names_read) == [1, 3, 4]
+        assert word_idx['item'] == [2, 3, 4]
+        assert word_idx['renamed'] == [1]
+        assert not id_diffs
+        session.delete(session.get(Item, 2))
+        session.commit()
+        del names_read[:]
+        word_idx = az.AliChat.sync_word_index(Item)
+        assert names_read == [1]
+        assert len(id_diffs) == 1
+        assert word_idx['item'] == [3, 4]
+        assert '1' not in word_idx
+        version = store.get_state(Item.__name__).version
+        del names_read[:]
+        monkeypatch.setattr(az.AliChat, '_WORD_INDEX_CACHE', {})
+        monkeypatch.setattr(az.AliChat, '_WORD_INDEX_STORES', {})
+        assert az.AliChat.sync_word_index(Item) == word_idx
+        assert names_read == [1]
+        store = az.AliChat.get_word_index_store()
+        assert store.get_state(Item.__name__).version == version
+        del names_read[:]
+        az.AliChat.invalidate_word_index([Item.__name__])
+        assert az.AliChat.sync_word_index(Item) == word_idx
+        assert sorted(names_read) == [1, 3, 4]
+        del names_read[:]
+        monkeypatch.setattr(az.AliChat, 'word_index_ttl', 0)
+        assert az.AliChat.sync_word_index(Item) == word_idx
+        assert sorted(names_read) == [1, 3, 4]
 
 default_col_names = [
     '"lqadb"."event"."eventname"',
@@ -2485,6 +3521,239 @@ class TestExport:
         append_tables = sb.get_active_event_tables(metrics)
         assert set(append_tables) == set(expected_tables)
 
+    @staticmethod
+    def make_stage_db(monkeypatch):
+        executed = []
+        copied = {}
+
+        class FakeCursor(object):
+            rowcount = 2
+
+            def execute(self, command, params=None):
+                executed.append((' '.join(command.split()), params))
+
+            def copy_from(self, output, table, columns):
+                copied[table] = (output.read(), list(columns))
+
+        db = exp.DB()
+        db.schema = 'lqadb'
+        db.cursor = FakeCursor()
+        db.connection = types.SimpleNamespace(commit=lambda: None,
+                                              rollback=lambda: None)
+        monkeypatch.setattr(db, 'connect', lambda: None)
+        return db, executed, copied
+
+    def test_stage_table_to_db(self, monkeypatch):
+        db, executed, copied = self.make_stage_db(monkeypatch)
+        dbu = exp.DBUpload(stage=True)
+        dbu.db = db
+        dbu.dbs = types.SimpleNamespace(fk={
+            exc.upload_tbl: [exc.upload_id_col, exc.upload_name],
+            'fullplacement': ['fullplacementid', 'fullplacementname']})
+        dbu.dft = types.SimpleNamespace(
+            upload_id=7, df_col_to_type=exp.DFTranslation.df_col_to_type)
+        dbu.id_col = 'eventid'
+        dbu.name = exc.event_name
+        ul_df = pd.DataFrame({
+            exc.event_name: ['a', 'b', 'a'],
+            'fullplacementid': [1.0, np.nan, 1.0],
+            exc.upload_id_col: [7, 7, 7],
+            'impressions': [1.0, 2.0, 3.0]})
+        counts = dbu.stage_table_to_db('event', ul_df)
+        assert counts == {'duplicate': 2, 'update': 2, 'insert': 2,
+                          'delete': 2}
+        data, columns = copied['stage_event']
+        assert columns == list(ul_df.columns)
+        assert data == 'a\t1\t7\t1.0\nb\t0\t7\t2.0\n'
+        commands = [x[0] for x in executed]
+        assert commands[0] == 'DROP TABLE IF EXISTS stage_event'
+        assert commands[1].startswith('CREATE TEMP TABLE stage_event')
+        assert all(x[1] == {'scope': 7} for x in executed[2:])
+        update = [x for x in commands if x.startswith('UPDATE')][0]
+        assert ('SET fullplacementid = s.fullplacementid, '
+                'impressions = s.impressions') in update
+        assert 't.eventname = s.eventname AND t.uploadid = %(scope)s' in update
+        assert 'IS DISTINCT FROM' in update
+        insert = [x for x in commands if x.startswith('INSERT')][0]
+        assert 's.fullplacementid <> 0' in insert
+        assert 's.uploadid <> 0' not in insert
+        assert commands[-1].startswith('DELETE FROM lqadb.event AS t WHERE '
+                                       't.uploadid = %(scope)s AND NOT EXISTS')
+
+    def test_stage_upsert_rollback_in_transaction(self, monkeypatch):
+        import psycopg2
+        db, executed, copied = self.make_stage_db(monkeypatch)
+        rollbacks = []
+        db.connection = types.SimpleNamespace(
+            commit=lambda: None, rollback=lambda: rollbacks.append(1))
+
+        def fail(command, params=None):
+            raise psycopg2.Error('stage failed')
+        db.cursor.execute = fail
+        df = pd.DataFrame({'eventname': ['a'], 'impressions': [1.0]})
+        with pytest.raises(psycopg2.Error):
+            with db.transaction():
+                db.stage_upsert('event', df, 'eventname', ['impressions'])
+        assert len(rollbacks) == 1
+        with pytest.raises(psycopg2.Error):
+            db.stage_upsert('event', df, 'eventname', ['impressions'])
+        assert len(rollbacks) == 2
+
+    def test_db_reads_end_transaction(self, monkeypatch):
+        db, executed, copied = self.make_stage_db(monkeypatch)
+        rollbacks = []
+        db.connection = types.SimpleNamespace(
+            commit=lambda: None, rollback=lambda: rollbacks.append(1))
+        db.cursor.fetchall = lambda: [(1,)]
+        db.cursor.description = [('a',)]
+        db.read_rds('t', 'a', 'a', [1])
+        db.read_rds_table('t', 'a', [1])
+        db.read_rds_two_where('t', 'a', 'a', [1], 'b', 2)
+        assert len(rollbacks) == 3
+        with db.transaction():
+            db.read_rds_table('t', 'a', [1])
+        assert len(rollbacks) == 3
+
+    @staticmethod
+    def make_pool_dbs(conn_string, connect_args=None, count=2):
+        dbs = []
+        for _ in range(count):
+            db = exp.DB()
+            db.conn_string = conn_string
+            if connect_args is not None:
+                db.connect_args = connect_args
+            dbs.append(db)
+        return dbs
+
+    def test_db_pool_and_transaction(self, tmp_path):
+        exp.EnginePool.dispose()
+        conn_string = 'sqlite:///{}'.format(tmp_path / 'pool.db')
+        db, db2 = self.make_pool_dbs(conn_string, connect_args={})
+        with db.transaction():
+            db.cursor.execute('CREATE TABLE t (a INTEGER)')
+            db.cursor.execute('INSERT INTO t VALUES (1)')
+            db.commit()
+        db.release()
+        with pytest.raises(ValueError):
+            with db2.transaction():
+                db2.cursor.execute('INSERT INTO t VALUES (2)')
+                raise ValueError
+        db2.connect()
+        db2.cursor.execute('SELECT a FROM t')
+        assert db2.cursor.fetchall() == [(1,)]
+        assert db.engine is db2.engine
+        stats = db2.get_pool_stats()
+        assert stats[exp.EnginePool.connects] == 1
+        assert stats[exp.EnginePool.checkouts] == 2
+        assert stats[exp.EnginePool.reused] == 1
+        db2.release()
+        exp.EnginePool.dispose()
+
+    def test_db_connected_releases(self, tmp_path):
+        exp.EnginePool.dispose()
+        conn_string = 'sqlite:///{}'.format(tmp_path / 'pool.db')
+        db = self.make_pool_dbs(conn_string, connect_args={}, count=1)[0]
+        with db.connected():
+            db.cursor.execute('SELECT 1')
+            with db.connected():
+                assert db.is_connected()
+            assert db.is_connected()
+        assert not db.is_connected()
+        db.connect()
+        with db.connected():
+            pass
+        assert db.is_connected()
+        db.release()
+        assert db.get_pool_stats()[exp.EnginePool.checkouts] == 2
+        exp.EnginePool.dispose()
+
+    @pytest.mark.skipif(not os.environ.get('PROCESSOR_TEST_PG'),
+                        reason='PROCESSOR_TEST_PG connection string not set.')
+    def test_db_pool_postgres(self):
+        exp.EnginePool.dispose()
+        db, db2 = self.make_pool_dbs(os.environ['PROCESSOR_TEST_PG'])
+        db.schema = 'pg_temp'
+        for cur_db in [db, db2]:
+            with cur_db.transaction():
+                cur_db.cursor.execute('SELECT 1')
+                assert cur_db.cursor.fetchall() == [(1,)]
+            cur_db.release()
+        stats = db.get_pool_stats()
+        assert stats[exp.EnginePool.connects] == 1
+        assert stats[exp.EnginePool.reused] == 1
+        exp.EnginePool.dispose()
+
+
+class TestHyperExtractor:
+    class FakeCursor(object):
+        column = type('Column', (), {})
+
+        def __init__(self, rows):
+            self.rows = list(rows)
+            self.description = None
+            self.query = ''
+
+        def fetchmany(self, size):
+            col = self.column()
+            col.name = 'id'
+            col.type_code = 20
+            self.description = [col]
+            batch, self.rows = self.rows[:size], self.rows[size:]
+            return batch
+
+    @staticmethod
+    def read_hyper_ids(path):
+        from tableauhyperapi import HyperProcess, Connection, Telemetry
+        with HyperProcess(
+                telemetry=Telemetry.DO_NOT_SEND_USAGE_DATA_TO_TABLEAU) as hp:
+            with Connection(endpoint=hp.endpoint, database=path) as conn:
+                return conn.execute_list_query(
+                    'SELECT "id" FROM "Extract"."Extract.hyper" '
+                    'ORDER BY "id"')
+
+    @pytest.mark.parametrize('row_count, chunk_rows, expected', [
+        (7, 3, [3, 3, 1]),
+        (6, 3, [3, 3]),
+        (5, None, [5]),
+        (0, 3, [0]),
+    ])
+    def test_cursor_to_hyper_files_rolls_over(
+            self, tmp_path, monkeypatch, row_count, chunk_rows, expected):
+        monkeypatch.chdir(tmp_path)
+        extractor = pge.PostgresExtractor({}, '', '')
+        extractor.dbapi_batchsize = 2
+        cursor = self.FakeCursor([(x,) for x in range(row_count)])
+        paths = list(extractor.cursor_to_hyper_files(
+            cursor, hyper_table_name='Extract.hyper', chunk_rows=chunk_rows))
+        assert paths == [extractor.hyper_chunk_path('Extract.hyper', x)
+                         for x in range(len(expected))]
+        ids = [self.read_hyper_ids(path) for path in paths]
+        assert [len(x) for x in ids] == expected
+        assert [row[0] for x in ids for row in x] == list(range(row_count))
+
+    def test_publish_hyper_files_first_then_append(self, tmp_path,
+                                                   monkeypatch):
+        extractor = pge.PostgresExtractor({}, '', '')
+        calls = []
+        monkeypatch.setattr(
+            extractor, 'publish_hyper_file',
+            lambda path, name, mode: calls.append(('publish', path, name)))
+        monkeypatch.setattr(
+            extractor, 'update_datasource_from_hyper_file',
+            lambda **kwargs: calls.append(
+                (kwargs['action'], kwargs['path_to_database'],
+                 kwargs['changeset_table_name'])))
+        paths = []
+        for x in range(3):
+            path = tmp_path / 'chunk_{}.hyper'.format(x)
+            path.write_text('')
+            paths.append(str(path))
+        extractor.publish_hyper_files(iter(paths), 'ds')
+        assert calls == [('publish', paths[0], 'ds'),
+                         ('INSERT', paths[1], 'Extract.hyper'),
+                         ('INSERT', paths[2], 'Extract.hyper')]
+        assert not list(tmp_path.iterdir())
+
 
 class TestRun:
     @requires_base_config
@@ -2627,6 +3896,40 @@ class TestGamesDb:
         assert gamesw.write_steam_events(df) == 0
         assert gamesw.write_steam_events(pd.DataFrame()) == 0
 
+    def test_writer_resolves_games_in_bulk(self, monkeypatch):
+        import sqlalchemy as sqa
+        s = self._session()
+        gdb.upsert_game(s, 'Halo Infinite', registry_slug='halo-infinite')
+        gdb.upsert_game(s, 'Old Name', steam_appid=292030)
+        s.commit()
+        rows = [self._wide_row()]
+        for appid, name in [(1240440, 'halo infinite'), (7, None),
+                            (1240440, 'Halo Infinite')]:
+            row = self._wide_row()
+            row['appid'] = appid
+            row['app_detail_name'] = name
+            rows.append(row)
+        df = pd.DataFrame(rows)
+        statements = []
+        sqa.event.listen(s.get_bind(), 'before_cursor_execute',
+                         lambda *args: statements.append(args[2]))
+        monkeypatch.setattr(gamesw, 'games_db_available',
+                            lambda config='x': True)
+        monkeypatch.setattr(gamesw.gdb, 'GamesDB', lambda config: type(
+            'FakeGamesDB', (), {'get_session': lambda self: s})())
+        assert gamesw.write_steam_events(df) == 3
+        selects = [x for x in statements if x.startswith('SELECT')]
+        assert len(selects) == 3
+        games = {g.canonical_name: g for g in s.query(gmdl.Game)}
+        assert len(games) == 3
+        assert games['The Witcher 3'].steam_appid == 292030
+        assert games['Halo Infinite'].registry_slug == 'halo-infinite'
+        assert games['Halo Infinite'].steam_appid == 1240440
+        assert games['Steam app 7'].primary_genre == 'RPG'
+        assert s.query(gmdl.GameEvent).count() == 3
+        assert gamesw.write_steam_events(df) == 0
+        assert s.query(gmdl.Game).count() == 3
+
     def test_name_fallback_knits_sources_onto_one_row(self):
         s = self._session()
         # Registry seeds first; the Steam writer's name match lands on